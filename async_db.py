@@ -0,0 +1,66 @@
+# async_db.py
+
+# Асинхронная обёртка над db.py для бота.
+# pymongo синхронный, поэтому каждый вызов выполняется в отдельном пуле потоков,
+# а обработчики Telegram лишь ожидают результат и не блокируют цикл событий.
+# Streamlit продолжает использовать синхронный API из db.py.
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+from config import DB_EXECUTOR_WORKERS
+
+_executor = ThreadPoolExecutor(
+    max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="mongo"
+)
+
+
+async def run_in_executor(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _executor, functools.partial(func, *args, **kwargs)
+    )
+
+
+def _to_async(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_in_executor(func, *args, **kwargs)
+
+    return wrapper
+
+
+# Функции для работы с пользователями
+save_user_to_db = _to_async(db.save_user_to_db)
+get_user_by_id = _to_async(db.get_user_by_id)
+get_user_ids_by_status = _to_async(db.get_user_ids_by_status)
+update_user_status = _to_async(db.update_user_status)
+
+# Функции для работы с опросами
+get_survey_template = _to_async(db.get_survey_template)
+get_assigned_survey = _to_async(db.get_assigned_survey)
+complete_assigned_survey = _to_async(db.complete_assigned_survey)
+assign_survey_to_user = _to_async(db.assign_survey_to_user)
+assign_survey_to_users = _to_async(db.assign_survey_to_users)
+get_user_surveys = _to_async(db.get_user_surveys)
+save_responses = _to_async(db.save_responses)
+
+# Функции для работы с расписанием опросов
+claim_due_scheduled_surveys = _to_async(db.claim_due_scheduled_surveys)
+update_scheduled_survey = _to_async(db.update_scheduled_survey)
+
+# Функции для работы с очередью исходящих сообщений
+enqueue_messages = _to_async(db.enqueue_messages)
+claim_outbox_messages = _to_async(db.claim_outbox_messages)
+extend_outbox_lease = _to_async(db.extend_outbox_lease)
+release_outbox_messages = _to_async(db.release_outbox_messages)
+mark_message_sent = _to_async(db.mark_message_sent)
+mark_message_failed = _to_async(db.mark_message_failed)
+acquire_lock = _to_async(db.acquire_lock)
+release_lock = _to_async(db.release_lock)
+
+
+def shutdown(wait=True):
+    _executor.shutdown(wait=wait)
@@ -0,0 +1,136 @@
+# bench_answers.py
+
+# Стоимость одного ответа на вопрос опроса: обращения к async_db и команды
+# MongoDB. Пользователи открывают опрос, после чего счётчики обнуляются и
+# замеряются только ответы. Функции async_db, которые использует bot.py,
+# оборачиваются счётчиком вызовов и времени, команды MongoDB считаются через
+# мониторинг pymongo. Для сравнения те же ответы проходят прежнюю
+# последовательность запросов обработчика: find_one назначения, insert_one
+# ответа, find_one назначения и find_one шаблона для следующего вопроса.
+# Запуск: python -m bench.bench_answers [--users 200]
+
+import argparse
+import asyncio
+import functools
+import inspect
+import time
+from collections import Counter
+
+from bench import common
+from bench.bench_load import QUESTIONS, Users, running_bot, seed_survey_users, setup_bot
+
+
+class CountingAsyncDb:
+    # Подменяет функции async_db в модуле bot счётчиками вызовов
+    def __init__(self, bot):
+        import async_db
+
+        self.calls = Counter()
+        self.seconds = 0.0
+        for name, func in vars(async_db).items():
+            if inspect.iscoroutinefunction(func) and getattr(bot, name, None) is func:
+                setattr(bot, name, self._wrap(name, func))
+
+    def _wrap(self, name, func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.calls[name] += 1
+                self.seconds += time.perf_counter() - started
+
+        return wrapper
+
+    def reset(self):
+        self.calls.clear()
+        self.seconds = 0.0
+
+
+def _previous_handler(db, responses):
+    # Запросы обработчика ответа до снимка сессии
+    common.commands.reset()
+    started = time.perf_counter()
+    for response in responses:
+        db.surveys_collection.find_one({"_id": response["assigned_survey_id"]})
+        db.responses_collection.insert_one(dict(response))
+        assigned_survey = db.surveys_collection.find_one(
+            {"_id": response["assigned_survey_id"]}
+        )
+        db.survey_templates_collection.find_one(
+            {"_id": assigned_survey["survey_template_id"]}
+        )
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стоимость ответа на вопрос опроса")
+    parser.add_argument("--users", type=int, default=200)
+    args = parser.parse_args()
+
+    api, db, bot = setup_bot()
+    counting = CountingAsyncDb(bot)
+    user_ids = list(range(1, args.users + 1))
+    seed_survey_users(db, user_ids)
+    answers = len(user_ids) * len(QUESTIONS)
+
+    async def run():
+        users = Users(api, asyncio.get_running_loop())
+        latencies = []
+        async with running_bot(bot):
+            await asyncio.gather(
+                *(users.open_survey(user_id, latencies) for user_id in user_ids)
+            )
+            counting.reset()
+            common.commands.reset()
+            latencies = []
+            await asyncio.gather(
+                *(users.answer_questions(user_id, latencies) for user_id in user_ids)
+            )
+        # Команды записи ответов сделаны при остановке ResponseIngestor
+        return latencies
+
+    latencies = asyncio.run(run())
+    api.stop()
+    snapshot_commands = dict(common.commands.commands)
+
+    responses = db.get_survey_responses(
+        str(db.survey_templates_collection.find_one()["_id"])
+    )
+    db.responses_collection.delete_many({})
+    db.survey_responses_collection.delete_many({})
+    previous_seconds = _previous_handler(db, responses)
+    previous_commands = dict(common.commands.commands)
+
+    print(f"Пользователей: {args.users}, ответов: {answers}")
+    common.print_table(
+        [
+            {
+                "handler": "до: повторное чтение",
+                "async_db_calls": "-",
+                "mongo_commands": sum(previous_commands.values()) / answers,
+                "db_ms": previous_seconds / answers * 1000,
+                "commands": ", ".join(
+                    f"{name} {count / answers:.2f}"
+                    for name, count in sorted(previous_commands.items())
+                ),
+            },
+            {
+                "handler": "снимок сессии",
+                "async_db_calls": sum(counting.calls.values()) / answers,
+                "mongo_commands": sum(snapshot_commands.values()) / answers,
+                "db_ms": counting.seconds / answers * 1000,
+                "commands": ", ".join(
+                    f"{name} {count / answers:.2f}"
+                    for name, count in sorted(snapshot_commands.items())
+                ),
+            },
+        ]
+    )
+    print("Вызовы async_db за все ответы:", dict(counting.calls))
+    print(f"Задержка ответа бота: {common.summary(latencies)['p50_ms']:.1f} мс (p50)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# bench_export.py
+
+# Выгрузка ответов (export.py) на 5 млн ответов в CSV и Parquet: время,
+# скорость, размер файла и пиковая память, которая не должна зависеть от
+# объёма выгрузки. Затем дописываются новые ответы и замеряется
+# инкрементальная выгрузка, которая должна читать только их.
+# Запуск: python -m bench.bench_export [--responses 5000000]
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+from bench import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Скорость и память выгрузки ответов")
+    parser.add_argument("--responses", type=int, default=5000000)
+    parser.add_argument("--new-responses", type=int, default=10000)
+    parser.add_argument("--storage", choices=["per_question", "per_survey"])
+    parser.add_argument("--batch-size", type=int, default=50000)
+    args = parser.parse_args()
+
+    if args.storage:
+        os.environ["RESPONSES_STORAGE"] = args.storage
+    db = common.connect()
+    import export
+
+    common.seed_responses(db, args.responses, args.storage)
+    directory = tempfile.mkdtemp(prefix="bench-export-")
+
+    def run(file_format, **kwargs):
+        path = os.path.join(directory, f"responses.{file_format}")
+        return path, export.export_responses(
+            path, file_format, batch_size=args.batch_size, **kwargs
+        )
+
+    rows = []
+    for file_format in export.WRITERS:
+        started = time.perf_counter()
+        path, exported = run(file_format)
+        seconds = time.perf_counter() - started
+        rows.append(
+            {
+                "export": file_format,
+                "rows": exported,
+                "seconds": seconds,
+                "rows_per_sec": exported / seconds,
+                "file_mb": os.path.getsize(path) / 2**20,
+                "peak_mb": common.peak_memory(run, file_format) / 2**20,
+            }
+        )
+
+    # Инкрементальная выгрузка: отметка после полной, затем только новые ответы
+    until = datetime.datetime.utcnow() + datetime.timedelta(seconds=1)
+    run("parquet", incremental="bench", until=until)
+    time.sleep(2)
+    common.seed_responses(db, args.new_responses, args.storage)
+    until = datetime.datetime.utcnow() + datetime.timedelta(seconds=1)
+    started = time.perf_counter()
+    path, exported = run("parquet", incremental="bench", until=until)
+    seconds = time.perf_counter() - started
+    rows.append(
+        {
+            "export": "parquet --incremental",
+            "rows": exported,
+            "seconds": seconds,
+            "rows_per_sec": exported / seconds,
+            "file_mb": os.path.getsize(path) / 2**20,
+            "peak_mb": "-",
+        }
+    )
+    print(f"Ответов: {args.responses}, новых: {args.new_responses}")
+    common.print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
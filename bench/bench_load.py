@@ -0,0 +1,205 @@
+# bench_load.py
+
+# Нагрузочный тест бота: N пользователей одновременно проходят опрос.
+# Бот из bot.py работает с поддельным сервером Bot API (fake_bot_api.py) и
+# настоящей MongoDB. Каждый пользователь, как живой, отправляет следующее
+# обновление только после ответа бота на предыдущее: /start, кнопка опроса,
+# ответы на все вопросы. В режиме blocking вызовы MongoDB выполняются прямо в
+# цикле событий, как до появления async_db, — для сравнения.
+# Запуск: python -m bench.bench_load [--users 200] [--mode executor blocking]
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import logging
+import os
+import random
+import tempfile
+import time
+
+from bench import common
+from bench.fake_bot_api import FakeBotApi, callback_update, message_update
+
+QUESTIONS = [
+    {"text": "Насколько вы довольны сервисом?", "type": "csi"},
+    {"text": "Насколько удобно приложение?", "type": "csi"},
+    {"text": "Оцените скорость ответа поддержки", "type": "csi"},
+    {"text": "Что нам улучшить?", "type": "open"},
+]
+
+
+def seed_survey_users(db, user_ids):
+    db.create_survey_template({"title": "Нагрузочный опрос", "questions": QUESTIONS})
+    template_id = db.survey_templates_collection.find_one(
+        {"title": "Нагрузочный опрос"}
+    )["_id"]
+    db.users_collection.insert_many(
+        [
+            {
+                "user_id": user_id,
+                "first_name": "Имя",
+                "last_name": "Фамилия",
+                "role": "user",
+                "status": "default",
+            }
+            for user_id in user_ids
+        ]
+    )
+    db.assign_survey_to_users(user_ids, template_id)
+
+
+def setup_bot():
+    # Поддельный Bot API, пустая база и бот из bot.py, настроенный на них
+    api = FakeBotApi().start()
+    os.environ["TELEGRAM_BASE_URL"] = api.base_url
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:bench")
+    os.environ["RESPONSE_SPOOL_DIR"] = tempfile.mkdtemp(prefix="bench-spool-")
+    db = common.connect()
+    # Импорт после настройки окружения: bot.py создаёт Application при импорте
+    import bot
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("bot").setLevel(logging.WARNING)
+    return api, db, bot
+
+
+@contextlib.asynccontextmanager
+async def running_bot(bot):
+    # Бот получает обновления через getUpdates; при выходе ResponseIngestor
+    # дописывает накопленные ответы в MongoDB
+    application = bot.application
+    async with application:
+        await application.start()
+        await application.updater.start_polling(poll_interval=0, timeout=1)
+        await bot.start_background_services(application)
+        try:
+            yield application
+        finally:
+            await application.updater.stop()
+            await application.stop()
+            await bot.stop_broadcaster(application)
+            await bot.stop_response_ingestor(application)
+
+
+async def _blocking_call(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+class Users:
+    # Ответы бота из потока сервера передаются ожидающим пользователям
+    def __init__(self, api, loop):
+        self.api = api
+        self.update_ids = itertools.count(1)
+        self.replies = {}
+        api.on_reply = lambda chat_id, method, params: loop.call_soon_threadsafe(
+            self._reply, chat_id, params
+        )
+
+    def _reply(self, chat_id, params):
+        self.replies.setdefault(chat_id, asyncio.Queue()).put_nowait(params)
+
+    async def send(self, user_id, update, latencies):
+        started = time.monotonic()
+        self.api.push_updates([update])
+        params = await self.replies.setdefault(user_id, asyncio.Queue()).get()
+        latencies.append(time.monotonic() - started)
+        return params
+
+    async def open_survey(self, user_id, latencies):
+        # /start и кнопка первого назначенного опроса
+        reply = await self.send(
+            user_id, message_update(next(self.update_ids), user_id, "/start"), latencies
+        )
+        buttons = [
+            button["callback_data"]
+            for row in reply["reply_markup"]["inline_keyboard"]
+            for button in row
+            if button["callback_data"].startswith("start_survey_")
+        ]
+        update = callback_update(next(self.update_ids), user_id, buttons[0])
+        await self.send(user_id, update, latencies)
+
+    async def answer_questions(self, user_id, latencies):
+        for step, question in enumerate(QUESTIONS):
+            if question["type"] == "csi":
+                data = f"csi_answer_{step}_{random.randint(1, 5)}"
+                update = callback_update(next(self.update_ids), user_id, data)
+            else:
+                update = message_update(next(self.update_ids), user_id, "Всё хорошо")
+            reply = await self.send(user_id, update, latencies)
+        if not reply["text"].startswith("Опрос завершён"):
+            raise RuntimeError(f"Пользователь {user_id}: {reply['text']}")
+
+    async def take_survey(self, user_id, latencies):
+        await self.open_survey(user_id, latencies)
+        await self.answer_questions(user_id, latencies)
+
+
+async def _run_mode(db, users, mode, user_ids):
+    import async_db
+
+    seed_survey_users(db, user_ids)
+    latencies = []
+    common.commands.reset()
+    executor_call = async_db.run_in_executor
+    if mode == "blocking":
+        async_db.run_in_executor = _blocking_call
+    try:
+        started = time.monotonic()
+        await asyncio.gather(
+            *(users.take_survey(user_id, latencies) for user_id in user_ids)
+        )
+        elapsed = time.monotonic() - started
+    finally:
+        async_db.run_in_executor = executor_call
+    return {
+        "mode": mode,
+        "users": len(user_ids),
+        "updates": len(latencies),
+        "seconds": elapsed,
+        "updates_per_sec": len(latencies) / elapsed,
+        **{
+            key: value for key, value in common.summary(latencies).items() if key != "n"
+        },
+        "db_commands": common.commands.total(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота SurveyBot")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument(
+        "--mode",
+        nargs="+",
+        choices=["executor", "blocking"],
+        default=["executor", "blocking"],
+    )
+    args = parser.parse_args()
+
+    api, db, bot = setup_bot()
+
+    async def run_modes():
+        users = Users(api, asyncio.get_running_loop())
+        rows = []
+        async with running_bot(bot):
+            for index, mode in enumerate(args.mode):
+                # У каждого режима свои пользователи
+                first = index * args.users + 1
+                user_ids = list(range(first, first + args.users))
+                rows.append(await _run_mode(db, users, mode, user_ids))
+        return rows
+
+    rows = asyncio.run(run_modes())
+    api.stop()
+    # Ответы записаны пачками при остановке ResponseIngestor
+    saved = sum(1 for _ in db.iter_survey_responses(None, None, None))
+    print(f"Пользователей: {args.users}, вопросов в опросе: {len(QUESTIONS)}")
+    common.print_table(rows)
+    print(
+        f"Сохранено ответов: {saved} из {len(args.mode) * args.users * len(QUESTIONS)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# bench_persistence.py
+
+# Накладные расходы MongoPersistence на одно обновление.
+# Обновления пользователей обрабатываются так же, как в Application: перед
+# обработчиком refresh_user_data, после — пометка изменённых данных, а раз в
+# update_interval — update_user_data для изменённых пользователей и запись
+# одним bulk_write. Для сравнения тот же поток обновлений прогоняется без
+# хранения состояния.
+# Запуск: python -m bench.bench_persistence [--users 1000] [--updates 20000]
+
+import argparse
+import asyncio
+import random
+import time
+
+from bench import common
+
+
+async def _run(persistence, users, updates, concurrency, update_interval):
+    user_data = {user_id: {} for user_id in range(users)}
+    if persistence is not None:
+        user_data.update(await persistence.get_user_data())
+    changed = set()
+    results = {}
+    queue = asyncio.Queue()
+    for _ in range(updates):
+        queue.put_nowait(random.randrange(users))
+
+    async def handle():
+        while not queue.empty():
+            user_id = queue.get_nowait()
+            data = user_data[user_id]
+            if persistence is not None:
+                with common.timer(results, "refresh"):
+                    await persistence.refresh_user_data(user_id, data)
+            # Обработчик: шаг диалога и ответ на вопрос
+            data["step"] = data.get("step", 0) + 1
+            data.setdefault("answers", []).append(random.randint(1, 10))
+            changed.add(user_id)
+            await asyncio.sleep(0)
+
+    async def save():
+        while True:
+            await asyncio.sleep(update_interval)
+            batch = list(changed)
+            changed.clear()
+            with common.timer(results, "flush"):
+                for user_id in batch:
+                    await persistence.update_user_data(user_id, user_data[user_id])
+                await persistence.flush()
+
+    saver = None
+    if persistence is not None:
+        saver = asyncio.create_task(save())
+    started = time.perf_counter()
+    await asyncio.gather(*(handle() for _ in range(concurrency)))
+    if saver is not None:
+        saver.cancel()
+        for user_id in changed:
+            await persistence.update_user_data(user_id, user_data[user_id])
+        with common.timer(results, "flush"):
+            await persistence.flush()
+    return time.perf_counter() - started, results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Накладные расходы MongoPersistence на обновление"
+    )
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--update-interval", type=float, default=5)
+    args = parser.parse_args()
+
+    db = common.connect()
+    from persistence import MongoPersistence
+
+    baseline, _ = asyncio.run(
+        _run(None, args.users, args.updates, args.concurrency, args.update_interval)
+    )
+    persistence = MongoPersistence(
+        db.persistence_collection, update_interval=args.update_interval
+    )
+    common.commands.reset()
+    elapsed, results = asyncio.run(
+        _run(
+            persistence,
+            args.users,
+            args.updates,
+            args.concurrency,
+            args.update_interval,
+        )
+    )
+    commands = common.commands.total()
+
+    print(
+        f"Обновлений: {args.updates}, пользователей: {args.users}, "
+        f"одновременно: {args.concurrency}"
+    )
+    print(
+        f"Без хранения: {baseline:.2f} сек., с MongoPersistence: {elapsed:.2f} сек.; "
+        f"накладные расходы {(elapsed - baseline) / args.updates * 1000:.3f} мс "
+        f"и {commands / args.updates:.2f} запроса к MongoDB на обновление"
+    )
+    common.print_table(
+        [{"step": name, **common.summary(seconds)} for name, seconds in results.items()]
+    )
+
+
+if __name__ == "__main__":
+    main()
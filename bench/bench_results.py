@@ -0,0 +1,100 @@
+# bench_results.py
+
+# Просмотр результатов опроса в панели администратора: прежний путь через
+# pandas (все ответы, включая открытые, загружаются в DataFrame) против
+# агрегации на стороне MongoDB (get_csi_results) и готовых агрегатов csi_stats
+# (get_csi_stats). Для каждого пути замеряются время до данных первой
+# отрисовки (таблица CSI и гистограмма) и пиковая память процесса.
+# Запуск: python -m bench.bench_results [--responses 1000000]
+
+import argparse
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from bench import common
+
+
+def pandas_results(db, survey_id, storage):
+    # Как было в streamlit_app.py до агрегации в MongoDB
+    df_responses = pd.DataFrame(db.get_survey_responses(survey_id, storage=storage))
+    csi_responses = df_responses[df_responses["type"] == "csi"].copy()
+    csi_responses["answer"] = csi_responses["answer"].astype(int)
+    stats_df = csi_responses.groupby("question")["answer"].agg(["mean", "std", "count"])
+    histogram = csi_responses["answer"].value_counts().to_dict()
+    return stats_df, histogram
+
+
+def aggregation_results(db, survey_id, storage):
+    csi_results = db.get_csi_results(survey_id, storage=storage)
+    stats_df = pd.DataFrame(
+        csi_results["questions"], columns=["question", "mean", "std", "count"]
+    ).set_index("question")
+    return stats_df, csi_results["histogram"]
+
+
+def csi_stats_results(db, survey_id, storage):
+    # Как в streamlit_app.py: среднее и выборочное отклонение из sum и sum_sq
+    csi_stats = db.get_csi_stats(survey_id)
+    stats_df = pd.DataFrame(csi_stats).set_index("question")
+    stats_df["mean"] = stats_df["sum"] / stats_df["count"]
+    variance = (stats_df["sum_sq"] - stats_df["sum"] ** 2 / stats_df["count"]) / (
+        stats_df["count"] - 1
+    )
+    stats_df["std"] = np.sqrt(variance.clip(lower=0))
+    histogram = Counter()
+    for stats in csi_stats:
+        histogram.update({int(answer): n for answer, n in stats["hist"].items()})
+    return stats_df[["mean", "std", "count"]], histogram
+
+
+PATHS = {
+    "pandas": pandas_results,
+    "get_csi_results": aggregation_results,
+    "get_csi_stats": csi_stats_results,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Время и память просмотра результатов опроса"
+    )
+    parser.add_argument("--responses", type=int, default=1000000)
+    parser.add_argument("--storage", choices=["per_question", "per_survey"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    db = common.connect()
+    survey_id = str(common.seed_responses(db, args.responses, args.storage))
+
+    rows = []
+    expected = None
+    for name, results in PATHS.items():
+        seconds = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            stats_df, histogram = results(db, survey_id, args.storage)
+            seconds.append(time.perf_counter() - started)
+        # Все пути должны показывать одно и то же
+        counts = stats_df["count"].sort_index().tolist()
+        if expected is None:
+            expected = counts
+        elif counts != expected:
+            raise RuntimeError(f"{name}: число ответов {counts}, ожидалось {expected}")
+        rows.append(
+            {
+                "path": name,
+                "first_render_ms": min(seconds) * 1000,
+                "peak_mb": common.peak_memory(results, db, survey_id, args.storage)
+                / 2**20,
+                "csi_answers": sum(counts),
+            }
+        )
+    print(f"Ответов: {args.responses}")
+    common.print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
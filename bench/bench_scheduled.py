@@ -0,0 +1,133 @@
+# bench_scheduled.py
+
+# Таблица "Запланированные опросы" в панели администратора на 10 тыс.
+# расписаний: прежний путь (все расписания в DataFrame, название опроса и имя
+# пользователя запрашиваются через apply для каждой строки) против текущего
+# (count_scheduled_surveys и страница get_scheduled_surveys_page с пакетной
+# загрузкой названий и имён). Для каждого пути замеряются время до готового
+# DataFrame таблицы и число запросов к MongoDB. Страница замеряется первая и
+# последняя: на последней MongoDB пропускает все предыдущие строки.
+# Запуск: python -m bench.bench_scheduled [--schedules 10000]
+
+import argparse
+import datetime
+import time
+
+import pandas as pd
+
+from bench import common
+
+COLUMNS = ["user", "survey_title", "schedule"]
+
+
+def previous_table(db):
+    # Как было в streamlit_app.py до пагинации: по два find_one на строку
+    def survey_title(survey_id):
+        survey = db.survey_templates_collection.find_one({"_id": survey_id})
+        return survey.get("title", "Без названия") if survey else None
+
+    scheduled_df = pd.DataFrame(list(db.scheduled_surveys_collection.find()))
+    scheduled_df["survey_title"] = scheduled_df["survey_template_id"].apply(
+        survey_title
+    )
+    scheduled_df["user"] = scheduled_df["user_id"].apply(db.get_user_full_name)
+    return scheduled_df[COLUMNS]
+
+
+def page_table(db, page, page_size):
+    # Как в streamlit_app.py: число расписаний для навигации и одна страница
+    scheduled_count = db.count_scheduled_surveys()
+    if page < 0:
+        page += -(-scheduled_count // page_size)
+    scheduled_df = pd.DataFrame(db.get_scheduled_surveys_page(page, page_size))
+    return scheduled_df[COLUMNS]
+
+
+def _seed(db, schedules, templates):
+    import recurrence
+
+    db.users_collection.insert_many(
+        [
+            {
+                "user_id": user_id,
+                "first_name": f"Имя{user_id}",
+                "last_name": "Фамилия",
+                "role": "user",
+                "status": "default",
+            }
+            for user_id in range(1, schedules + 1)
+        ]
+    )
+    db.survey_templates_collection.insert_many(
+        [
+            {
+                "title": f"Опрос {index}",
+                "questions": common.SURVEY_QUESTIONS,
+                "version": 1,
+                "created_at": datetime.datetime.utcnow(),
+            }
+            for index in range(templates)
+        ]
+    )
+    template_ids = [
+        template["_id"]
+        for template in db.survey_templates_collection.find({}, {"_id": 1})
+    ]
+    schedule_data = {
+        "frequency": recurrence.DAILY,
+        "start_date": datetime.datetime.utcnow() + datetime.timedelta(days=1),
+        "timezone": "UTC",
+        "catch_up": recurrence.COALESCE,
+    }
+    # Пользователи поровну распределены между опросами
+    for index, template_id in enumerate(template_ids):
+        user_ids = range(index + 1, schedules + 1, templates)
+        db.schedule_survey_for_users(user_ids, template_id, schedule_data)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Отрисовка таблицы запланированных опросов"
+    )
+    parser.add_argument("--schedules", type=int, default=10000)
+    parser.add_argument("--templates", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    db = common.connect()
+    _seed(db, args.schedules, args.templates)
+
+    variants = {
+        "previous": lambda: previous_table(db),
+        "first_page": lambda: page_table(db, 0, args.page_size),
+        "last_page": lambda: page_table(db, -1, args.page_size),
+    }
+    rows = []
+    for name, render in variants.items():
+        seconds = []
+        commands = 0
+        for _ in range(args.repeat):
+            # Кэш шаблонов пуст, как при первой отрисовке после запуска панели
+            db.template_cache.invalidate()
+            common.commands.reset()
+            started = time.perf_counter()
+            table = render()
+            seconds.append(time.perf_counter() - started)
+            commands += common.commands.total()
+        if table["survey_title"].isna().any():
+            raise RuntimeError(f"{name}: не найдены названия опросов")
+        rows.append(
+            {
+                "path": name,
+                "rows": len(table),
+                "round_trips": commands / args.repeat,
+                **{k: v for k, v in common.summary(seconds).items() if k != "n"},
+            }
+        )
+    print(f"Расписаний: {args.schedules}, опросов: {args.templates}")
+    common.print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# bench_updates.py
+
+# Пропускная способность бота при получении обновлений через getUpdates
+# (polling) и через webhook.
+# Бот из bot.py работает с поддельным сервером Bot API (fake_bot_api.py) и
+# настоящей MongoDB. Зарегистрированные пользователи с назначенным опросом
+# присылают /start; замеряется время от отправки обновлений до ответа бота на
+# каждое из них. В режиме webhook обновления отправляются на локальный
+# HTTP-сервер бота с числом одновременных соединений, как у Telegram.
+# Запуск: python -m bench.bench_updates [--users 500] [--updates 5000]
+# [--mode polling webhook]
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+
+import httpx
+
+from bench import common
+from bench.fake_bot_api import FakeBotApi, message_update
+
+WEBHOOK_SECRET = "bench-secret-token"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _seed(db, users):
+    db.create_survey_template(
+        {"title": "Опрос", "questions": [{"text": "Оценка", "type": "csi"}]}
+    )
+    template_id = db.survey_templates_collection.find_one()["_id"]
+    db.users_collection.insert_many(
+        [
+            {
+                "user_id": user_id,
+                "first_name": "Имя",
+                "last_name": "Фамилия",
+                "role": "user",
+                "status": "default",
+            }
+            for user_id in range(1, users + 1)
+        ]
+    )
+    db.assign_survey_to_users(list(range(1, users + 1)), template_id)
+
+
+def _latencies(api, sent):
+    # Обновления одного пользователя обрабатываются по очереди, поэтому
+    # n-й ответ в чат относится к n-му отправленному в него обновлению
+    latencies = []
+    for chat_id, times in sent.items():
+        replies = api.replies[chat_id]
+        latencies.extend(reply[0] - started for reply, started in zip(replies, times))
+    return latencies
+
+
+async def _wait_replies(api, count, timeout):
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(None, api.wait_replies, count, timeout):
+        raise RuntimeError(f"Бот ответил на {api.reply_count} из {count} обновлений")
+
+
+async def _polling(application, api, updates, timeout):
+    await application.updater.start_polling(poll_interval=0, timeout=1)
+    sent = {}
+    started = time.monotonic()
+    for update in updates:
+        sent.setdefault(update["message"]["chat"]["id"], []).append(started)
+    api.push_updates(updates)
+    await _wait_replies(api, len(updates), timeout)
+    return time.monotonic() - started, sent
+
+
+async def _webhook(application, api, updates, timeout, connections):
+    port = _free_port()
+    await application.updater.start_webhook(
+        listen="127.0.0.1",
+        port=port,
+        url_path="telegram",
+        webhook_url=f"http://127.0.0.1:{port}/telegram",
+        secret_token=WEBHOOK_SECRET,
+        max_connections=connections,
+    )
+    sent = {}
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+
+    # Как и Telegram, каждое соединение отправляет следующее обновление после
+    # ответа на предыдущее
+    async def connection(client):
+        while not queue.empty():
+            update = queue.get_nowait()
+            sent.setdefault(update["message"]["chat"]["id"], []).append(
+                time.monotonic()
+            )
+            response = await client.post(
+                f"http://127.0.0.1:{port}/telegram",
+                json=update,
+                headers={"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET},
+            )
+            response.raise_for_status()
+
+    started = time.monotonic()
+    limits = httpx.Limits(max_connections=connections)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        await asyncio.gather(*(connection(client) for _ in range(connections)))
+    await _wait_replies(api, len(updates), timeout)
+    return time.monotonic() - started, sent
+
+
+async def _run(application, api, mode, updates, args):
+    api.reset()
+    common.commands.reset()
+    async with application:
+        await application.start()
+        try:
+            if mode == "polling":
+                elapsed, sent = await _polling(application, api, updates, args.timeout)
+            else:
+                elapsed, sent = await _webhook(
+                    application, api, updates, args.timeout, args.connections
+                )
+        finally:
+            await application.updater.stop()
+            await application.stop()
+    return {
+        "mode": mode,
+        "updates": len(updates),
+        "seconds": elapsed,
+        "updates_per_sec": len(updates) / elapsed,
+        **{
+            key: value
+            for key, value in common.summary(_latencies(api, sent)).items()
+            if key != "n"
+        },
+        "get_updates": api.calls["getUpdates"],
+        "db_commands": common.commands.total(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Пропускная способность бота: polling и webhook"
+    )
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument(
+        "--mode",
+        nargs="+",
+        choices=["polling", "webhook"],
+        default=["polling", "webhook"],
+    )
+    parser.add_argument(
+        "--connections", type=int, default=40, help="соединений webhook от Telegram"
+    )
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    api = FakeBotApi().start()
+    os.environ["TELEGRAM_BASE_URL"] = api.base_url
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:bench")
+    db = common.connect()
+    _seed(db, args.users)
+    # Импорт после настройки окружения: bot.py создаёт Application при импорте
+    from bot import application
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    # Application привязан к циклу событий, поэтому все режимы — в одном цикле
+    async def run_modes():
+        rows = []
+        for mode in args.mode:
+            updates = [
+                message_update(update_id, random.randint(1, args.users), "/start")
+                for update_id in range(1, args.updates + 1)
+            ]
+            rows.append(await _run(application, api, mode, updates, args))
+        return rows
+
+    rows = asyncio.run(run_modes())
+    api.stop()
+    print(f"Пользователей: {args.users}, обновлений: {args.updates}")
+    common.print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
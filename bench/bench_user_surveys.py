@@ -0,0 +1,109 @@
+# bench_user_surveys.py
+
+# get_user_surveys в зависимости от числа назначенных пользователю опросов:
+# прежний вариант (find_one шаблона на каждое назначение) против текущего
+# (один запрос назначений и один $in за шаблонами, которые есть в кэше
+# шаблонов). Текущий вариант замеряется с пустым кэшем шаблонов и с
+# заполненным, как в работающем боте.
+# Запуск: python -m bench.bench_user_surveys [--assignments 1 5 20 100]
+
+import argparse
+import datetime
+import time
+
+from bench import common
+
+
+def previous_get_user_surveys(db, user_id):
+    # Как было до пакетной загрузки шаблонов
+    assigned_surveys = db.surveys_collection.find(
+        {"user_id": user_id, "completed": False}
+    )
+    surveys = []
+    for assigned_survey in assigned_surveys:
+        survey_template = db.survey_templates_collection.find_one(
+            {"_id": assigned_survey["survey_template_id"]}
+        )
+        if survey_template:
+            surveys.append(
+                {
+                    "assigned_survey_id": str(assigned_survey["_id"]),
+                    "title": survey_template.get("title", "Без названия"),
+                    "questions": survey_template.get("questions", []),
+                }
+            )
+    return surveys
+
+
+def _seed(db, user_id, assignments):
+    db.survey_templates_collection.insert_many(
+        [
+            {
+                "title": f"Опрос {index}",
+                "questions": common.SURVEY_QUESTIONS,
+                "version": 1,
+                "created_at": datetime.datetime.utcnow(),
+            }
+            for index in range(assignments)
+        ]
+    )
+    template_ids = [
+        template["_id"]
+        for template in db.survey_templates_collection.find(
+            {}, {"_id": 1}, sort=[("_id", -1)], limit=assignments
+        )
+    ]
+    for template_id in template_ids:
+        db.assign_survey_to_user(user_id, template_id)
+
+
+def _measure(get_surveys, user_id, assignments, repeat, before=None):
+    seconds = []
+    commands = 0
+    for _ in range(repeat):
+        if before:
+            before()
+        common.commands.reset()
+        started = time.perf_counter()
+        surveys = get_surveys(user_id)
+        seconds.append(time.perf_counter() - started)
+        commands += common.commands.total()
+        if len(surveys) != assignments:
+            raise RuntimeError(f"Найдено опросов {len(surveys)} из {assignments}")
+    return {
+        "round_trips": commands / repeat,
+        **{k: v for k, v in common.summary(seconds).items() if k != "n"},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="get_user_surveys и число назначенных опросов"
+    )
+    parser.add_argument("--assignments", type=int, nargs="+", default=[1, 5, 20, 100])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    db = common.connect()
+    rows = []
+    # У каждого числа назначений свой пользователь
+    for user_id, assignments in enumerate(args.assignments, start=1):
+        _seed(db, user_id, assignments)
+        variants = {
+            "previous": (lambda u: previous_get_user_surveys(db, u), None),
+            "cold_cache": (db.get_user_surveys, db.template_cache.invalidate),
+            "warm_cache": (db.get_user_surveys, None),
+        }
+        for name, (get_surveys, before) in variants.items():
+            rows.append(
+                {
+                    "assignments": assignments,
+                    "variant": name,
+                    **_measure(get_surveys, user_id, assignments, args.repeat, before),
+                }
+            )
+    common.print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# common.py
+
+# Общее для бенчмарков.
+# Бенчмарки работают с mongod, заданным теми же переменными окружения, что и
+# бот, но всегда в отдельной базе BENCH_MONGODB_DB_NAME (по умолчанию
+# tgbot_bench), которую сами заполняют и очищают. Модуль нужно импортировать
+# до config и db. Число обращений к серверу считается через мониторинг команд
+# pymongo, поэтому учитываются и запросы, сделанные внутри db.py.
+
+import datetime
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import monitoring
+
+load_dotenv()
+os.environ["MONGODB_DB_NAME"] = os.getenv("BENCH_MONGODB_DB_NAME", "tgbot_bench")
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.commands = Counter()
+
+    def started(self, event):
+        with self._lock:
+            self.commands[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def reset(self):
+        with self._lock:
+            self.commands = Counter()
+
+    def total(self):
+        with self._lock:
+            return sum(self.commands.values())
+
+
+# Слушатель регистрируется до создания клиента в db.py
+commands = CommandCounter()
+monitoring.register(commands)
+
+
+def connect():
+    # Пустая база с индексами приложения; без mongod бенчмарк завершается
+    try:
+        import db
+    except RuntimeError:
+        sys.exit("Бенчмарку нужен запущенный mongod (параметры подключения из .env)")
+    import migrations
+
+    for name in db.db.list_collection_names():
+        db.db.drop_collection(name)
+    db.template_cache.invalidate()
+    migrations.ensure_indexes()
+    return db
+
+
+# Опрос для бенчмарков с ответами: пять CSI-вопросов и один открытый
+SURVEY_QUESTIONS = [
+    {"text": f"CSI вопрос {index}", "type": "csi"} for index in range(1, 6)
+] + [{"text": "Что нам улучшить?", "type": "open"}]
+
+OPEN_ANSWERS = [
+    "Всё отлично, спасибо",
+    "Хотелось бы быстрее получать ответы поддержки",
+    "Неудобное мобильное приложение, часто зависает",
+    "Цены выросли, а качество осталось прежним",
+    "Нравится персонал, но очереди слишком длинные",
+]
+
+
+def seed_responses(db, count, storage=None, users=100000, batch_size=10000):
+    # count ответов на SURVEY_QUESTIONS через db.save_responses, как их пишет
+    # бот; возвращает _id шаблона опроса
+    db.create_survey_template(
+        {
+            "title": f"Опрос на {count} ответов",
+            "questions": SURVEY_QUESTIONS,
+            "created_at": datetime.datetime.utcnow(),
+        }
+    )
+    template_id = db.survey_templates_collection.find_one(sort=[("_id", -1)])["_id"]
+    rng = random.Random(count)
+    started = time.monotonic()
+    batch = []
+    for number in range(count):
+        index = number % len(SURVEY_QUESTIONS)
+        if index == 0:
+            assigned_survey_id, user_id = ObjectId(), rng.randint(1, users)
+        question = SURVEY_QUESTIONS[index]
+        batch.append(
+            {
+                "user_id": user_id,
+                "assigned_survey_id": assigned_survey_id,
+                "survey_template_id": template_id,
+                "question_index": index,
+                "question": question["text"],
+                "answer": (
+                    rng.randint(1, 5)
+                    if question["type"] == "csi"
+                    else rng.choice(OPEN_ANSWERS)
+                ),
+                "type": question["type"],
+            }
+        )
+        if len(batch) >= batch_size:
+            db.save_responses(batch, storage)
+            batch = []
+    if batch:
+        db.save_responses(batch, storage)
+    print(f"Записано ответов: {count} за {time.monotonic() - started:.1f} сек.")
+    return template_id
+
+
+def peak_memory(func, *args):
+    # Пиковый объём памяти Python-объектов за вызов, байт. Трассировка
+    # замедляет выделение памяти, поэтому время замеряется отдельным вызовом.
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@contextmanager
+def timer(results, name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        results.setdefault(name, []).append(time.perf_counter() - started)
+
+
+def summary(seconds):
+    # Среднее и перцентили в миллисекундах
+    ordered = sorted(seconds)
+    return {
+        "n": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+    }
+
+
+def print_table(rows):
+    if not rows:
+        return
+    columns = list(rows[0])
+    cells = [
+        [
+            f"{row[column]:.2f}" if isinstance(row[column], float) else str(row[column])
+            for column in columns
+        ]
+        for row in rows
+    ]
+    widths = [
+        max(len(column), *(len(line[i]) for line in cells))
+        for i, column in enumerate(columns)
+    ]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for line in cells:
+        print("  ".join(cell.ljust(width) for cell, width in zip(line, widths)))
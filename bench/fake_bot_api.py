@@ -0,0 +1,171 @@
+# fake_bot_api.py
+
+# Поддельный сервер Bot API для бенчмарков бота.
+# Отдаёт обновления через getUpdates, принимает вызовы бота и запоминает время
+# каждого ответа в чат. Бот направляется на него через TELEGRAM_BASE_URL, так
+# что в замер попадает вся обработка обновления, кроме сети до Telegram.
+
+import collections
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+# Вызовы, которые считаются ответом бота пользователю
+REPLY_METHODS = {"sendMessage", "editMessageText"}
+
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"Пользователь {user_id}"}
+
+
+def _chat(user_id):
+    return {"id": user_id, "type": "private"}
+
+
+def message_update(update_id, user_id, text):
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": _chat(user_id),
+        "from": _user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        command = text.split()[0]
+        message["entities"] = [
+            {"type": "bot_command", "offset": 0, "length": len(command)}
+        ]
+    return {"update_id": update_id, "message": message}
+
+
+def callback_update(update_id, user_id, data):
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": _chat(user_id),
+                "text": "",
+            },
+        },
+    }
+
+
+def _value(value):
+    # Bot API принимает параметры формы, сложные значения закодированы в JSON
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+class FakeBotApi:
+    def __init__(self, host="127.0.0.1", port=0):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                method = self.path.rsplit("/", 1)[-1]
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    params = json.loads(body or b"{}")
+                else:
+                    params = {k: _value(v) for k, v in parse_qsl(body.decode())}
+                payload = json.dumps({"ok": True, "result": api.call(method, params)})
+                data = payload.encode()
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Бот при остановке обрывает незавершённый getUpdates
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://{host}:{self.server.server_port}/bot"
+        self.calls = collections.Counter()
+        # chat_id -> [(время ответа, метод, параметры)]
+        self.replies = collections.defaultdict(list)
+        self.reply_count = 0
+        # on_reply(chat_id, method, params) вызывается из потока сервера
+        self.on_reply = None
+        self._updates = []
+        self._condition = threading.Condition()
+        self._message_ids = itertools.count(1)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def push_updates(self, updates):
+        with self._condition:
+            self._updates.extend(updates)
+            self._condition.notify_all()
+
+    def wait_replies(self, count, timeout):
+        with self._condition:
+            return self._condition.wait_for(lambda: self.reply_count >= count, timeout)
+
+    def reset(self):
+        with self._condition:
+            self.calls.clear()
+            self.replies.clear()
+            self.reply_count = 0
+            self._updates = []
+
+    def _get_updates(self, params):
+        # Длинный опрос, как у Telegram: ждём новых обновлений до timeout
+        offset = params.get("offset") or 0
+        limit = params.get("limit") or 100
+        with self._condition:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            self._condition.wait_for(
+                lambda: self._updates, float(params.get("timeout") or 0)
+            )
+            return self._updates[:limit]
+
+    def call(self, method, params):
+        self.calls[method] += 1
+        if method == "getUpdates":
+            return self._get_updates(params)
+        if method == "getMe":
+            return {
+                "id": 1,
+                "is_bot": True,
+                "first_name": "SurveyBot",
+                "username": "survey_bench_bot",
+            }
+        if method in REPLY_METHODS:
+            chat_id = int(params["chat_id"])
+            with self._condition:
+                self.replies[chat_id].append((time.monotonic(), method, params))
+                self.reply_count += 1
+                self._condition.notify_all()
+            if self.on_reply is not None:
+                self.on_reply(chat_id, method, params)
+            return {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": _chat(chat_id),
+                "text": params.get("text", ""),
+            }
+        # setWebhook, deleteWebhook, answerCallbackQuery и прочие
+        return True
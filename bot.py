@@ -1,12 +1,13 @@
 # bot.py
 
+import asyncio
 import datetime
 import logging
+import re
+import time
 from io import BytesIO, StringIO
 
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from bson import ObjectId
-from pymongo import MongoClient
 from telegram import (
     InlineKeyboardButton,
     InlineKeyboardMarkup,
@@ -20,18 +21,49 @@ from telegram.ext import (
     filters,
 )
 
-from config import MONGODB_DB_NAME, MONGODB_URI, SUPER_USER_ID, TELEGRAM_BOT_TOKEN
-from db import (
-    assign_survey_to_user,
-    get_scheduled_surveys,
+import recurrence
+from async_db import (
+    assign_survey_to_users,
+    claim_due_scheduled_surveys,
+    complete_assigned_survey,
+    enqueue_messages,
+    get_assigned_survey,
+    get_survey_template,
     get_user_by_id,
+    get_user_ids_by_status,
     get_user_surveys,
-    save_response,
     save_user_to_db,
-    survey_templates_collection,
-    surveys_collection,
     update_scheduled_survey,
 )
+from broadcast import Broadcaster
+from config import (
+    BOT_MODE,
+    CONCURRENT_UPDATES,
+    PERSISTENCE_UPDATE_INTERVAL,
+    RESPONSE_BATCH_SIZE,
+    RESPONSE_FLUSH_INTERVAL,
+    RESPONSE_MAX_ATTEMPTS,
+    RESPONSE_SPOOL_DIR,
+    SCHEDULER_BATCH_SIZE,
+    SCHEDULER_CONCURRENCY,
+    SCHEDULER_INTERVAL_SECONDS,
+    SCHEDULER_LEASE_SECONDS,
+    SCHEDULER_MISFIRE_GRACE_SECONDS,
+    SUPER_USER_ID,
+    TELEGRAM_BASE_URL,
+    TELEGRAM_BOT_TOKEN,
+    WEBHOOK_LISTEN,
+    WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET_TOKEN,
+    WEBHOOK_URL,
+)
+from db import get_template_cache_stats, persistence_collection
+from ingest import ResponseIngestor
+from migrations import ensure_indexes, run_migrations
+from persistence import MongoPersistence
+from update_processor import PerUserUpdateProcessor
 
 # Логирование
 logging.basicConfig(
@@ -39,14 +71,55 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+# Рассылка из очереди outbox и пакетная запись ответов запускаются вместе
+# с приложением
+async def start_background_services(application) -> None:
+    await response_ingestor.start()
+    await broadcaster.start()
+
+
+# Рассылка останавливается в post_stop, пока HTTP-клиент бота ещё открыт:
+# после Application.shutdown() send_message падает с RuntimeError, и
+# захваченные сообщения висели бы до конца аренды. Ответы дописываются в
+# post_shutdown, когда обновления уже не обрабатываются.
+async def stop_broadcaster(application) -> None:
+    await broadcaster.stop()
+
+
+async def stop_response_ingestor(application) -> None:
+    await response_ingestor.stop()
+
+
 # Инициализация бота и Application
-application = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+application = (
+    ApplicationBuilder()
+    .token(TELEGRAM_BOT_TOKEN)
+    .base_url(TELEGRAM_BASE_URL)
+    .concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+    .persistence(
+        MongoPersistence(
+            persistence_collection, update_interval=PERSISTENCE_UPDATE_INTERVAL
+        )
+    )
+    .post_init(start_background_services)
+    .post_stop(stop_broadcaster)
+    .post_shutdown(stop_response_ingestor)
+    .build()
+)
+broadcaster = Broadcaster(application.bot)
+response_ingestor = ResponseIngestor(
+    RESPONSE_SPOOL_DIR,
+    max_batch=RESPONSE_BATCH_SIZE,
+    flush_interval=RESPONSE_FLUSH_INTERVAL,
+    max_attempts=RESPONSE_MAX_ATTEMPTS,
+)
 
 
 # Обработчик команды /start
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
-    user = get_user_by_id(user_id)
+    user = await get_user_by_id(user_id)
 
     if not user:
         # Пользователь не найден в базе данных - предлагаем зарегистрироваться
@@ -60,7 +133,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
     else:
         # Пользователь найден - показываем доступные опросы
-        surveys = get_user_surveys(user_id)
+        surveys = await get_user_surveys(user_id)
         if surveys:
             keyboard = [
                 [
@@ -112,9 +185,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
         elif data.startswith("start_survey_"):
             assigned_survey_id = data.split("_")[-1]
-            context.user_data["current_assigned_survey_id"] = assigned_survey_id
-            context.user_data["survey_step"] = 0
-            await send_next_survey_question(update, context)
+            await start_survey(update, context, assigned_survey_id)
 
         elif data.startswith("csi_answer_"):
             await handle_csi_answer(update, context)
@@ -174,7 +245,7 @@ async def register_user_step(
     elif step == 4:
         if context.user_data.get("agree_personal_data"):
             # Сохраняем пользователя
-            save_user_to_db(update.effective_user.id, context.user_data)
+            await save_user_to_db(update.effective_user.id, context.user_data)
             await message.reply_text("Регистрация завершена! Добро пожаловать!")
             await handle_post_registration(update, context)
         else:
@@ -189,7 +260,7 @@ async def register_user_step(
 # Обработка регистрации
 async def handle_post_registration(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    surveys = get_user_surveys(user_id)
+    surveys = await get_user_surveys(user_id)
 
     if surveys:
         # Если есть доступные опросы
@@ -249,25 +320,18 @@ async def handle_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
 
 
-# Отправка следующего вопроса опроса
-async def send_next_survey_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    assigned_survey_id = context.user_data.get("current_assigned_survey_id")
-    if not assigned_survey_id:
-        await update.effective_message.reply_text("Ошибка: опрос не найден.")
-        return
-
+# Начало опроса: назначение и шаблон читаются один раз, дальше вопросы
+# и ответы обслуживаются из снимка в context.user_data["survey"]
+async def start_survey(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, assigned_survey_id
+):
     try:
-        assigned_survey = surveys_collection.find_one(
-            {"_id": ObjectId(assigned_survey_id)}
-        )
+        assigned_survey = await get_assigned_survey(assigned_survey_id)
         if not assigned_survey:
             await update.effective_message.reply_text("Опрос не найден.")
             return
         survey_template_id = assigned_survey["survey_template_id"]
-        survey_template = survey_templates_collection.find_one(
-            {"_id": survey_template_id}
-        )
+        survey_template = await get_survey_template(survey_template_id)
     except Exception as e:
         logger.error(f"Ошибка при поиске опроса: {e}")
         await update.effective_message.reply_text("Ошибка загрузки опроса.")
@@ -277,14 +341,35 @@ async def send_next_survey_question(update: Update, context: ContextTypes.DEFAUL
         await update.effective_message.reply_text("Опрос не найден.")
         return
 
+    context.user_data["current_assigned_survey_id"] = assigned_survey_id
+    context.user_data["survey"] = {
+        "survey_template_id": survey_template_id,
+        "questions": survey_template.get("questions", []),
+    }
+    context.user_data["survey_step"] = 0
+    await send_next_survey_question(update, context)
+
+
+# Отправка следующего вопроса опроса
+async def send_next_survey_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    assigned_survey_id = context.user_data.get("current_assigned_survey_id")
+    survey = context.user_data.get("survey")
+    if not assigned_survey_id or not survey:
+        await update.effective_message.reply_text("Ошибка: опрос не найден.")
+        return
+
     step = context.user_data.get("survey_step", 0)
-    questions = survey_template.get("questions", [])
+    questions = survey["questions"]
     if step < len(questions):
         question = questions[step]
         context.user_data["current_question"] = question
         if question["type"] == "csi":
             keyboard = [
-                [InlineKeyboardButton(str(i), callback_data=f"csi_answer_{i}")]
+                [
+                    InlineKeyboardButton(
+                        str(i), callback_data=f"csi_answer_{step}_{i}"
+                    )
+                ]
                 for i in range(1, 6)
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
@@ -296,11 +381,9 @@ async def send_next_survey_question(update: Update, context: ContextTypes.DEFAUL
     else:
         await update.effective_message.reply_text("Опрос завершён. Спасибо за участие!")
         # Mark survey as completed
-        surveys_collection.update_one(
-            {"_id": ObjectId(assigned_survey_id)},
-            {"$set": {"completed": True, "completed_at": datetime.datetime.utcnow()}},
-        )
+        await complete_assigned_survey(assigned_survey_id)
         context.user_data.pop("current_assigned_survey_id", None)
+        context.user_data.pop("survey", None)
         context.user_data.pop("survey_step", None)
         context.user_data.pop("current_question", None)
 
@@ -308,28 +391,35 @@ async def send_next_survey_question(update: Update, context: ContextTypes.DEFAUL
 # Обработка ответа на CSI вопрос
 async def handle_csi_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
-    answer = int(query.data.split("_")[2])
     user_id = update.effective_user.id
     question = context.user_data.get("current_question")
     assigned_survey_id = context.user_data.get("current_assigned_survey_id")
+    survey = context.user_data.get("survey")
+    step = context.user_data.get("survey_step", 0)
+    # csi_answer_<номер вопроса>_<ответ>; у старых кнопок номера вопроса нет
+    parts = query.data.split("_")
+    answer = int(parts[-1])
+    question_index = int(parts[2]) if len(parts) == 4 else step
 
-    if question and assigned_survey_id:
-        assigned_survey = surveys_collection.find_one(
-            {"_id": ObjectId(assigned_survey_id)}
-        )
-        survey_template_id = assigned_survey["survey_template_id"]
-        save_response(
+    if question_index != step:
+        # Повторное нажатие или кнопка уже пройденного вопроса
+        return
+
+    if question and survey and assigned_survey_id:
+        # Ответ подтверждается пользователю после записи в spool-файл,
+        # в MongoDB он попадёт со следующей пачкой
+        await response_ingestor.submit(
             {
                 "user_id": user_id,
                 "assigned_survey_id": ObjectId(assigned_survey_id),
-                "survey_template_id": survey_template_id,
+                "survey_template_id": survey["survey_template_id"],
+                "question_index": step,
                 "question": question["text"],
                 "answer": answer,
                 "type": "csi",
             }
         )
-        context.user_data["survey_step"] += 1
-        await query.answer()
+        context.user_data["survey_step"] = step + 1
         await send_next_survey_question(update, context)
     else:
         await query.message.reply_text("Ошибка при сохранении ответа.")
@@ -343,23 +433,26 @@ async def handle_open_answer(
     user_id = update.effective_user.id
     question = context.user_data.get("current_question")
     assigned_survey_id = context.user_data.get("current_assigned_survey_id")
+    survey = context.user_data.get("survey")
+    step = context.user_data.get("survey_step", 0)
 
-    if question and assigned_survey_id:
-        assigned_survey = surveys_collection.find_one(
-            {"_id": ObjectId(assigned_survey_id)}
-        )
-        survey_template_id = assigned_survey["survey_template_id"]
-        save_response(
+    if question and question["type"] == "csi":
+        await update.message.reply_text("Пожалуйста, выберите ответ с помощью кнопок.")
+    elif question and survey and assigned_survey_id:
+        # Ответ подтверждается пользователю после записи в spool-файл,
+        # в MongoDB он попадёт со следующей пачкой
+        await response_ingestor.submit(
             {
                 "user_id": user_id,
                 "assigned_survey_id": ObjectId(assigned_survey_id),
-                "survey_template_id": survey_template_id,
+                "survey_template_id": survey["survey_template_id"],
+                "question_index": step,
                 "question": question["text"],
                 "answer": text,
                 "type": "open",
             }
         )
-        context.user_data["survey_step"] += 1
+        context.user_data["survey_step"] = step + 1
         await send_next_survey_question(update, context)
     else:
         await update.message.reply_text("Ошибка при сохранении ответа.")
@@ -375,26 +468,86 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
         )
 
 
-# Проверка расписания и отправка опросов
+# Обработка одной захваченной строки расписания
+async def process_scheduled_survey(
+    context: ContextTypes.DEFAULT_TYPE, scheduled_survey, now
+):
+    survey_template_id = scheduled_survey["survey_template_id"]
+    schedule_data = scheduled_survey["schedule"]
+    # Пропущенные за время простоя повторения не отправляются пачкой:
+    # следующий запуск всегда считается от текущего момента
+    next_run = recurrence.next_run_after(schedule_data, now)
+    fire = recurrence.should_fire(
+        schedule_data,
+        scheduled_survey["next_run"],
+        now,
+        datetime.timedelta(seconds=SCHEDULER_MISFIRE_GRACE_SECONDS),
+    )
+    if fire:
+        # Расписание статуса разворачивается в его текущих пользователей
+        if "status_name" in scheduled_survey:
+            user_ids = await get_user_ids_by_status(scheduled_survey["status_name"])
+        else:
+            user_ids = [scheduled_survey["user_id"]]
+        await assign_survey_to_users(user_ids, survey_template_id)
+        # Уведомление уходит через очередь рассылки с учётом лимитов Telegram
+        await enqueue_messages(
+            user_ids,
+            "У вас есть новый опрос для прохождения. Пожалуйста, используйте команду /start",
+            "schedule",
+        )
+    await update_scheduled_survey(scheduled_survey["_id"], next_run)
+
+
+# Проверка расписания и отправка опросов (задача JobQueue)
 async def check_scheduled_surveys(context: ContextTypes.DEFAULT_TYPE):
-    scheduled_surveys = get_scheduled_surveys()
+    started = time.monotonic()
     now = datetime.datetime.utcnow()
-    for scheduled_survey in scheduled_surveys:
-        next_run = scheduled_survey.get("next_run")
-        if next_run and next_run <= now:
-            user_id = scheduled_survey["user_id"]
-            survey_template_id = scheduled_survey["survey_template_id"]
-            assign_survey_to_user(user_id, survey_template_id)
-            # Обновить время следующего запуска на основе расписания
-            # Здесь вы можете использовать schedule_data для вычисления следующего запуска
-            # Для простоты предположим, что опрос повторяется ежедневно
-            next_run = now + datetime.timedelta(days=1)
-            update_scheduled_survey(scheduled_survey["_id"], next_run)
-            # Уведомляем пользователя
-            await context.bot.send_message(
-                chat_id=user_id,
-                text="У вас есть новый опрос для прохождения. Пожалуйста, используйте команду /start",
-            )
+    semaphore = asyncio.Semaphore(SCHEDULER_CONCURRENCY)
+    due_count = 0
+    max_lag = datetime.timedelta(0)
+
+    async def process(scheduled_survey):
+        async with semaphore:
+            try:
+                await process_scheduled_survey(context, scheduled_survey, now)
+            except Exception:
+                # Строка останется захваченной и повторится после окончания аренды
+                logger.exception(
+                    f"Ошибка при обработке расписания {scheduled_survey['_id']}"
+                )
+
+    while True:
+        batch = await claim_due_scheduled_surveys(
+            now, SCHEDULER_BATCH_SIZE, SCHEDULER_LEASE_SECONDS
+        )
+        due_count += len(batch)
+        for scheduled_survey in batch:
+            max_lag = max(max_lag, now - scheduled_survey["next_run"])
+        await asyncio.gather(*(process(s) for s in batch))
+        if batch:
+            broadcaster.wake()
+        if len(batch) < SCHEDULER_BATCH_SIZE:
+            break
+
+    # Длительность прохода, число due-строк и отставание от next_run
+    duration = time.monotonic() - started
+    message = (
+        f"Проверка расписания: {duration:.3f} сек., due: {due_count}, "
+        f"макс. отставание: {max_lag.total_seconds():.0f} сек."
+    )
+    if duration > SCHEDULER_INTERVAL_SECONDS:
+        logger.warning(f"{message} — проход дольше интервала планировщика")
+    elif due_count:
+        logger.info(message)
+    else:
+        logger.debug(message)
+
+
+# Периодический вывод статистики кэша шаблонов и записи ответов
+async def log_stats(context: ContextTypes.DEFAULT_TYPE):
+    logger.info(f"Кэш шаблонов опросов: {get_template_cache_stats()}")
+    logger.info(f"Запись ответов: {response_ingestor.stats()}")
 
 
 # Добавление обработчиков
@@ -405,11 +558,62 @@ application.add_handler(
 )
 application.add_error_handler(error_handler)
 
-# Настройка планировщика
-scheduler = AsyncIOScheduler()
-scheduler.add_job(check_scheduled_surveys, "interval", minutes=1, args=[application])
-scheduler.start()
+# Настройка планировщика: задачи выполняются в JobQueue приложения, в том же
+# цикле событий, что и обработчики, и получают настоящий context
+application.job_queue.run_repeating(
+    check_scheduled_surveys,
+    interval=SCHEDULER_INTERVAL_SECONDS,
+    first=5,
+    name="check_scheduled_surveys",
+    job_kwargs={"coalesce": True, "max_instances": 1},
+)
+application.job_queue.run_repeating(log_stats, interval=600, name="log_stats")
+
+
+def check_webhook_config():
+    # Без адреса webhook не зарегистрировать, а без секретного токена сервер
+    # принимал бы обновления от кого угодно, поэтому бот не запускается
+    errors = []
+    if BOT_MODE not in ("polling", "webhook"):
+        errors.append(f"BOT_MODE должен быть polling или webhook, а не {BOT_MODE!r}")
+    if BOT_MODE != "webhook":
+        return errors
+    if not WEBHOOK_URL:
+        errors.append("не задан WEBHOOK_URL (публичный https-адрес бота)")
+    elif not WEBHOOK_URL.startswith("https://"):
+        errors.append(f"WEBHOOK_URL должен начинаться с https://: {WEBHOOK_URL}")
+    if not WEBHOOK_SECRET_TOKEN:
+        errors.append("не задан WEBHOOK_SECRET_TOKEN")
+    elif not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", WEBHOOK_SECRET_TOKEN):
+        # Ограничения Telegram на secret_token в setWebhook
+        errors.append(
+            "WEBHOOK_SECRET_TOKEN может содержать только A-Z, a-z, 0-9, _ и - "
+            "и быть не длиннее 256 символов"
+        )
+    return errors
+
 
 # Запуск бота
 if __name__ == "__main__":
-    application.run_polling()
+    config_errors = check_webhook_config()
+    if config_errors:
+        raise SystemExit("Неверная конфигурация бота:\n" + "\n".join(config_errors))
+    for index in ensure_indexes():
+        logger.info(
+            f"Индекс {index['collection']}.{index['index']}: {index['state']}"
+        )
+    for migration in run_migrations():
+        logger.info(f"Миграция выполнена: {migration}")
+    if BOT_MODE == "webhook":
+        # Telegram передаёт секретный токен в заголовке
+        # X-Telegram-Bot-Api-Secret-Token, запросы без него отклоняются
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET_TOKEN,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+    else:
+        application.run_polling()
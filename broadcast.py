@@ -0,0 +1,282 @@
+# broadcast.py
+
+# Рассылка сообщений из очереди outbox с учётом лимитов Telegram.
+# Сообщения ставятся в очередь через db.enqueue_messages (из бота или Streamlit),
+# Broadcaster забирает их пачками, отправляет с ограничением скорости и
+# сохраняет статус доставки каждого сообщения.
+
+import asyncio
+import datetime
+import logging
+import os
+import socket
+import time
+
+from bson import ObjectId
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from async_db import (
+    acquire_lock,
+    claim_outbox_messages,
+    extend_outbox_lease,
+    mark_message_failed,
+    mark_message_sent,
+    release_lock,
+    release_outbox_messages,
+)
+from config import (
+    BROADCAST_BATCH_SIZE,
+    BROADCAST_CONCURRENCY,
+    BROADCAST_LEASE_SECONDS,
+    BROADCAST_MAX_ATTEMPTS,
+    BROADCAST_PER_CHAT_INTERVAL,
+    BROADCAST_POLL_SECONDS,
+    BROADCAST_RATE,
+    BROADCAST_SENDER_LEASE_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    # Ограничение общей скорости отправки. Работает внутри одного цикла событий,
+    # поэтому блокировка не нужна.
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+
+    def pause(self, seconds):
+        # После RetryAfter останавливаем всю рассылку, а не только один чат
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated_at) * self.rate
+            )
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ChatLimiter:
+    # Минимальный интервал между сообщениями в один чат
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._next_allowed = {}
+
+    async def acquire(self, chat_id):
+        now = time.monotonic()
+        next_allowed = self._next_allowed.get(chat_id, now)
+        self._next_allowed[chat_id] = max(now, next_allowed) + self.interval
+        if len(self._next_allowed) > 10000:
+            self._next_allowed = {
+                key: value for key, value in self._next_allowed.items() if value > now
+            }
+        if next_allowed > now:
+            await asyncio.sleep(next_allowed - now)
+
+
+class Broadcaster:
+    # Рассылает только процесс, который держит аренду роли отправителя
+    # (SENDER_LOCK), поэтому лимит скорости общий для всех реплик бота.
+    # Пока захваченные сообщения ждут отправки, их аренда продлевается, а перед
+    # отправкой и при записи статуса проверяется, что захват (claim_id) всё ещё
+    # принадлежит этому процессу.
+
+    SENDER_LOCK = "broadcast_sender"
+
+    def __init__(
+        self,
+        bot,
+        rate=BROADCAST_RATE,
+        per_chat_interval=BROADCAST_PER_CHAT_INTERVAL,
+        concurrency=BROADCAST_CONCURRENCY,
+        max_attempts=BROADCAST_MAX_ATTEMPTS,
+        poll_seconds=BROADCAST_POLL_SECONDS,
+        batch_size=BROADCAST_BATCH_SIZE,
+        lease_seconds=BROADCAST_LEASE_SECONDS,
+        sender_lease_seconds=BROADCAST_SENDER_LEASE_SECONDS,
+    ):
+        self.bot = bot
+        self.bucket = TokenBucket(rate)
+        self.chat_limiter = ChatLimiter(per_chat_interval)
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.sender_lease_seconds = sender_lease_seconds
+        # Не захватываем больше сообщений, чем успеем отправить за время аренды
+        self.max_claimed = max(1, int(rate * lease_seconds))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{ObjectId()}"
+        self.is_sender = False
+        # Захваченные и ещё не обработанные сообщения: _id -> claim_id
+        self._claimed = {}
+        self._sending = set()
+        self._queue = asyncio.Queue(maxsize=batch_size)
+        self._wake = asyncio.Event()
+        self._tasks = []
+
+    async def start(self):
+        await self._renew()
+        self._tasks = [
+            asyncio.create_task(self._feed()),
+            asyncio.create_task(self._heartbeat()),
+        ] + [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Сообщения из очереди сразу достаются следующему отправителю, а
+        # прерванные на отправке вернутся в очередь по истечении аренды
+        waiting = {
+            message_id: claim_id
+            for message_id, claim_id in self._claimed.items()
+            if message_id not in self._sending
+        }
+        if waiting:
+            await release_outbox_messages(list(waiting), set(waiting.values()))
+        if self.is_sender:
+            await release_lock(self.SENDER_LOCK, self.owner)
+            self.is_sender = False
+
+    def wake(self):
+        # Вызывается после постановки сообщений в очередь из этого процесса
+        self._wake.set()
+
+    async def _renew(self):
+        is_sender = await acquire_lock(
+            self.SENDER_LOCK, self.owner, self.sender_lease_seconds
+        )
+        if is_sender != self.is_sender:
+            logger.info(
+                "Процесс стал отправителем рассылки"
+                if is_sender
+                else "Процесс больше не отправитель рассылки"
+            )
+        self.is_sender = is_sender
+        if is_sender:
+            await self._extend_leases(self.lease_seconds)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.sender_lease_seconds / 3)
+            try:
+                await self._renew()
+            except Exception:
+                logger.exception("Ошибка при продлении аренды рассылки")
+
+    async def _extend_leases(self, seconds):
+        if self._claimed:
+            await extend_outbox_lease(
+                list(self._claimed),
+                set(self._claimed.values()),
+                datetime.datetime.utcnow() + datetime.timedelta(seconds=seconds),
+            )
+
+    async def _feed(self):
+        while True:
+            messages = []
+            limit = min(self.batch_size, self.max_claimed - len(self._claimed))
+            if self.is_sender and limit > 0:
+                try:
+                    messages = await claim_outbox_messages(
+                        datetime.datetime.utcnow(), limit, self.lease_seconds
+                    )
+                except Exception:
+                    logger.exception("Ошибка при чтении очереди сообщений")
+            for message in messages:
+                self._claimed[message["_id"]] = message["claim_id"]
+            for message in messages:
+                await self._queue.put(message)
+            if len(messages) < self.batch_size:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _work(self):
+        while True:
+            message = await self._queue.get()
+            try:
+                await self._deliver(message)
+            except Exception:
+                logger.exception(f"Ошибка при отправке сообщения {message['_id']}")
+            finally:
+                self._claimed.pop(message["_id"], None)
+                self._queue.task_done()
+
+    def _backoff(self, attempts):
+        return min(2**attempts, 300)
+
+    async def _deliver(self, message):
+        message_id, claim_id = message["_id"], message["claim_id"]
+        await self.chat_limiter.acquire(message["chat_id"])
+        await self.bucket.acquire()
+        if not self.is_sender:
+            await release_outbox_messages([message_id], [claim_id])
+            return
+        now = datetime.datetime.utcnow()
+        # Аренда могла истечь, пока сообщение ждало в очереди, и тогда его уже
+        # захватил другой процесс
+        lease_until = now + datetime.timedelta(seconds=self.lease_seconds)
+        if not await extend_outbox_lease([message_id], [claim_id], lease_until):
+            logger.warning(f"Сообщение {message_id} захвачено другим процессом")
+            return
+        attempts = message.get("attempts", 0) + 1
+        self._sending.add(message_id)
+        try:
+            await self.bot.send_message(
+                chat_id=message["chat_id"], text=message["text"]
+            )
+        except RetryAfter as e:
+            retry_after = float(e.retry_after)
+            logger.warning(f"Flood control: пауза рассылки на {retry_after} сек.")
+            self.bucket.pause(retry_after)
+            marked = await mark_message_failed(
+                message_id,
+                claim_id,
+                str(e),
+                now + datetime.timedelta(seconds=retry_after),
+            )
+            # Сообщения в очереди ждут конца паузы и не должны потерять аренду
+            await self._extend_leases(retry_after + self.lease_seconds)
+        except (Forbidden, BadRequest) as e:
+            # Пользователь заблокировал бота или чат не существует — не повторяем
+            marked = await mark_message_failed(message_id, claim_id, str(e))
+        except TimedOut as e:
+            # Telegram мог получить запрос и доставить сообщение: повтор дал бы
+            # пользователю дубль, поэтому сообщение помечается неотправленным
+            logger.warning(
+                f"Таймаут отправки сообщения {message_id}: возможно, оно доставлено"
+            )
+            marked = await mark_message_failed(message_id, claim_id, str(e))
+        except NetworkError as e:
+            retry_at = None
+            if attempts < self.max_attempts:
+                retry_at = now + datetime.timedelta(seconds=self._backoff(attempts))
+            marked = await mark_message_failed(message_id, claim_id, str(e), retry_at)
+        else:
+            marked = await mark_message_sent(message_id, claim_id)
+        finally:
+            self._sending.discard(message_id)
+        if not marked:
+            logger.warning(
+                f"Статус сообщения {message_id} не записан: захват перешёл "
+                "к другому процессу"
+            )
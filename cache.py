@@ -0,0 +1,94 @@
+# cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TemplateCache:
+    # LRU-кэш шаблонов опросов внутри процесса, ключ — ObjectId шаблона.
+    # Шаблон хранится вместе со временем последней проверки; устаревшая запись
+    # сверяется с базой только по полю version и перечитывается, если версия
+    # изменилась. Возвращаемые шаблоны общие для всех вызовов — их нельзя изменять.
+
+    def __init__(self, maxsize=256, revalidate_seconds=60):
+        self.maxsize = maxsize
+        self.revalidate_seconds = revalidate_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_many(self, keys, load, load_versions):
+        # load(keys) -> список шаблонов, load_versions(keys) -> {_id: version}
+        now = time.monotonic()
+        found, stale, missing = {}, [], []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                entry = self._entries.get(key)
+                if entry is None:
+                    missing.append(key)
+                elif now - entry[1] > self.revalidate_seconds:
+                    stale.append(key)
+                else:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[0]
+
+        if stale:
+            versions = load_versions(stale)
+            with self._lock:
+                for key in stale:
+                    entry = self._entries.get(key)
+                    if (
+                        entry is not None
+                        and key in versions
+                        and versions[key] == entry[0].get("version")
+                    ):
+                        self._entries[key] = (entry[0], now)
+                        self._entries.move_to_end(key)
+                        found[key] = entry[0]
+                    else:
+                        self._entries.pop(key, None)
+                        self.invalidations += 1
+                        missing.append(key)
+
+        hit_count = len(found)
+        if missing:
+            for template in load(missing):
+                self._put(template["_id"], template, now)
+                found[template["_id"]] = template
+
+        with self._lock:
+            self.hits += hit_count
+            self.misses += len(missing)
+        return found
+
+    def _put(self, key, template, checked_at):
+        with self._lock:
+            self._entries[key] = (template, checked_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+            elif self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
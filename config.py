@@ -16,11 +16,97 @@ MONGO_PORT = os.getenv("MONGO_INITDB_ROOT_PORT")
 
 # Параметры для Telegram-бота
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# Адрес Bot API (можно указать локальный или тестовый сервер)
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL", "https://api.telegram.org/bot")
+
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Сколько обновлений обрабатывается одновременно (обновления одного
+# пользователя всегда обрабатываются по очереди)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "32"))
+
+# Параметры webhook: публичный адрес, на который Telegram отправляет обновления,
+# адрес и порт локального HTTP-сервера, путь, секретный токен и максимальное
+# число одновременных соединений от Telegram
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
 
 # Параметры для MongoDB
 MONGODB_URI = f"mongodb://{MONGO_USERNAME}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/"
 MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "tgbot")
 
+# Размер пула потоков, в котором бот выполняет запросы к MongoDB
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "16"))
+
+# Размер пачки операций при массовом назначении опросов
+ASSIGNMENT_CHUNK_SIZE = int(os.getenv("ASSIGNMENT_CHUNK_SIZE", "1000"))
+
+# Планировщик: период проверки расписания (сек.), размер пачки due-строк,
+# число одновременно обрабатываемых строк
+# и время аренды строки (сек.), после которого незавершённая строка снова считается due
+SCHEDULER_INTERVAL_SECONDS = int(os.getenv("SCHEDULER_INTERVAL_SECONDS", "60"))
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", "100"))
+SCHEDULER_CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", "10"))
+SCHEDULER_LEASE_SECONDS = int(os.getenv("SCHEDULER_LEASE_SECONDS", "300"))
+# Насколько может опоздать запуск с политикой "skip", чтобы всё же выполниться (сек.)
+SCHEDULER_MISFIRE_GRACE_SECONDS = int(
+    os.getenv("SCHEDULER_MISFIRE_GRACE_SECONDS", "3600")
+)
+# Рассылка сообщений: общий лимит Telegram (~30 сообщений/сек) с запасом,
+# минимальный интервал между сообщениями в один чат (сек.), число параллельных
+# отправок, число попыток, период опроса очереди (сек.) и размер пачки из очереди
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv("BROADCAST_PER_CHAT_INTERVAL", "1"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "8"))
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", "5"))
+BROADCAST_POLL_SECONDS = float(os.getenv("BROADCAST_POLL_SECONDS", "5"))
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "200"))
+BROADCAST_LEASE_SECONDS = int(os.getenv("BROADCAST_LEASE_SECONDS", "120"))
+# Лимит Telegram общий для бота, поэтому рассылает только один процесс:
+# аренда роли отправителя (сек.); при падении отправителя роль переходит
+# к другому процессу не позже чем через это время
+BROADCAST_SENDER_LEASE_SECONDS = int(os.getenv("BROADCAST_SENDER_LEASE_SECONDS", "30"))
+
+# Часовой пояс расписаний по умолчанию
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "UTC")
+
+# Период записи изменённого состояния бота в MongoDB (сек.)
+PERSISTENCE_UPDATE_INTERVAL = float(os.getenv("PERSISTENCE_UPDATE_INTERVAL", "5"))
+
+# Размер LRU-кэша нормальных форм слов при анализе ответов
+LEMMA_CACHE_SIZE = int(os.getenv("LEMMA_CACHE_SIZE", "100000"))
+
+# Анализ открытых ответов (text_analytics.py): размер пачки и интервал
+# проверки новых ответов в режиме --loop, сек.
+TEXT_ANALYTICS_BATCH_SIZE = int(os.getenv("TEXT_ANALYTICS_BATCH_SIZE", "500"))
+TEXT_ANALYTICS_POLL_SECONDS = float(os.getenv("TEXT_ANALYTICS_POLL_SECONDS", "10"))
+
+# Время жизни кэша запросов панели администратора, сек.
+DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "60"))
+
+# Хранение ответов: per_question — документ на каждый ответ (responses),
+# per_survey — документ на назначенный опрос с массивом ответов (survey_responses)
+RESPONSES_STORAGE = os.getenv("RESPONSES_STORAGE", "per_question")
+
+# Пакетная запись ответов: каталог spool-файлов, максимальный размер пачки
+# и период записи пачки в MongoDB (сек.)
+RESPONSE_SPOOL_DIR = os.getenv("RESPONSE_SPOOL_DIR", "spool")
+RESPONSE_BATCH_SIZE = int(os.getenv("RESPONSE_BATCH_SIZE", "500"))
+RESPONSE_FLUSH_INTERVAL = float(os.getenv("RESPONSE_FLUSH_INTERVAL", "1"))
+# Сколько раз пачка может не записаться из-за ошибки (не из-за недоступности
+# MongoDB), прежде чем неудачные ответы будут перенесены в карантин spool
+RESPONSE_MAX_ATTEMPTS = int(os.getenv("RESPONSE_MAX_ATTEMPTS", "5"))
+
+# Кэш шаблонов опросов: максимальное число шаблонов и период сверки версии (сек.)
+TEMPLATE_CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", "256"))
+TEMPLATE_CACHE_REVALIDATE_SECONDS = float(
+    os.getenv("TEMPLATE_CACHE_REVALIDATE_SECONDS", "60")
+)
+
 # Список Telegram ID администраторов
 ADMIN_IDS = [
     int(admin_id) for admin_id in os.getenv("ADMIN_IDS", "").split(",") if admin_id
@@ -0,0 +1,180 @@
+# dashboard_data.py
+
+# Кэшированный доступ к данным для панели администратора.
+# Результаты запросов хранятся через st.cache_data с TTL и общие для всех
+# сессий процесса Streamlit. Изменения, сделанные из панели, сразу сбрасывают
+# кэши затронутых запросов, а изменения со стороны бота (новые пользователи,
+# ответы) становятся видны не позже чем через DASHBOARD_CACHE_TTL секунд.
+
+import threading
+import time
+
+import streamlit as st
+
+import db
+from config import DASHBOARD_CACHE_TTL
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def _record(name, seconds=None, miss=False):
+    with _stats_lock:
+        stats = _stats.setdefault(name, {"calls": 0, "misses": 0, "seconds": 0.0})
+        if miss:
+            stats["misses"] += 1
+        else:
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+
+
+def _query(name, load, *args):
+    # Тело load выполняется только при промахе и само отмечает промах
+    started = time.perf_counter()
+    try:
+        return load(*args)
+    finally:
+        _record(name, time.perf_counter() - started)
+
+
+def query_stats():
+    with _stats_lock:
+        return [
+            {
+                "query": name,
+                "calls": stats["calls"],
+                "hit_rate": 1 - stats["misses"] / max(stats["calls"], 1),
+                "avg_ms": stats["seconds"] / max(stats["calls"], 1) * 1000,
+            }
+            for name, stats in sorted(_stats.items())
+        ]
+
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def _get_survey_templates():
+    _record("get_survey_templates", miss=True)
+    return db.get_survey_templates()
+
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def _get_user_statuses():
+    _record("get_user_statuses", miss=True)
+    return db.get_user_statuses()
+
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def _count_users():
+    _record("count_users", miss=True)
+    return db.count_users()
+
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def _get_users_page(page, page_size):
+    _record("get_users_page", miss=True)
+    return db.get_users_page(page, page_size)
+
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def _search_users(query):
+    _record("search_users", miss=True)
+    return db.search_users(query)
+
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def _count_scheduled_surveys():
+    _record("count_scheduled_surveys", miss=True)
+    return db.count_scheduled_surveys()
+
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def _get_scheduled_surveys_page(page, page_size):
+    _record("get_scheduled_surveys_page", miss=True)
+    return db.get_scheduled_surveys_page(page, page_size)
+
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def _get_surveys_for_status(status_name):
+    _record("get_surveys_for_status", miss=True)
+    return db.get_surveys_for_status(status_name)
+
+
+def get_survey_templates():
+    return _query("get_survey_templates", _get_survey_templates)
+
+
+def get_user_statuses():
+    return _query("get_user_statuses", _get_user_statuses)
+
+
+def count_users():
+    return _query("count_users", _count_users)
+
+
+def get_users_page(page, page_size):
+    return _query("get_users_page", _get_users_page, page, page_size)
+
+
+def search_users(query):
+    return _query("search_users", _search_users, query)
+
+
+def count_scheduled_surveys():
+    return _query("count_scheduled_surveys", _count_scheduled_surveys)
+
+
+def get_scheduled_surveys_page(page, page_size):
+    return _query(
+        "get_scheduled_surveys_page", _get_scheduled_surveys_page, page, page_size
+    )
+
+
+def get_surveys_for_status(status_name):
+    return _query("get_surveys_for_status", _get_surveys_for_status, status_name)
+
+
+# Изменения из панели сбрасывают кэши запросов, результат которых они меняют
+def create_survey_template(survey_data):
+    result = db.create_survey_template(survey_data)
+    _get_survey_templates.clear()
+    return result
+
+
+def create_status(status_name):
+    result = db.create_status(status_name)
+    _get_user_statuses.clear()
+    return result
+
+
+def update_user_status(user_id, new_status):
+    result = db.update_user_status(user_id, new_status)
+    _get_users_page.clear()
+    _search_users.clear()
+    return result
+
+
+def _clear_scheduled_surveys():
+    _count_scheduled_surveys.clear()
+    _get_scheduled_surveys_page.clear()
+
+
+def iter_schedule_survey_for_users(user_ids, survey_template_id, schedule_data):
+    try:
+        yield from db.iter_schedule_survey_for_users(
+            user_ids, survey_template_id, schedule_data
+        )
+    finally:
+        _clear_scheduled_surveys()
+
+
+def schedule_survey_for_status(status_name, survey_template_id, schedule_data):
+    result = db.schedule_survey_for_status(
+        status_name, survey_template_id, schedule_data
+    )
+    _clear_scheduled_surveys()
+    return result
+
+
+def assign_survey_to_status(status_name, survey_template_id):
+    result = db.assign_survey_to_status(status_name, survey_template_id)
+    _get_surveys_for_status.clear()
+    return result
@@ -1,11 +1,23 @@
 # database.py
 
+import collections
 import datetime
+import re
 
 from bson import ObjectId
-from pymongo import MongoClient
+from pymongo import ASCENDING, MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
-from config import MONGODB_DB_NAME, MONGODB_URI
+import recurrence
+from cache import TemplateCache
+from config import (
+    ASSIGNMENT_CHUNK_SIZE,
+    MONGODB_DB_NAME,
+    MONGODB_URI,
+    RESPONSES_STORAGE,
+    TEMPLATE_CACHE_REVALIDATE_SECONDS,
+    TEMPLATE_CACHE_SIZE,
+)
 
 # Подключение к MongoDB
 try:
@@ -16,15 +28,28 @@ try:
     surveys_collection = db["surveys"]  # Assigned surveys to users
     survey_templates_collection = db["survey_templates"]
     responses_collection = db["responses"]
+    survey_responses_collection = db["survey_responses"]  # One document per assigned survey
+    csi_stats_collection = db["csi_stats"]  # CSI aggregates per survey question
+    term_counts_collection = db["term_counts"]  # Lemma frequencies per survey
+    exports_collection = db["exports"]  # Watermarks of incremental exports
+    lemmas_collection = db["lemmas"]  # Cached pymorphy2 normal forms, _id is the word
     scheduled_surveys_collection = db["scheduled_surveys"]
     status_collection = db["statuses"]  # Collection for user statuses
     survey_status_collection = db[
         "survey_status"
     ]  # Collection for surveys assigned to statuses
+    outbox_collection = db["outbox"]  # Outgoing Telegram messages and delivery status
+    locks_collection = db["locks"]  # Named leases, e.g. the single broadcast sender
+    persistence_collection = db["bot_persistence"]  # user_data/chat_data of the bot
 except Exception as e:
     print(f"Ошибка подключения к MongoDB: {e}")
     raise RuntimeError("Невозможно подключиться к базе данных MongoDB.")
 
+# Кэш шаблонов опросов (инвалидация по полю version)
+template_cache = TemplateCache(
+    maxsize=TEMPLATE_CACHE_SIZE, revalidate_seconds=TEMPLATE_CACHE_REVALIDATE_SECONDS
+)
+
 
 # Функции для работы с пользователями
 def save_user_to_db(user_id, user_data):
@@ -49,6 +74,69 @@ def get_all_users():
     return list(users_collection.find())
 
 
+# Поля пользователя, которые показывает панель администратора
+USER_LIST_PROJECTION = {
+    "_id": 0,
+    "user_id": 1,
+    "first_name": 1,
+    "last_name": 1,
+    "status": 1,
+}
+
+
+def _users_filter(status=None):
+    return {"status": status} if status else {}
+
+
+def get_users_page(page, page_size, status=None):
+    # page считается с нуля, порядок стабилен благодаря сортировке по user_id
+    return list(
+        users_collection.find(_users_filter(status), USER_LIST_PROJECTION)
+        .sort("user_id", ASCENDING)
+        .skip(page * page_size)
+        .limit(page_size)
+    )
+
+
+def count_users(status=None):
+    return users_collection.count_documents(_users_filter(status))
+
+
+def _name_prefix(word):
+    # Поиск по началу имени без учёта регистра первой буквы; регулярное
+    # выражение с ^ и без флагов использует индекс по полю
+    variants = {word, word.capitalize()}
+    return {"$in": [re.compile("^" + re.escape(variant)) for variant in variants]}
+
+
+def search_users(query, limit=20):
+    # Поиск по user_id или по началу имени и фамилии ("Иван", "Иван Пет")
+    query = query.strip()
+    if not query:
+        return []
+    if query.isdigit():
+        search_filter = {"user_id": int(query)}
+    else:
+        words = query.split()
+        if len(words) >= 2:
+            search_filter = {
+                "first_name": _name_prefix(words[0]),
+                "last_name": _name_prefix(" ".join(words[1:])),
+            }
+        else:
+            search_filter = {
+                "$or": [
+                    {"first_name": _name_prefix(query)},
+                    {"last_name": _name_prefix(query)},
+                ]
+            }
+    return list(
+        users_collection.find(search_filter, USER_LIST_PROJECTION)
+        .sort("user_id", ASCENDING)
+        .limit(limit)
+    )
+
+
 def get_user_full_name(user_id):
     user = users_collection.find_one({"user_id": user_id})
     if user:
@@ -56,18 +144,43 @@ def get_user_full_name(user_id):
     return "Неизвестный пользователь"
 
 
+def get_user_full_names(user_ids):
+    # Имена нескольких пользователей одним запросом $in
+    names = {user_id: "Неизвестный пользователь" for user_id in user_ids}
+    for user in users_collection.find(
+        {"user_id": {"$in": list(names)}},
+        {"_id": 0, "user_id": 1, "first_name": 1, "last_name": 1},
+    ):
+        names[user["user_id"]] = (
+            f"{user.get('first_name', '')} {user.get('last_name', '')}"
+        )
+    return names
+
+
 def update_user_status(user_id, new_status):
     users_collection.update_one({"user_id": user_id}, {"$set": {"status": new_status}})
     # When status changes, assign surveys associated with the new status
-    surveys = get_surveys_for_status(new_status)
-    for survey in surveys:
-        assign_survey_to_user(user_id, survey["_id"])
+    assignments = survey_status_collection.find(
+        {"status_name": new_status}, {"survey_template_id": 1}
+    )
+    return _bulk_assign(
+        (user_id, assignment["survey_template_id"]) for assignment in assignments
+    )
 
 
 def get_users_by_status(status_name):
     return list(users_collection.find({"status": status_name}))
 
 
+def get_user_ids_by_status(status_name):
+    return [
+        user["user_id"]
+        for user in users_collection.find(
+            {"status": status_name}, {"_id": 0, "user_id": 1}
+        )
+    ]
+
+
 def get_user_statuses():
     return list(status_collection.find({}, {"_id": 0, "name": 1}))
 
@@ -82,53 +195,150 @@ def create_status(status_name):
 
 # Функции для работы с опросами
 def create_survey_template(survey_data):
+    survey_data.setdefault("version", 1)
     survey_templates_collection.insert_one(survey_data)
 
 
+def update_survey_template(survey_template_id, fields):
+    # Любое изменение шаблона увеличивает version, чтобы кэши других процессов
+    # перечитали его при следующей сверке
+    survey_templates_collection.update_one(
+        {"_id": ObjectId(survey_template_id)},
+        {"$set": fields, "$inc": {"version": 1}},
+    )
+    template_cache.invalidate(ObjectId(survey_template_id))
+
+
 def get_survey_templates():
     return list(survey_templates_collection.find())
 
 
+def _load_survey_templates(survey_template_ids):
+    return list(survey_templates_collection.find({"_id": {"$in": survey_template_ids}}))
+
+
+def _load_survey_template_versions(survey_template_ids):
+    return {
+        template["_id"]: template.get("version")
+        for template in survey_templates_collection.find(
+            {"_id": {"$in": survey_template_ids}}, {"version": 1}
+        )
+    }
+
+
+def get_survey_templates_by_ids(survey_template_ids):
+    # Все промахи кэша догружаются одним запросом $in
+    return template_cache.get_many(
+        [ObjectId(i) for i in survey_template_ids],
+        _load_survey_templates,
+        _load_survey_template_versions,
+    )
+
+
+def get_survey_template(survey_template_id):
+    survey_template_id = ObjectId(survey_template_id)
+    return get_survey_templates_by_ids([survey_template_id]).get(survey_template_id)
+
+
+def get_template_cache_stats():
+    return template_cache.stats()
+
+
 def get_survey_title(survey_id):
-    survey = survey_templates_collection.find_one({"_id": ObjectId(survey_id)})
+    survey = get_survey_template(survey_id)
     return survey.get("title", "Без названия") if survey else None
 
 
-def assign_survey_to_user(user_id, survey_template_id):
-    existing_assignment = surveys_collection.find_one(
-        {
-            "user_id": user_id,
-            "survey_template_id": ObjectId(survey_template_id),
-            "completed": False,
-        }
+def get_survey_titles(survey_ids):
+    # Названия нескольких опросов: промахи кэша шаблонов догружаются одним $in
+    templates = get_survey_templates_by_ids(survey_ids)
+    titles = {}
+    for survey_id in map(ObjectId, survey_ids):
+        template = templates.get(survey_id)
+        titles[survey_id] = template.get("title", "Без названия") if template else None
+    return titles
+
+
+def get_assigned_survey(assigned_survey_id):
+    return surveys_collection.find_one({"_id": ObjectId(assigned_survey_id)})
+
+
+def complete_assigned_survey(assigned_survey_id):
+    surveys_collection.update_one(
+        {"_id": ObjectId(assigned_survey_id)},
+        {"$set": {"completed": True, "completed_at": datetime.datetime.utcnow()}},
     )
-    if not existing_assignment:
-        surveys_collection.insert_one(
-            {
-                "user_id": user_id,
-                "survey_template_id": ObjectId(survey_template_id),
-                "assigned_at": datetime.datetime.utcnow(),
-                "completed": False,
-            }
+
+
+# Назначение опросов выполняется upsert'ами пачками через bulk_write.
+# Повторные назначения отсекает уникальный частичный индекс uniq_open_assignment
+# (см. migrations.py), поэтому гонка двух процессов не создаёт дубликатов.
+def _write_assignments(operations):
+    try:
+        result = surveys_collection.bulk_write(operations, ordered=False)
+        inserted = result.upserted_count
+    except BulkWriteError as e:
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+        inserted = e.details["nUpserted"]
+    return inserted, len(operations) - inserted
+
+
+def _bulk_assign(pairs, chunk_size=ASSIGNMENT_CHUNK_SIZE):
+    # pairs — итерируемое (user_id, survey_template_id)
+    assigned_at = datetime.datetime.utcnow()
+    inserted = skipped = 0
+    operations = []
+    for user_id, survey_template_id in pairs:
+        operations.append(
+            UpdateOne(
+                {
+                    "user_id": user_id,
+                    "survey_template_id": ObjectId(survey_template_id),
+                    "completed": False,
+                },
+                {"$setOnInsert": {"assigned_at": assigned_at}},
+                upsert=True,
+            )
         )
+        if len(operations) >= chunk_size:
+            chunk_inserted, chunk_skipped = _write_assignments(operations)
+            inserted += chunk_inserted
+            skipped += chunk_skipped
+            operations = []
+    if operations:
+        chunk_inserted, chunk_skipped = _write_assignments(operations)
+        inserted += chunk_inserted
+        skipped += chunk_skipped
+    return {"inserted": inserted, "skipped": skipped}
+
+
+def assign_survey_to_users(user_ids, survey_template_id):
+    return _bulk_assign((user_id, survey_template_id) for user_id in user_ids)
+
+
+def assign_survey_to_user(user_id, survey_template_id):
+    return assign_survey_to_users([user_id], survey_template_id)
 
 
 def assign_survey_to_status(status_name, survey_template_id):
     existing_assignment = survey_status_collection.find_one(
         {"status_name": status_name, "survey_template_id": ObjectId(survey_template_id)}
     )
-    if not existing_assignment:
-        survey_status_collection.insert_one(
-            {
-                "status_name": status_name,
-                "survey_template_id": ObjectId(survey_template_id),
-                "assigned_at": datetime.datetime.utcnow(),
-            }
-        )
-        # Assign this survey to all users with this status
-        users = get_users_by_status(status_name)
-        for user in users:
-            assign_survey_to_user(user["user_id"], survey_template_id)
+    if existing_assignment:
+        return None
+    survey_status_collection.insert_one(
+        {
+            "status_name": status_name,
+            "survey_template_id": ObjectId(survey_template_id),
+            "assigned_at": datetime.datetime.utcnow(),
+        }
+    )
+    # Assign this survey to all users with this status
+    users = users_collection.find({"status": status_name}, {"_id": 0, "user_id": 1})
+    return assign_survey_to_users(
+        (user["user_id"] for user in users), survey_template_id
+    )
 
 
 def get_surveys_for_status(status_name):
@@ -138,13 +348,18 @@ def get_surveys_for_status(status_name):
 
 
 def get_user_surveys(user_id):
-    assigned_surveys = surveys_collection.find({"user_id": user_id, "completed": False})
+    # Один запрос за назначениями и не более одного $in за шаблонами
+    assigned_surveys = list(
+        surveys_collection.find(
+            {"user_id": user_id, "completed": False}, {"survey_template_id": 1}
+        )
+    )
+    templates = get_survey_templates_by_ids(
+        [a["survey_template_id"] for a in assigned_surveys]
+    )
     surveys = []
     for assigned_survey in assigned_surveys:
-        survey_template_id = assigned_survey["survey_template_id"]
-        survey_template = survey_templates_collection.find_one(
-            {"_id": survey_template_id}
-        )
+        survey_template = templates.get(assigned_survey["survey_template_id"])
         if survey_template:
             surveys.append(
                 {
@@ -156,12 +371,690 @@ def get_user_surveys(user_id):
     return surveys
 
 
+# Ответы хранятся в одном из двух режимов (RESPONSES_STORAGE):
+# per_question — документ на каждый ответ в коллекции responses,
+# per_survey — документ на назначенный опрос в коллекции survey_responses
+# с массивом answers. Чтение в обоих режимах возвращает ответы в формате
+# per_question.
+def _save_responses_per_question(responses):
+    # Повторы того же (assigned_survey_id, question_index) отсекает индекс uniq_answer
+    try:
+        responses_collection.insert_many(responses, ordered=False)
+        return responses
+    except BulkWriteError as e:
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+        rejected = {error["index"] for error in e.details["writeErrors"]}
+        return [r for i, r in enumerate(responses) if i not in rejected]
+
+
+def _answer_push(response, upsert):
+    # Ответ добавляется, только если на этот вопрос ещё нет ответа. Если ответ
+    # уже есть, фильтр не совпадёт и upsert завершится ошибкой дубликата _id.
+    now = datetime.datetime.utcnow()
+    answer = {
+        "question_index": response["question_index"],
+        "question": response["question"],
+        "answer": response["answer"],
+        "type": response["type"],
+        "answered_at": now,
+    }
+    if "csi_counted" in response:
+        answer["csi_counted"] = response["csi_counted"]
+    update = {
+        "$push": {"answers": answer},
+        "$set": {"updated_at": now},
+    }
+    if upsert:
+        update["$setOnInsert"] = {
+            "user_id": response["user_id"],
+            "survey_template_id": response["survey_template_id"],
+        }
+    return UpdateOne(
+        {
+            "_id": response["assigned_survey_id"],
+            "answers.question_index": {"$ne": response["question_index"]},
+        },
+        update,
+        upsert=upsert,
+    )
+
+
+def _save_responses_per_survey(responses):
+    try:
+        survey_responses_collection.bulk_write(
+            [_answer_push(response, upsert=True) for response in responses],
+            ordered=False,
+        )
+        return responses
+    except BulkWriteError as e:
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+        rejected = {error["index"] for error in e.details["writeErrors"]}
+    # Дубликат _id бывает и при гонке двух первых ответов одного опроса,
+    # поэтому отклонённые ответы повторяются уже без upsert
+    saved = [r for i, r in enumerate(responses) if i not in rejected]
+    for index in sorted(rejected):
+        result = survey_responses_collection.bulk_write(
+            [_answer_push(responses[index], upsert=False)]
+        )
+        if result.modified_count:
+            saved.append(responses[index])
+    return saved
+
+
+# Учёт ответов в агрегатах (csi_stats, term_counts) отдельным шагом.
+# Ответ записывается с отметкой (csi_counted или terms_counted) равной False.
+# Шаг помечает неучтённые ответы идентификатором пачки (ObjectId), применяет
+# $inc и снимает отметку. $inc в каждом документе агрегата применяется не больше
+# одного раза на пачку (её идентификатор сохраняется в claims), поэтому пачку,
+# прерванную сбоем на любом шаге, следующий вызов после COUNT_LEASE безопасно
+# досчитывает с тем же идентификатором. Ответы без отметки уже учтены.
+COUNT_LEASE = datetime.timedelta(minutes=5)
+# Сколько последних пачек помнит документ агрегата
+COUNT_CLAIM_HISTORY = 1000
+
+
+def _inc_once(collection, increments, claim_id):
+    # increments: [(фильтр документа агрегата, $inc)]
+    if not increments:
+        return
+    try:
+        collection.bulk_write(
+            [
+                UpdateOne(
+                    {**key, "claims": {"$ne": claim_id}},
+                    {
+                        "$inc": inc,
+                        "$push": {
+                            "claims": {
+                                "$each": [claim_id],
+                                "$slice": -COUNT_CLAIM_HISTORY,
+                            }
+                        },
+                    },
+                    upsert=True,
+                )
+                for key, inc in increments
+            ],
+            ordered=False,
+        )
+    except BulkWriteError as e:
+        # Дубликат по уникальному индексу агрегата: пачка в нём уже учтена
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+
+
+def _claim_answers(field, claim_id, limit, storage):
+    if (storage or RESPONSES_STORAGE) == "per_survey":
+        ids = [
+            doc["_id"]
+            for doc in survey_responses_collection.find(
+                {f"answers.{field}": False}, {"_id": 1}
+            ).limit(limit)
+        ]
+        if ids:
+            survey_responses_collection.update_many(
+                {"_id": {"$in": ids}},
+                {"$set": {f"answers.$[answer].{field}": claim_id}},
+                array_filters=[{f"answer.{field}": False}],
+            )
+        return
+    ids = [
+        doc["_id"]
+        for doc in responses_collection.find({field: False}, {"_id": 1}).limit(limit)
+    ]
+    if ids:
+        responses_collection.update_many(
+            {"_id": {"$in": ids}, field: False}, {"$set": {field: claim_id}}
+        )
+
+
+def _stale_claims(field, storage):
+    # Пачки, не завершённые за COUNT_LEASE: процесс упал между шагами
+    stale = ObjectId.from_datetime(datetime.datetime.utcnow() - COUNT_LEASE)
+    if (storage or RESPONSES_STORAGE) == "per_survey":
+        claims = survey_responses_collection.distinct(
+            f"answers.{field}",
+            {f"answers.{field}": {"$type": "objectId", "$lt": stale}},
+        )
+    else:
+        claims = responses_collection.distinct(
+            field, {field: {"$type": "objectId", "$lt": stale}}
+        )
+    return sorted(
+        claim for claim in claims if isinstance(claim, ObjectId) and claim < stale
+    )
+
+
+def _claimed_answers(field, claim_id, storage):
+    if (storage or RESPONSES_STORAGE) == "per_survey":
+        pipeline = _per_survey_answers_pipeline({f"answers.{field}": claim_id})
+        pipeline.append({"$match": {field: claim_id}})
+        return list(survey_responses_collection.aggregate(pipeline))
+    return list(
+        responses_collection.find(
+            {field: claim_id},
+            {
+                "survey_template_id": 1,
+                "question": 1,
+                "answer": 1,
+                "type": 1,
+                "nlp.lemmas": 1,
+            },
+        )
+    )
+
+
+def _unmark_answers(field, claim_id, storage):
+    if (storage or RESPONSES_STORAGE) == "per_survey":
+        survey_responses_collection.update_many(
+            {f"answers.{field}": claim_id},
+            {"$unset": {f"answers.$[answer].{field}": ""}},
+            array_filters=[{f"answer.{field}": claim_id}],
+        )
+    else:
+        responses_collection.update_many({field: claim_id}, {"$unset": {field: ""}})
+
+
+def _count_answers(field, inc, limit, storage):
+    # Досчитывает прерванные пачки и до limit новых ответов с отметкой field.
+    # Возвращает число учтённых ответов.
+    claims = _stale_claims(field, storage)
+    claim_id = ObjectId()
+    _claim_answers(field, claim_id, limit, storage)
+    counted = 0
+    for claim_id in claims + [claim_id]:
+        answers = _claimed_answers(field, claim_id, storage)
+        if answers:
+            inc(answers, claim_id)
+            _unmark_answers(field, claim_id, storage)
+            counted += len(answers)
+    return counted
+
+
+def _inc_csi_stats(responses, claim_id):
+    # Агрегаты CSI по вопросу опроса: count, sum, sum_sq и гистограмма 1..5.
+    # Ответы пачки сначала суммируются, на вопрос уходит один $inc.
+    totals = {}
+    for response in responses:
+        if response["type"] != "csi":
+            continue
+        answer = int(response["answer"])
+        key = (response["survey_template_id"], response["question"])
+        inc = totals.setdefault(key, collections.Counter())
+        inc["count"] += 1
+        inc["sum"] += answer
+        inc["sum_sq"] += answer * answer
+        inc[f"hist.{answer}"] += 1
+    _inc_once(
+        csi_stats_collection,
+        [
+            (
+                {"survey_template_id": survey_template_id, "question": question},
+                dict(inc),
+            )
+            for (survey_template_id, question), inc in totals.items()
+        ],
+        claim_id,
+    )
+
+
+def count_csi_answers(limit=10000, storage=None):
+    return _count_answers("csi_counted", _inc_csi_stats, limit, storage)
+
+
+def save_responses(responses, storage=None):
+    # Каждый ответ на вопрос записывается один раз. Ответы CSI попадают
+    # в csi_stats через count_csi_answers, который заодно досчитывает ответы,
+    # не учтённые из-за прошлых сбоев, поэтому сбой после записи и повторная
+    # запись пачки не искажают агрегаты. Переданные словари не изменяются.
+    # Возвращает ответы, которые действительно были записаны.
+    responses = [
+        (
+            {**response, "csi_counted": False}
+            if response["type"] == "csi"
+            else dict(response)
+        )
+        for response in responses
+    ]
+    if (storage or RESPONSES_STORAGE) == "per_survey":
+        saved = _save_responses_per_survey(responses)
+    else:
+        saved = _save_responses_per_question(responses)
+    count_csi_answers(storage=storage)
+    return saved
+
+
 def save_response(response_data):
-    responses_collection.insert_one(response_data)
+    return bool(save_responses([response_data]))
+
+
+def _per_survey_answers_pipeline(match):
+    return [
+        {"$match": match},
+        {"$unwind": "$answers"},
+        {
+            "$project": {
+                "_id": 0,
+                "user_id": 1,
+                "assigned_survey_id": "$_id",
+                "survey_template_id": 1,
+                "question_index": "$answers.question_index",
+                "question": "$answers.question",
+                "answer": "$answers.answer",
+                "type": "$answers.type",
+                "nlp": "$answers.nlp",
+                "csi_counted": "$answers.csi_counted",
+                "terms_counted": "$answers.terms_counted",
+                "answered_at": "$answers.answered_at",
+                "updated_at": 1,
+            }
+        },
+    ]
+
+
+def _flat_responses(survey_match, answer_match, storage=None):
+    # Коллекция и начало конвейера, который в обоих режимах хранения
+    # возвращает ответы в формате per_question
+    if (storage or RESPONSES_STORAGE) == "per_survey":
+        pipeline = _per_survey_answers_pipeline(survey_match)
+        if answer_match:
+            pipeline.append({"$match": answer_match})
+        return survey_responses_collection, pipeline
+    return responses_collection, [{"$match": {**survey_match, **answer_match}}]
+
+
+def get_survey_responses(survey_id, response_type=None, storage=None):
+    answer_match = {"type": response_type} if response_type else {}
+    collection, pipeline = _flat_responses(
+        {"survey_template_id": ObjectId(survey_id)}, answer_match, storage
+    )
+    return list(collection.aggregate(pipeline))
+
+
+def iter_survey_responses(
+    survey_id=None, since=None, until=None, batch_size=1000, storage=None
+):
+    # Потоковое чтение ответов в формате per_question за интервал [since, until)
+    # по времени записи: для per_question это время создания из _id (с точностью
+    # до секунды), для per_survey — answered_at ответа. Индексированный
+    # updated_at документа опроса (время последнего ответа) отбирает документы,
+    # а ранее выгруженные ответы тех же опросов отсекаются по answered_at.
+    # У ответов, записанных до появления answered_at, время записи — updated_at.
+    survey_match = {"survey_template_id": ObjectId(survey_id)} if survey_id else {}
+    if (storage or RESPONSES_STORAGE) == "per_survey":
+        time_range = {}
+        if since:
+            time_range["$gte"] = since
+        if until:
+            time_range["$lt"] = until
+        if since:
+            # updated_at документа не меньше answered_at любого его ответа
+            survey_match["updated_at"] = {"$gte": since}
+        pipeline = _per_survey_answers_pipeline(survey_match)
+        pipeline.insert(1, {"$sort": {"updated_at": ASCENDING, "_id": ASCENDING}})
+        pipeline += [
+            {"$set": {"recorded_at": {"$ifNull": ["$answered_at", "$updated_at"]}}},
+            {"$project": {"answered_at": 0, "updated_at": 0}},
+        ]
+        if time_range:
+            pipeline.append({"$match": {"recorded_at": time_range}})
+        yield from survey_responses_collection.aggregate(
+            pipeline, batchSize=batch_size, allowDiskUse=True
+        )
+        return
+
+    id_range = {}
+    if since:
+        id_range["$gte"] = ObjectId.from_datetime(since)
+    if until:
+        id_range["$lt"] = ObjectId.from_datetime(until)
+    if id_range:
+        survey_match["_id"] = id_range
+    cursor = (
+        responses_collection.find(survey_match, {"nlp": 0})
+        .sort("_id", ASCENDING)
+        .batch_size(batch_size)
+    )
+    for doc in cursor:
+        doc["recorded_at"] = doc["_id"].generation_time.replace(tzinfo=None)
+        yield doc
+
+
+def get_export_watermark(name):
+    export = exports_collection.find_one({"_id": name})
+    return export["until"] if export else None
+
+
+def save_export_watermark(name, until, rows):
+    exports_collection.update_one(
+        {"_id": name},
+        {
+            "$set": {
+                "until": until,
+                "rows": rows,
+                "exported_at": datetime.datetime.utcnow(),
+            }
+        },
+        upsert=True,
+    )
+
+
+def get_csi_results(survey_id, storage=None):
+    # Статистика CSI по вопросам и гистограмма считаются на стороне MongoDB,
+    # клиенту возвращаются только агрегаты
+    collection, pipeline = _flat_responses(
+        {"survey_template_id": ObjectId(survey_id)}, {"type": "csi"}, storage
+    )
+    pipeline += [
+        {"$project": {"_id": 0, "question": 1, "answer": {"$toInt": "$answer"}}},
+        {
+            "$facet": {
+                "questions": [
+                    {
+                        "$group": {
+                            "_id": "$question",
+                            "mean": {"$avg": "$answer"},
+                            "std": {"$stdDevSamp": "$answer"},
+                            "count": {"$sum": 1},
+                        }
+                    },
+                    {
+                        "$project": {
+                            "_id": 0,
+                            "question": "$_id",
+                            "mean": 1,
+                            "std": 1,
+                            "count": 1,
+                        }
+                    },
+                    {"$sort": {"question": 1}},
+                ],
+                "histogram": [
+                    {
+                        "$bucket": {
+                            "groupBy": "$answer",
+                            "boundaries": [1, 2, 3, 4, 5, 6],
+                            "default": "other",
+                            "output": {"count": {"$sum": 1}},
+                        }
+                    }
+                ],
+            }
+        },
+    ]
+    result = next(collection.aggregate(pipeline, allowDiskUse=True))
+    return {
+        "questions": result["questions"],
+        "histogram": {bucket["_id"]: bucket["count"] for bucket in result["histogram"]},
+    }
+
+
+# Поля агрегатов csi_stats без служебного массива claims: он нужен только для
+# идемпотентного подсчёта и может содержать до тысячи ObjectId
+CSI_STATS_FIELDS = {
+    "_id": 0,
+    "question": 1,
+    "count": 1,
+    "sum": 1,
+    "sum_sq": 1,
+    "hist": 1,
+}
 
 
-def get_survey_responses(survey_id):
-    return list(responses_collection.find({"survey_template_id": ObjectId(survey_id)}))
+def get_csi_stats(survey_id):
+    # Вопросы в том же порядке, что и у get_csi_results (индекс uniq_question)
+    return list(
+        csi_stats_collection.find(
+            {"survey_template_id": ObjectId(survey_id)}, CSI_STATS_FIELDS
+        ).sort("question", ASCENDING)
+    )
+
+
+def _csi_stats_pipeline(storage=None):
+    # Те же агрегаты, что поддерживает _inc_csi_stats, но по сырым ответам,
+    # уже учтённым в csi_stats (остальные досчитает count_csi_answers)
+    collection, pipeline = _flat_responses(
+        {}, {"type": "csi", "csi_counted": {"$exists": False}}, storage
+    )
+    pipeline += [
+        {
+            "$group": {
+                "_id": {
+                    "survey_template_id": "$survey_template_id",
+                    "question": "$question",
+                    "answer": {"$toInt": "$answer"},
+                },
+                "n": {"$sum": 1},
+            }
+        },
+        {
+            "$group": {
+                "_id": {
+                    "survey_template_id": "$_id.survey_template_id",
+                    "question": "$_id.question",
+                },
+                "count": {"$sum": "$n"},
+                "sum": {"$sum": {"$multiply": ["$_id.answer", "$n"]}},
+                "sum_sq": {
+                    "$sum": {"$multiply": ["$_id.answer", "$_id.answer", "$n"]}
+                },
+                "hist": {"$push": {"k": {"$toString": "$_id.answer"}, "v": "$n"}},
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "survey_template_id": "$_id.survey_template_id",
+                "question": "$_id.question",
+                "count": 1,
+                "sum": 1,
+                "sum_sq": 1,
+                "hist": {"$arrayToObject": "$hist"},
+            }
+        },
+    ]
+    return collection, pipeline
+
+
+def rebuild_csi_stats(storage=None):
+    # Пересчитывает csi_stats по сырым ответам и атомарно заменяет коллекцию
+    # ($out сохраняет её индексы). Ответы, записанные во время пересчёта,
+    # могут не попасть в результат — check_csi_stats это покажет.
+    collection, pipeline = _csi_stats_pipeline(storage)
+    collection.aggregate(
+        pipeline + [{"$out": csi_stats_collection.name}], allowDiskUse=True
+    )
+
+
+def check_csi_stats(storage=None):
+    # Сверяет csi_stats с агрегатами по сырым ответам, возвращает расхождения
+    collection, pipeline = _csi_stats_pipeline(storage)
+    expected = {
+        (doc["survey_template_id"], doc["question"]): doc
+        for doc in collection.aggregate(pipeline, allowDiskUse=True)
+    }
+    actual = {
+        (doc["survey_template_id"], doc["question"]): doc
+        for doc in csi_stats_collection.find(
+            {}, {**CSI_STATS_FIELDS, "survey_template_id": 1}
+        )
+    }
+    fields = ["count", "sum", "sum_sq", "hist"]
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        expected_values = {f: expected.get(key, {}).get(f) for f in fields}
+        actual_values = {f: actual.get(key, {}).get(f) for f in fields}
+        if expected_values != actual_values:
+            mismatches.append(
+                {
+                    "survey_template_id": key[0],
+                    "question": key[1],
+                    "expected": expected_values,
+                    "actual": actual_values,
+                }
+            )
+    return mismatches
+
+
+# Анализ открытых ответов (text_analytics.py): результат хранится в поле nlp
+# рядом с ответом, частоты нормальных форм слов по опросу — в term_counts
+def get_unprocessed_open_answers(limit, storage=None):
+    if (storage or RESPONSES_STORAGE) == "per_survey":
+        pipeline = _per_survey_answers_pipeline(
+            {"answers": {"$elemMatch": {"type": "open", "nlp.processed_at": None}}}
+        )
+        pipeline += [
+            {"$match": {"type": "open", "nlp": {"$exists": False}}},
+            {"$limit": limit},
+        ]
+        return list(survey_responses_collection.aggregate(pipeline))
+    return list(
+        responses_collection.find({"type": "open", "nlp.processed_at": None}).limit(
+            limit
+        )
+    )
+
+
+def _answer_analysis_update(response, analysis, storage):
+    # Результат записывается, только если ответ ещё не обработан
+    if (storage or RESPONSES_STORAGE) == "per_survey":
+        return UpdateOne(
+            {"_id": response["assigned_survey_id"]},
+            {
+                "$set": {
+                    "answers.$[answer].nlp": analysis,
+                    "answers.$[answer].terms_counted": False,
+                }
+            },
+            array_filters=[
+                {
+                    "answer.question_index": response["question_index"],
+                    "answer.question": response["question"],
+                    "answer.nlp": {"$exists": False},
+                }
+            ],
+        )
+    return UpdateOne(
+        {"_id": response["_id"], "nlp": {"$exists": False}},
+        {"$set": {"nlp": analysis, "terms_counted": False}},
+    )
+
+
+def _inc_term_counts(responses, claim_id):
+    terms = collections.Counter(
+        (response["survey_template_id"], lemma)
+        for response in responses
+        for lemma in response["nlp"]["lemmas"]
+    )
+    _inc_once(
+        term_counts_collection,
+        [
+            ({"survey_template_id": survey_template_id, "term": term}, {"count": count})
+            for (survey_template_id, term), count in terms.items()
+        ],
+        claim_id,
+    )
+
+
+def count_term_answers(limit=10000, storage=None):
+    return _count_answers("terms_counted", _inc_term_counts, limit, storage)
+
+
+def save_answer_analyses(items, storage=None):
+    # items: [(ответ, результат анализа)]. Результаты пачки записываются одним
+    # bulk_write с отметкой terms_counted: False, а в term_counts их переносит
+    # count_term_answers, поэтому сбой между шагами не теряет частоты, а
+    # повторная обработка их не завышает. Возвращает число записанных результатов.
+    if not items:
+        return 0
+    collection = (
+        survey_responses_collection
+        if (storage or RESPONSES_STORAGE) == "per_survey"
+        else responses_collection
+    )
+    result = collection.bulk_write(
+        [
+            _answer_analysis_update(response, analysis, storage)
+            for response, analysis in items
+        ],
+        ordered=False,
+    )
+    count_term_answers(storage=storage)
+    return result.modified_count
+
+
+def get_top_terms(survey_id, limit=10):
+    return list(
+        term_counts_collection.find(
+            {"survey_template_id": ObjectId(survey_id)},
+            {"_id": 0, "term": 1, "count": 1},
+        )
+        .sort("count", -1)
+        .limit(limit)
+    )
+
+
+def iter_open_answer_sentiments(survey_id, batch_size=1000, storage=None):
+    # Оценки тональности открытых ответов курсором по batch_size документов;
+    # для ещё не обработанных ответов возвращается None
+    collection, pipeline = _flat_responses(
+        {"survey_template_id": ObjectId(survey_id)}, {"type": "open"}, storage
+    )
+    pipeline.append({"$project": {"_id": 0, "sentiment": "$nlp.sentiment"}})
+    for doc in collection.aggregate(pipeline, batchSize=batch_size):
+        yield doc.get("sentiment")
+
+
+def rebuild_term_counts(storage=None):
+    # Пересчитывает term_counts по сохранённым результатам анализа ответов,
+    # уже учтённым в term_counts (остальные досчитает count_term_answers)
+    collection, pipeline = _flat_responses(
+        {}, {"type": "open", "terms_counted": {"$exists": False}}, storage
+    )
+    pipeline += [
+        {"$unwind": "$nlp.lemmas"},
+        {
+            "$group": {
+                "_id": {
+                    "survey_template_id": "$survey_template_id",
+                    "term": "$nlp.lemmas",
+                },
+                "count": {"$sum": 1},
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "survey_template_id": "$_id.survey_template_id",
+                "term": "$_id.term",
+                "count": 1,
+            }
+        },
+        {"$out": term_counts_collection.name},
+    ]
+    collection.aggregate(pipeline, allowDiskUse=True)
+
+
+# Постоянный кэш нормальных форм слов для анализа ответов
+def get_lemmas(words):
+    return {
+        doc["_id"]: doc["lemma"]
+        for doc in lemmas_collection.find({"_id": {"$in": list(words)}})
+    }
+
+
+def save_lemmas(lemmas):
+    try:
+        lemmas_collection.insert_many(
+            [{"_id": word, "lemma": lemma} for word, lemma in lemmas.items()],
+            ordered=False,
+        )
+    except BulkWriteError as e:
+        # Слово уже сохранила другая сессия
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
 
 
 # Функции для работы с расписанием опросов
@@ -172,21 +1065,349 @@ def get_scheduled_surveys():
     return scheduled_surveys
 
 
-def schedule_survey(user_id, survey_template_id, schedule_data):
-    scheduled_surveys_collection.insert_one(
-        {
-            "user_id": user_id,
-            "survey_template_id": ObjectId(survey_template_id),
-            "schedule": schedule_data,  # Данные о расписании (например, частота, дата начала)
-            "next_run": schedule_data["start_date"],
-        }
+def count_scheduled_surveys():
+    return scheduled_surveys_collection.count_documents({})
+
+
+def get_scheduled_surveys_page(page, page_size):
+    # Страница расписаний с названиями опросов и именами пользователей:
+    # три запроса на страницу вместо двух на каждую строку
+    scheduled_surveys = list(
+        scheduled_surveys_collection.find(
+            {},
+            {
+                "user_id": 1,
+                "status_name": 1,
+                "survey_template_id": 1,
+                "schedule": 1,
+                "next_run": 1,
+            },
+        )
+        .sort("_id", ASCENDING)
+        .skip(page * page_size)
+        .limit(page_size)
+    )
+    titles = get_survey_titles(
+        list({survey["survey_template_id"] for survey in scheduled_surveys})
+    )
+    names = get_user_full_names(
+        list(
+            {survey["user_id"] for survey in scheduled_surveys if "user_id" in survey}
+        )
     )
+    for survey in scheduled_surveys:
+        survey["survey_title"] = titles[survey["survey_template_id"]]
+        if "status_name" in survey:
+            survey["user"] = f"Статус: {survey['status_name']}"
+        else:
+            survey["user"] = names[survey["user_id"]]
+        survey["survey_template_id"] = str(survey["survey_template_id"])
+    return scheduled_surveys
+
+
+# Расписание назначается либо пользователю (user_id), либо статусу
+# (status_name): строка статуса разворачивается в пользователей в момент
+# отправки. Повторное расписание того же опроса для того же пользователя
+# или статуса отсекают уникальные индексы uniq_user_schedule и
+# uniq_status_schedule.
+def _insert_schedules(documents):
+    try:
+        scheduled_surveys_collection.insert_many(documents, ordered=False)
+        return len(documents), 0
+    except BulkWriteError as e:
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+        skipped = len(e.details["writeErrors"])
+        return len(documents) - skipped, skipped
+
+
+def iter_schedule_survey_for_users(
+    user_ids, survey_template_id, schedule_data, chunk_size=ASSIGNMENT_CHUNK_SIZE
+):
+    # Вставляет расписания пачками и после каждой пачки возвращает
+    # накопленные счётчики, чтобы вызывающий мог показывать прогресс
+    survey_template_id = ObjectId(survey_template_id)
+    next_run = recurrence.first_run(schedule_data)
+    inserted = skipped = 0
+    documents = []
+    for user_id in user_ids:
+        documents.append(
+            {
+                "user_id": user_id,
+                "survey_template_id": survey_template_id,
+                "schedule": schedule_data,  # Данные о расписании (например, частота, дата начала)
+                "next_run": next_run,
+            }
+        )
+        if len(documents) >= chunk_size:
+            chunk_inserted, chunk_skipped = _insert_schedules(documents)
+            inserted += chunk_inserted
+            skipped += chunk_skipped
+            documents = []
+            yield {"inserted": inserted, "skipped": skipped}
+    if documents:
+        chunk_inserted, chunk_skipped = _insert_schedules(documents)
+        inserted += chunk_inserted
+        skipped += chunk_skipped
+        yield {"inserted": inserted, "skipped": skipped}
+
+
+def schedule_survey_for_users(user_ids, survey_template_id, schedule_data):
+    result = {"inserted": 0, "skipped": 0}
+    for result in iter_schedule_survey_for_users(
+        user_ids, survey_template_id, schedule_data
+    ):
+        pass
+    return result
+
+
+def schedule_survey(user_id, survey_template_id, schedule_data):
+    return schedule_survey_for_users([user_id], survey_template_id, schedule_data)
+
+
+def schedule_survey_for_status(status_name, survey_template_id, schedule_data):
+    # Возвращает False, если у статуса уже есть расписание этого опроса
+    try:
+        scheduled_surveys_collection.insert_one(
+            {
+                "status_name": status_name,
+                "survey_template_id": ObjectId(survey_template_id),
+                "schedule": schedule_data,
+                "next_run": recurrence.first_run(schedule_data),
+            }
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def claim_due_scheduled_surveys(now, limit, lease_seconds):
+    # Индексный запрос по next_run. Каждая строка захватывается атомарно: next_run
+    # сдвигается на время аренды, поэтому другая реплика её уже не увидит, а если
+    # обработка не завершится, строка снова станет due после окончания аренды.
+    # Возвращаются документы в состоянии до захвата.
+    lease_until = now + datetime.timedelta(seconds=lease_seconds)
+    claimed = []
+    while len(claimed) < limit:
+        scheduled_survey = scheduled_surveys_collection.find_one_and_update(
+            {"next_run": {"$lte": now}},
+            {"$set": {"next_run": lease_until, "claimed_at": now}},
+            sort=[("next_run", ASCENDING)],
+            return_document=ReturnDocument.BEFORE,
+        )
+        if scheduled_survey is None:
+            break
+        claimed.append(scheduled_survey)
+    return claimed
 
 
 def update_scheduled_survey(scheduled_survey_id, next_run):
     scheduled_surveys_collection.update_one(
         {"_id": scheduled_survey_id},
-        {"$set": {"next_run": next_run}},
+        {"$set": {"next_run": next_run}, "$unset": {"claimed_at": ""}},
+    )
+
+
+# Функции для работы с очередью исходящих сообщений
+def enqueue_messages(chat_ids, text, source, chunk_size=ASSIGNMENT_CHUNK_SIZE):
+    now = datetime.datetime.utcnow()
+    enqueued = 0
+    messages = []
+    for chat_id in chat_ids:
+        messages.append(
+            {
+                "chat_id": chat_id,
+                "text": text,
+                "source": source,
+                "status": "pending",
+                "attempts": 0,
+                "created_at": now,
+                "next_attempt_at": now,
+            }
+        )
+        if len(messages) >= chunk_size:
+            enqueued += len(outbox_collection.insert_many(messages).inserted_ids)
+            messages = []
+    if messages:
+        enqueued += len(outbox_collection.insert_many(messages).inserted_ids)
+    return enqueued
+
+
+def claim_outbox_messages(now, limit, lease_seconds):
+    # Захват пачки: кандидаты выбираются по индексу, а update_many повторно
+    # проверяет условие, так что сообщение достаётся только одному процессу.
+    # Сообщение в статусе sending, не отправленное до конца аренды, снова доступно.
+    due = {"status": {"$in": ["pending", "sending"]}, "next_attempt_at": {"$lte": now}}
+    candidate_ids = [
+        message["_id"]
+        for message in outbox_collection.find(due, {"_id": 1})
+        .sort("next_attempt_at", ASCENDING)
+        .limit(limit)
+    ]
+    if not candidate_ids:
+        return []
+    claim_id = ObjectId()
+    outbox_collection.update_many(
+        {"_id": {"$in": candidate_ids}, **due},
+        {
+            "$set": {
+                "status": "sending",
+                "claim_id": claim_id,
+                "next_attempt_at": now + datetime.timedelta(seconds=lease_seconds),
+            }
+        },
+    )
+    return list(outbox_collection.find({"claim_id": claim_id}))
+
+
+def extend_outbox_lease(message_ids, claim_ids, until):
+    # Продлевает аренду сообщений, которые всё ещё захвачены одним из claim_ids
+    # (сообщение, аренда которого истекла и которое захватил другой процесс,
+    # не продлевается). Более длинная аренда не сокращается.
+    # Возвращает число сообщений, захват которых подтверждён.
+    result = outbox_collection.update_many(
+        {
+            "_id": {"$in": list(message_ids)},
+            "claim_id": {"$in": list(claim_ids)},
+            "status": "sending",
+        },
+        {"$max": {"next_attempt_at": until}},
+    )
+    return result.matched_count
+
+
+def release_outbox_messages(message_ids, claim_ids):
+    # Возвращает в очередь захваченные, но не отправленные сообщения
+    outbox_collection.update_many(
+        {
+            "_id": {"$in": list(message_ids)},
+            "claim_id": {"$in": list(claim_ids)},
+            "status": "sending",
+        },
+        {
+            "$set": {"status": "pending", "next_attempt_at": datetime.datetime.utcnow()},
+            "$unset": {"claim_id": ""},
+        },
+    )
+
+
+def mark_message_sent(message_id, claim_id):
+    # Статус меняет только процесс, который держит захват сообщения.
+    # Возвращает False, если захват уже перешёл к другому процессу.
+    result = outbox_collection.update_one(
+        {"_id": message_id, "claim_id": claim_id},
+        {
+            "$set": {"status": "sent", "sent_at": datetime.datetime.utcnow()},
+            "$inc": {"attempts": 1},
+            "$unset": {"claim_id": "", "next_attempt_at": ""},
+        },
+    )
+    return result.modified_count > 0
+
+
+def mark_message_failed(message_id, claim_id, error, retry_at=None):
+    # retry_at=None — ошибка окончательная, иначе сообщение вернётся в очередь
+    update = {
+        "$set": {"last_error": error},
+        "$inc": {"attempts": 1},
+        "$unset": {"claim_id": ""},
+    }
+    if retry_at is None:
+        update["$set"]["status"] = "failed"
+        update["$unset"]["next_attempt_at"] = ""
+    else:
+        update["$set"].update({"status": "pending", "next_attempt_at": retry_at})
+    result = outbox_collection.update_one(
+        {"_id": message_id, "claim_id": claim_id}, update
+    )
+    return result.modified_count > 0
+
+
+def acquire_lock(name, owner, lease_seconds):
+    # Захватывает или продлевает именованную аренду. Возвращает True, если
+    # аренда принадлежит owner; чужая аренда освобождается только по истечении.
+    now = datetime.datetime.utcnow()
+    try:
+        locks_collection.update_one(
+            {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lte": now}}]},
+            {
+                "$set": {
+                    "owner": owner,
+                    "expires_at": now + datetime.timedelta(seconds=lease_seconds),
+                }
+            },
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def release_lock(name, owner):
+    locks_collection.delete_one({"_id": name, "owner": owner})
+
+
+def migrate_responses_to_per_survey():
+    # Переносит ответы из responses в survey_responses на стороне сервера.
+    # Идемпотентна: ответы, уже перенесённые в документ опроса, не дублируются.
+    # Исходные документы не удаляются.
+    responses_collection.aggregate(
+        [
+            {"$match": {"assigned_survey_id": {"$exists": True}}},
+            {"$sort": {"assigned_survey_id": 1, "question_index": 1, "_id": 1}},
+            {
+                "$group": {
+                    "_id": "$assigned_survey_id",
+                    "user_id": {"$first": "$user_id"},
+                    "survey_template_id": {"$first": "$survey_template_id"},
+                    "answers": {
+                        "$push": {
+                            "question_index": {"$ifNull": ["$question_index", None]},
+                            "question": "$question",
+                            "answer": "$answer",
+                            "type": "$type",
+                            "answered_at": {"$toDate": "$_id"},
+                            "csi_counted": "$csi_counted",
+                            "nlp": "$nlp",
+                            "terms_counted": "$terms_counted",
+                        }
+                    },
+                }
+            },
+            {"$set": {"updated_at": "$$NOW"}},
+            {
+                "$merge": {
+                    "into": survey_responses_collection.name,
+                    "on": "_id",
+                    "whenMatched": [
+                        {
+                            "$set": {
+                                "answers": {
+                                    "$concatArrays": [
+                                        "$answers",
+                                        {
+                                            "$filter": {
+                                                "input": "$$new.answers",
+                                                "cond": {
+                                                    "$not": {
+                                                        "$in": [
+                                                            "$$this.question_index",
+                                                            "$answers.question_index",
+                                                        ]
+                                                    }
+                                                },
+                                            }
+                                        },
+                                    ]
+                                }
+                            }
+                        }
+                    ],
+                    "whenNotMatched": "insert",
+                }
+            },
+        ],
+        allowDiskUse=True,
     )
 
 
@@ -195,7 +1416,3 @@ def add_status_to_existing_users():
         {"status": {"$exists": False}}, {"$set": {"status": "default"}}
     )
 
-
-if __name__ == "__main__":
-    add_status_to_existing_users()
-    print("All existing users have been updated with a default status.")
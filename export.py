@@ -0,0 +1,168 @@
+# export.py
+
+# Потоковая выгрузка ответов на опросы в CSV или Parquet.
+# Ответы читаются курсором пачками и сразу дописываются в файл, поэтому память
+# не зависит от объёма выгрузки. Файл пишется во временный и переименовывается
+# только после успешного завершения.
+# Запуск: python export.py responses.parquet [--survey-id ID] [--since 2024-01-01]
+# [--until 2024-02-01] [--incremental NAME]
+
+import argparse
+import csv
+import datetime
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import db
+
+COLUMNS = [
+    "assigned_survey_id",
+    "survey_template_id",
+    "user_id",
+    "question_index",
+    "question",
+    "type",
+    "answer",
+    "recorded_at",
+]
+
+PARQUET_SCHEMA = pa.schema(
+    [
+        ("assigned_survey_id", pa.string()),
+        ("survey_template_id", pa.string()),
+        ("user_id", pa.int64()),
+        ("question_index", pa.int64()),
+        ("question", pa.string()),
+        ("type", pa.string()),
+        # CSI-ответы — числа, открытые — текст, поэтому колонка строковая
+        ("answer", pa.string()),
+        ("recorded_at", pa.timestamp("ms")),
+    ]
+)
+
+# Запас до текущего момента для инкрементальной выгрузки: ответ, записанный
+# с чуть отстающими часами, попадёт в следующую выгрузку, а не потеряется
+WATERMARK_LAG = datetime.timedelta(minutes=1)
+
+
+def _row(response):
+    row = {column: response.get(column) for column in COLUMNS}
+    for column in ("assigned_survey_id", "survey_template_id", "answer"):
+        if row[column] is not None:
+            row[column] = str(row[column])
+    return row
+
+
+def _batches(responses, batch_size):
+    batch = []
+    for response in responses:
+        batch.append(_row(response))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_csv(responses, path, batch_size):
+    rows = 0
+    with open(path, "w", newline="", encoding="utf-8") as output:
+        writer = csv.DictWriter(output, fieldnames=COLUMNS)
+        writer.writeheader()
+        for batch in _batches(responses, batch_size):
+            writer.writerows(batch)
+            rows += len(batch)
+    return rows
+
+
+def write_parquet(responses, path, batch_size):
+    # Каждая пачка становится отдельной группой строк файла
+    rows = 0
+    with pq.ParquetWriter(path, PARQUET_SCHEMA, compression="zstd") as writer:
+        for batch in _batches(responses, batch_size):
+            writer.write_table(pa.Table.from_pylist(batch, schema=PARQUET_SCHEMA))
+            rows += len(batch)
+    return rows
+
+
+WRITERS = {"csv": write_csv, "parquet": write_parquet}
+
+
+def export_responses(
+    path,
+    file_format,
+    survey_id=None,
+    since=None,
+    until=None,
+    incremental=None,
+    batch_size=50000,
+):
+    # incremental — имя выгрузки: since берётся из сохранённой отметки
+    # предыдущей выгрузки с тем же именем, а until по умолчанию — текущий
+    # момент за вычетом WATERMARK_LAG. Отметка сохраняется после записи файла.
+    if incremental:
+        since = db.get_export_watermark(incremental) or since
+        if until is None:
+            until = (datetime.datetime.utcnow() - WATERMARK_LAG).replace(microsecond=0)
+    responses = db.iter_survey_responses(
+        survey_id, since, until, batch_size=min(batch_size, 10000)
+    )
+    temp_path = f"{path}.tmp"
+    try:
+        rows = WRITERS[file_format](responses, temp_path, batch_size)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, path)
+    if incremental:
+        db.save_export_watermark(incremental, until, rows)
+    return rows
+
+
+def _datetime(value):
+    # Дата или дата и время в UTC, например 2024-01-01 или 2024-01-01T09:00
+    return datetime.datetime.fromisoformat(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Выгрузка ответов SurveyBot")
+    parser.add_argument("output", help="путь к файлу .csv или .parquet")
+    parser.add_argument("--format", choices=list(WRITERS), help="формат файла")
+    parser.add_argument("--survey-id", help="выгрузить только этот опрос")
+    parser.add_argument("--since", type=_datetime, help="начало интервала (UTC)")
+    parser.add_argument("--until", type=_datetime, help="конец интервала (UTC)")
+    parser.add_argument(
+        "--incremental",
+        metavar="NAME",
+        help="выгрузить только ответы, записанные после предыдущей выгрузки NAME",
+    )
+    parser.add_argument("--batch-size", type=int, default=50000)
+    args = parser.parse_args()
+
+    file_format = args.format or os.path.splitext(args.output)[1].lstrip(".")
+    if file_format not in WRITERS:
+        parser.error("укажите --format или расширение файла .csv/.parquet")
+
+    started = time.monotonic()
+    rows = export_responses(
+        args.output,
+        file_format,
+        survey_id=args.survey_id,
+        since=args.since,
+        until=args.until,
+        incremental=args.incremental,
+        batch_size=args.batch_size,
+    )
+    duration = time.monotonic() - started
+    print(
+        f"Выгружено ответов: {rows} в {args.output} за {duration:.1f} сек. "
+        f"({rows / duration if duration else 0:.0f} строк/сек.)"
+    )
+
+
+if __name__ == "__main__":
+    main()
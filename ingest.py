@@ -0,0 +1,235 @@
+# ingest.py
+
+# Пакетная запись ответов на опросы.
+# Ответ сначала дописывается в локальный spool-файл (с fsync) и только после
+# этого подтверждается пользователю, а в MongoDB ответы уходят пачками через
+# save_responses по размеру пачки или по таймеру. Spool-файл удаляется только
+# после успешной записи пачки, поэтому при падении процесса ответы будут
+# дописаны в базу при следующем запуске. Повторная запись безопасна:
+# save_responses не записывает ответ на один вопрос дважды.
+# С файлами spool работает отдельный поток записи: ответы, пришедшие, пока
+# идёт fsync, дописываются следующей группой с одним fsync на всю группу.
+
+import asyncio
+import bisect
+import collections
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bson import json_util
+from pymongo.errors import ConnectionFailure
+
+from async_db import save_responses
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+
+    def snapshot(self):
+        labels = [f"<={bound}" for bound in self.bounds] + [f">{self.bounds[-1]}"]
+        return dict(zip(labels, self.counts))
+
+
+class ResponseIngestor:
+    def __init__(self, spool_dir, max_batch=500, flush_interval=1.0, max_attempts=5):
+        self.spool_dir = spool_dir
+        self.quarantine_dir = os.path.join(spool_dir, "quarantine")
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        # Сколько раз пачка может не записаться из-за ошибки данных, прежде
+        # чем её ответы будут записаны по одному, а неудачные — в карантин.
+        # Недоступность MongoDB попыткой не считается.
+        self.max_attempts = max_attempts
+        self.flush_latency_ms = Histogram([5, 10, 25, 50, 100, 250, 500, 1000])
+        self.batch_size = Histogram([1, 10, 50, 100, 250, 500, 1000])
+        self.group_size = Histogram([1, 2, 5, 10, 25, 50, 100])
+        # Буфер и текущий сегмент spool меняются только в потоке записи,
+        # поэтому ответ не может попасть в сегмент, удалённый после записи пачки
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spool")
+        self._buffer = []
+        self._segment = None
+        # Ответы, ожидающие записи в spool: [(ответ, future)]
+        self._pending = []
+        self._commit_task = None
+        # Пачки, которые не удалось записать: [(путь сегмента, ответы)]
+        self._unflushed = []
+        self._failures = collections.Counter()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._pending_flushes = set()
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, func, *args)
+
+    def _open_segment(self):
+        path = os.path.join(self.spool_dir, f"responses-{time.time_ns()}.jsonl")
+        self._segment = open(path, "a", encoding="utf-8")
+
+    def _recover(self):
+        # Сегменты, оставшиеся после падения процесса
+        os.makedirs(self.spool_dir, exist_ok=True)
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith(".jsonl"):
+                continue
+            path = os.path.join(self.spool_dir, name)
+            responses = []
+            with open(path, encoding="utf-8") as segment:
+                for line in segment:
+                    try:
+                        responses.append(json_util.loads(line))
+                    except ValueError:
+                        # Недописанная строка: ответ не был подтверждён пользователю
+                        logger.warning(f"Пропущена повреждённая строка в {path}")
+            self._unflushed.append((path, responses))
+        self._open_segment()
+
+    async def start(self):
+        await self._run(self._recover)
+        if self._unflushed:
+            logger.info(f"Найдено незаписанных сегментов ответов: {len(self._unflushed)}")
+        await self.flush()
+        self._task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.flush()
+        await self._run(self._close)
+        self._writer.shutdown()
+
+    def _close(self):
+        self._segment.close()
+        if not self._buffer:
+            os.remove(self._segment.name)
+
+    def _append(self, responses):
+        self._segment.write("".join(json_util.dumps(r) + "\n" for r in responses))
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+        self._buffer.extend(responses)
+        return len(self._buffer)
+
+    async def _commit(self):
+        # Групповая запись: всё, что накопилось за время предыдущего fsync,
+        # дописывается одним вызовом _append
+        while self._pending:
+            group, self._pending = self._pending, []
+            self.group_size.observe(len(group))
+            try:
+                buffered = await self._run(
+                    self._append, [response for response, _ in group]
+                )
+            except Exception as e:
+                for _, future in group:
+                    future.set_exception(e)
+            else:
+                for _, future in group:
+                    future.set_result(buffered)
+
+    async def submit(self, response):
+        # После возврата ответ сохранён на диске
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((response, future))
+        if self._commit_task is None or self._commit_task.done():
+            self._commit_task = asyncio.create_task(self._commit())
+        buffered = await future
+        if buffered >= self.max_batch:
+            task = asyncio.create_task(self.flush())
+            self._pending_flushes.add(task)
+            task.add_done_callback(self._pending_flushes.discard)
+
+    def _rotate(self):
+        if not self._buffer:
+            return None
+        path, responses = self._segment.name, self._buffer
+        self._segment.close()
+        self._buffer = []
+        self._open_segment()
+        return path, responses
+
+    def _write_quarantine(self, path, responses):
+        os.makedirs(self.quarantine_dir, exist_ok=True)
+        quarantine_path = os.path.join(self.quarantine_dir, os.path.basename(path))
+        with open(quarantine_path, "w", encoding="utf-8") as output:
+            output.write("".join(json_util.dumps(r) + "\n" for r in responses))
+            output.flush()
+            os.fsync(output.fileno())
+        return quarantine_path
+
+    async def _quarantine(self, path, responses):
+        # Ответы пачки записываются по одному, чтобы один неверный ответ
+        # не задерживал остальные; неудачные сохраняются в quarantine_dir
+        rejected = []
+        for response in responses:
+            try:
+                await save_responses([response])
+            except ConnectionFailure:
+                raise
+            except Exception:
+                logger.exception(f"Ответ не записан: {response}")
+                rejected.append(response)
+        if rejected:
+            quarantine_path = await self._run(self._write_quarantine, path, rejected)
+            logger.error(
+                f"Ответов перенесено в карантин: {len(rejected)} из {len(responses)}, "
+                f"файл {quarantine_path}"
+            )
+
+    async def flush(self):
+        async with self._flush_lock:
+            batch = await self._run(self._rotate)
+            if batch is not None:
+                self._unflushed.append(batch)
+            while self._unflushed:
+                path, responses = self._unflushed[0]
+                started = time.monotonic()
+                try:
+                    if responses:
+                        await save_responses(responses)
+                except ConnectionFailure:
+                    logger.warning("MongoDB недоступна, запись ответов позже")
+                    return
+                except Exception:
+                    self._failures[path] += 1
+                    if self._failures[path] < self.max_attempts:
+                        logger.exception("Ошибка при записи ответов, повтор позже")
+                        return
+                    logger.exception(
+                        f"Пачка {path} не записана за {self.max_attempts} попыток"
+                    )
+                    try:
+                        await self._quarantine(path, responses)
+                    except ConnectionFailure:
+                        logger.warning("MongoDB недоступна, запись ответов позже")
+                        return
+                else:
+                    self.flush_latency_ms.observe((time.monotonic() - started) * 1000)
+                    self.batch_size.observe(len(responses))
+                await self._run(os.remove, path)
+                self._failures.pop(path, None)
+                self._unflushed.pop(0)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def stats(self):
+        return {
+            "flush_latency_ms": self.flush_latency_ms.snapshot(),
+            "batch_size": self.batch_size.snapshot(),
+            "spool_group_size": self.group_size.snapshot(),
+            "buffered": len(self._buffer),
+            "unflushed_batches": len(self._unflushed),
+        }
@@ -0,0 +1,520 @@
+# migrations.py
+
+# Индексы и миграции базы данных.
+# Запускается при старте бота или вручную: python migrations.py [--explain]
+# [--migrate-responses] [--storage-report] [--rebuild-csi-stats] [--check-csi-stats]
+# [--rebuild-term-counts]
+
+import argparse
+import datetime
+import re
+import time
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+import db
+
+# Каждый индекс описан вместе с функциями db.py, запросы которых он обслуживает
+INDEXES = [
+    {
+        "collection": "users",
+        "keys": [("user_id", ASCENDING)],
+        "options": {"name": "user_id"},
+        "serves": [
+            "get_user_by_id",
+            "get_user_full_name",
+            "update_user_status",
+            "get_users_page",
+            "search_users",
+        ],
+    },
+    {
+        "collection": "users",
+        "keys": [("first_name", ASCENDING)],
+        "options": {"name": "first_name"},
+        "serves": ["search_users"],
+    },
+    {
+        "collection": "users",
+        "keys": [("last_name", ASCENDING)],
+        "options": {"name": "last_name"},
+        "serves": ["search_users"],
+    },
+    {
+        "collection": "users",
+        "keys": [("status", ASCENDING), ("user_id", ASCENDING)],
+        "options": {"name": "status_user_id"},
+        "serves": [
+            "get_users_by_status",
+            "assign_survey_to_status",
+            "get_users_page",
+            "count_users",
+        ],
+    },
+    {
+        # Частичный индекс покрывает и выборку открытых назначений
+        # {user_id, completed: False}, отдельный индекс по completed не нужен
+        "collection": "surveys",
+        "keys": [("user_id", ASCENDING), ("survey_template_id", ASCENDING)],
+        "options": {
+            "name": "uniq_open_assignment",
+            "unique": True,
+            "partialFilterExpression": {"completed": False},
+        },
+        "serves": [
+            "get_user_surveys",
+            "assign_survey_to_user",
+            "assign_survey_to_users",
+            "assign_survey_to_status",
+            "update_user_status",
+        ],
+    },
+    {
+        # Заменяет прежний индекс survey_template_id: тот же префикс плюс
+        # диапазон по _id (времени создания) для выгрузки
+        "collection": "responses",
+        "keys": [("survey_template_id", ASCENDING), ("_id", ASCENDING)],
+        "options": {"name": "survey_template_id_id"},
+        "serves": ["get_survey_responses", "iter_survey_responses"],
+    },
+    {
+        # Один ответ на вопрос назначенного опроса; у старых ответов
+        # question_index нет, поэтому индекс частичный
+        "collection": "responses",
+        "keys": [("assigned_survey_id", ASCENDING), ("question_index", ASCENDING)],
+        "options": {
+            "name": "uniq_answer",
+            "unique": True,
+            "partialFilterExpression": {"question_index": {"$exists": True}},
+        },
+        "serves": ["save_responses"],
+    },
+    {
+        # Ответы без поля nlp: сравнение nlp.processed_at с null использует индекс
+        "collection": "responses",
+        "keys": [("type", ASCENDING), ("nlp.processed_at", ASCENDING)],
+        "options": {"name": "open_unprocessed"},
+        "serves": ["get_unprocessed_open_answers"],
+    },
+    {
+        # Только ответы CSI, ещё не учтённые в csi_stats
+        "collection": "responses",
+        "keys": [("csi_counted", ASCENDING)],
+        "options": {
+            "name": "csi_uncounted",
+            "partialFilterExpression": {"csi_counted": {"$exists": True}},
+        },
+        "serves": ["count_csi_answers"],
+    },
+    {
+        # Только ответы, анализ которых ещё не учтён в term_counts
+        "collection": "responses",
+        "keys": [("terms_counted", ASCENDING)],
+        "options": {
+            "name": "terms_uncounted",
+            "partialFilterExpression": {"terms_counted": {"$exists": True}},
+        },
+        "serves": ["count_term_answers"],
+    },
+    {
+        # Заменяет прежний индекс survey_template_id
+        "collection": "survey_responses",
+        "keys": [("survey_template_id", ASCENDING), ("updated_at", ASCENDING)],
+        "options": {"name": "survey_template_id_updated_at"},
+        "serves": ["get_survey_responses", "iter_survey_responses"],
+    },
+    {
+        "collection": "survey_responses",
+        "keys": [("updated_at", ASCENDING)],
+        "options": {"name": "updated_at"},
+        "serves": ["iter_survey_responses"],
+    },
+    {
+        "collection": "survey_responses",
+        "keys": [("answers.type", ASCENDING), ("answers.nlp.processed_at", ASCENDING)],
+        "options": {"name": "open_unprocessed"},
+        "serves": ["get_unprocessed_open_answers"],
+    },
+    {
+        "collection": "survey_responses",
+        "keys": [("answers.csi_counted", ASCENDING)],
+        "options": {
+            "name": "csi_uncounted",
+            "partialFilterExpression": {"answers.csi_counted": {"$exists": True}},
+        },
+        "serves": ["count_csi_answers"],
+    },
+    {
+        "collection": "survey_responses",
+        "keys": [("answers.terms_counted", ASCENDING)],
+        "options": {
+            "name": "terms_uncounted",
+            "partialFilterExpression": {"answers.terms_counted": {"$exists": True}},
+        },
+        "serves": ["count_term_answers"],
+    },
+    {
+        "collection": "term_counts",
+        "keys": [("survey_template_id", ASCENDING), ("term", ASCENDING)],
+        "options": {"name": "uniq_term", "unique": True},
+        "serves": ["count_term_answers"],
+    },
+    {
+        "collection": "term_counts",
+        "keys": [("survey_template_id", ASCENDING), ("count", DESCENDING)],
+        "options": {"name": "top_terms"},
+        "serves": ["get_top_terms"],
+    },
+    {
+        "collection": "csi_stats",
+        "keys": [("survey_template_id", ASCENDING), ("question", ASCENDING)],
+        "options": {"name": "uniq_question", "unique": True},
+        "serves": ["count_csi_answers", "get_csi_stats"],
+    },
+    {
+        "collection": "survey_status",
+        "keys": [("status_name", ASCENDING), ("survey_template_id", ASCENDING)],
+        "options": {"name": "status_name_survey_template_id"},
+        "serves": [
+            "get_surveys_for_status",
+            "assign_survey_to_status",
+            "update_user_status",
+        ],
+    },
+    {
+        "collection": "statuses",
+        "keys": [("name", ASCENDING)],
+        "options": {"name": "uniq_name", "unique": True},
+        "serves": ["create_status"],
+    },
+    {
+        "collection": "scheduled_surveys",
+        "keys": [("user_id", ASCENDING), ("survey_template_id", ASCENDING)],
+        "options": {
+            "name": "uniq_user_schedule",
+            "unique": True,
+            "partialFilterExpression": {"user_id": {"$exists": True}},
+        },
+        "serves": ["schedule_survey_for_users"],
+    },
+    {
+        "collection": "scheduled_surveys",
+        "keys": [("status_name", ASCENDING), ("survey_template_id", ASCENDING)],
+        "options": {
+            "name": "uniq_status_schedule",
+            "unique": True,
+            "partialFilterExpression": {"status_name": {"$exists": True}},
+        },
+        "serves": ["schedule_survey_for_status"],
+    },
+    {
+        "collection": "scheduled_surveys",
+        "keys": [("next_run", ASCENDING)],
+        "options": {"name": "next_run"},
+        "serves": ["claim_due_scheduled_surveys"],
+    },
+    {
+        "collection": "outbox",
+        "keys": [("status", ASCENDING), ("next_attempt_at", ASCENDING)],
+        "options": {"name": "status_next_attempt_at"},
+        "serves": ["claim_outbox_messages"],
+    },
+    {
+        "collection": "outbox",
+        "keys": [("claim_id", ASCENDING)],
+        "options": {"name": "claim_id", "sparse": True},
+        "serves": ["claim_outbox_messages"],
+    },
+    {
+        "collection": "bot_persistence",
+        "keys": [("kind", ASCENDING)],
+        "options": {"name": "kind"},
+        "serves": ["MongoPersistence (persistence.py)"],
+    },
+]
+
+# Индексы, которые заменены индексами из INDEXES с тем же префиксом ключей.
+# ensure_indexes удаляет их после того, как замена создана.
+OBSOLETE_INDEXES = [
+    {"collection": "users", "index": "status", "replaced_by": "status_user_id"},
+    {
+        "collection": "responses",
+        "index": "survey_template_id",
+        "replaced_by": "survey_template_id_id",
+    },
+    {
+        "collection": "survey_responses",
+        "index": "survey_template_id",
+        "replaced_by": "survey_template_id_updated_at",
+    },
+]
+
+# Горячие запросы, для которых --explain проверяет отсутствие COLLSCAN
+HOT_QUERIES = [
+    ("users", {"user_id": 0}, None),
+    ("users", {"status": "default"}, None),
+    ("users", {"first_name": re.compile("^Ив")}, None),
+    ("surveys", {"user_id": 0, "completed": False}, None),
+    (
+        "surveys",
+        {"user_id": 0, "survey_template_id": ObjectId(), "completed": False},
+        None,
+    ),
+    ("responses", {"survey_template_id": ObjectId()}, None),
+    ("survey_responses", {"survey_template_id": ObjectId()}, None),
+    ("survey_status", {"status_name": "default"}, None),
+    ("statuses", {"name": "default"}, None),
+    (
+        "scheduled_surveys",
+        {"next_run": {"$lte": datetime.datetime.utcnow()}},
+        [("next_run", ASCENDING)],
+    ),
+    (
+        "outbox",
+        {
+            "status": {"$in": ["pending", "sending"]},
+            "next_attempt_at": {"$lte": datetime.datetime.utcnow()},
+        },
+        [("next_attempt_at", ASCENDING)],
+    ),
+]
+
+
+def ensure_indexes(rebuild=False):
+    # Идемпотентно: существующие индексы пропускаются. При конфликте опций индекс
+    # пересоздаётся только с rebuild=True, иначе конфликт попадает в отчёт.
+    # Устаревшие индексы удаляются, только если их замена уже есть.
+    report = []
+    for spec in INDEXES:
+        collection = db.db[spec["collection"]]
+        name = spec["options"]["name"]
+        existing = collection.index_information()
+        try:
+            collection.create_index(spec["keys"], **spec["options"])
+            state = "exists" if name in existing else "created"
+        except OperationFailure as e:
+            if e.code in (85, 86) and rebuild:
+                collection.drop_index(name)
+                collection.create_index(spec["keys"], **spec["options"])
+                state = "rebuilt"
+            else:
+                state = f"error: {e}"
+        report.append(
+            {
+                "collection": spec["collection"],
+                "index": name,
+                "state": state,
+                "serves": spec["serves"],
+            }
+        )
+    ready = {
+        (item["collection"], item["index"])
+        for item in report
+        if item["state"] in ("exists", "created", "rebuilt")
+    }
+    for obsolete in OBSOLETE_INDEXES:
+        collection = db.db[obsolete["collection"]]
+        if obsolete["index"] not in collection.index_information():
+            continue
+        if (obsolete["collection"], obsolete["replaced_by"]) not in ready:
+            continue
+        collection.drop_index(obsolete["index"])
+        report.append(
+            {
+                "collection": obsolete["collection"],
+                "index": obsolete["index"],
+                "state": f"dropped (заменён {obsolete['replaced_by']})",
+                "serves": [],
+            }
+        )
+    return report
+
+
+# Миграции данных выполняются один раз, отметка хранится в коллекции migrations
+MIGRATIONS = [
+    ("add_status_to_existing_users", db.add_status_to_existing_users),
+    ("build_csi_stats", db.rebuild_csi_stats),
+]
+
+
+def run_migrations():
+    applied = []
+    migrations_collection = db.db["migrations"]
+    for name, migration in MIGRATIONS:
+        if migrations_collection.find_one({"_id": name}):
+            continue
+        migration()
+        migrations_collection.insert_one(
+            {"_id": name, "applied_at": datetime.datetime.utcnow()}
+        )
+        applied.append(name)
+    return applied
+
+
+def _collection_size(name):
+    stats = db.db.command("collStats", name)
+    return {
+        "count": stats.get("count", 0),
+        "size": stats.get("size", 0),
+        "storage_size": stats.get("storageSize", 0),
+        "index_size": stats.get("totalIndexSize", 0),
+    }
+
+
+def _read_latency_ms(survey_id, storage, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.monotonic()
+        db.get_survey_responses(survey_id, storage=storage)
+        timings.append((time.monotonic() - started) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def storage_report(repeat=5):
+    # Сравнение размера коллекций и медианного времени чтения ответов на опрос
+    # в двух режимах хранения. Осмысленно после --migrate-responses.
+    report = {
+        "per_question": _collection_size(db.responses_collection.name),
+        "per_survey": _collection_size(db.survey_responses_collection.name),
+        "latency_ms": [],
+    }
+    for template in db.survey_templates_collection.find({}, {"_id": 1}):
+        survey_id = str(template["_id"])
+        report["latency_ms"].append(
+            {
+                "survey_template_id": survey_id,
+                "per_question": _read_latency_ms(survey_id, "per_question", repeat),
+                "per_survey": _read_latency_ms(survey_id, "per_survey", repeat),
+            }
+        )
+    return report
+
+
+def _plan_stages(plan):
+    stages = [plan.get("stage")]
+    if "inputStage" in plan:
+        stages += _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+
+def explain_hot_queries():
+    results = []
+    for collection_name, query, sort in HOT_QUERIES:
+        cursor = db.db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        stages = _plan_stages(plan.get("queryPlan", plan))
+        results.append(
+            {
+                "collection": collection_name,
+                "query": query,
+                "stages": stages,
+                "collscan": "COLLSCAN" in stages,
+            }
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Индексы и миграции SurveyBot")
+    parser.add_argument(
+        "--rebuild", action="store_true", help="пересоздать конфликтующие индексы"
+    )
+    parser.add_argument(
+        "--explain",
+        action="store_true",
+        help="проверить планы горячих запросов на отсутствие COLLSCAN",
+    )
+    parser.add_argument(
+        "--migrate-responses",
+        action="store_true",
+        help="перенести ответы из responses в survey_responses (документ на опрос)",
+    )
+    parser.add_argument(
+        "--storage-report",
+        action="store_true",
+        help="сравнить размер и скорость чтения двух режимов хранения ответов",
+    )
+    parser.add_argument(
+        "--rebuild-csi-stats",
+        action="store_true",
+        help="пересчитать csi_stats по сырым ответам",
+    )
+    parser.add_argument(
+        "--check-csi-stats",
+        action="store_true",
+        help="сверить csi_stats с сырыми ответами",
+    )
+    parser.add_argument(
+        "--rebuild-term-counts",
+        action="store_true",
+        help="пересчитать term_counts по результатам анализа ответов",
+    )
+    args = parser.parse_args()
+
+    for item in ensure_indexes(rebuild=args.rebuild):
+        print(
+            f"{item['collection']}.{item['index']}: {item['state']} "
+            f"(обслуживает: {', '.join(item['serves'])})"
+        )
+    for name in run_migrations():
+        print(f"Миграция выполнена: {name}")
+
+    if args.migrate_responses:
+        started = time.monotonic()
+        db.migrate_responses_to_per_survey()
+        print(f"Ответы перенесены за {time.monotonic() - started:.1f} сек.")
+
+    if args.storage_report:
+        report = storage_report()
+        for storage in ("per_question", "per_survey"):
+            size = report[storage]
+            print(
+                f"{storage}: документов {size['count']}, данные {size['size']} байт, "
+                f"на диске {size['storage_size']} байт, индексы {size['index_size']} байт"
+            )
+        for item in report["latency_ms"]:
+            print(
+                f"{item['survey_template_id']}: per_question "
+                f"{item['per_question']:.1f} мс, per_survey {item['per_survey']:.1f} мс"
+            )
+
+    if args.rebuild_csi_stats:
+        started = time.monotonic()
+        db.rebuild_csi_stats()
+        print(f"csi_stats пересчитана за {time.monotonic() - started:.1f} сек.")
+
+    if args.check_csi_stats:
+        mismatches = db.check_csi_stats()
+        for item in mismatches:
+            print(
+                f"[MISMATCH] {item['survey_template_id']} {item['question']!r}: "
+                f"ожидалось {item['expected']}, в csi_stats {item['actual']}"
+            )
+        print(f"Расхождений в csi_stats: {len(mismatches)}")
+        if mismatches:
+            raise SystemExit(1)
+
+    if args.rebuild_term_counts:
+        started = time.monotonic()
+        db.rebuild_term_counts()
+        print(f"term_counts пересчитана за {time.monotonic() - started:.1f} сек.")
+
+    if args.explain:
+        failed = False
+        for item in explain_hot_queries():
+            status = "COLLSCAN" if item["collscan"] else "OK"
+            print(f"[{status}] {item['collection']} {item['query']}: {item['stages']}")
+            failed = failed or item["collscan"]
+        if failed:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
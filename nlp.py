@@ -0,0 +1,158 @@
+# nlp.py
+
+# NLP-ресурсы для анализа открытых ответов (text_analytics.py).
+# Данные NLTK скачиваются при сборке образа, а стоп-слова, словари pymorphy2,
+# лемматизатор и анализатор тональности загружаются один раз на процесс.
+
+import functools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import nltk
+import pymorphy2
+from nltk.corpus import stopwords
+from nltk.sentiment import SentimentIntensityAnalyzer
+
+from config import LEMMA_CACHE_SIZE
+from db import get_lemmas, save_lemmas
+
+logger = logging.getLogger(__name__)
+
+# (путь в nltk.data, пакет для nltk.download)
+NLTK_RESOURCES = [
+    ("tokenizers/punkt", "punkt"),
+    ("tokenizers/punkt_tab", "punkt_tab"),
+    ("corpora/stopwords", "stopwords"),
+    ("sentiment/vader_lexicon.zip", "vader_lexicon"),
+]
+
+# Время холодной загрузки ресурсов в этом процессе, сек.
+load_times = {}
+
+
+def _timed(name):
+    def decorator(load):
+        @functools.wraps(load)
+        def wrapper():
+            started = time.perf_counter()
+            value = load()
+            load_times[name] = time.perf_counter() - started
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+@functools.cache
+@_timed("nltk_data")
+def ensure_nltk_data():
+    # В образе данные уже есть; при локальном запуске без них скачиваем один раз
+    for path, package in NLTK_RESOURCES:
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            logger.warning(f"Данные NLTK {package} не найдены, скачиваем")
+            nltk.download(package, quiet=True)
+
+
+@functools.cache
+@_timed("stopwords")
+def load_stop_words():
+    ensure_nltk_data()
+    return frozenset(stopwords.words("russian"))
+
+
+@functools.cache
+@_timed("morph_analyzer")
+def load_morph_analyzer():
+    return pymorphy2.MorphAnalyzer()
+
+
+@functools.cache
+@_timed("sentiment_analyzer")
+def load_sentiment_analyzer():
+    ensure_nltk_data()
+    return SentimentIntensityAnalyzer()
+
+
+class Lemmatizer:
+    # Нормальные формы слов с кэшированием: ограниченный LRU в памяти процесса
+    # и постоянный кэш в коллекции lemmas, общий для всех процессов.
+    # pymorphy2 разбирает только слова, которых нет ни в одном из кэшей,
+    # и каждое слово пачки — один раз.
+
+    def __init__(self, morph, maxsize=100000, load=None, save=None):
+        self.morph = morph
+        self.maxsize = maxsize
+        self.load = load  # load(words) -> {word: lemma}
+        self.save = save  # save({word: lemma})
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.tokens = 0
+        self.lookups = 0
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.parsed = 0
+        self.seconds = 0.0
+
+    def lemmatize_many(self, words):
+        started = time.perf_counter()
+        found, missing = {}, []
+        with self._lock:
+            for word in dict.fromkeys(words):
+                lemma = self._entries.get(word)
+                if lemma is None:
+                    missing.append(word)
+                else:
+                    self._entries.move_to_end(word)
+                    found[word] = lemma
+        memory_hits = len(found)
+
+        stored = self.load(missing) if missing and self.load else {}
+        parsed = {
+            word: self.morph.parse(word)[0].normal_form
+            for word in missing
+            if word not in stored
+        }
+        if parsed and self.save:
+            self.save(parsed)
+        found.update(stored)
+        found.update(parsed)
+
+        with self._lock:
+            for word in missing:
+                self._entries[word] = found[word]
+                self._entries.move_to_end(word)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self.tokens += len(words)
+            self.lookups += memory_hits + len(missing)
+            self.memory_hits += memory_hits
+            self.store_hits += len(stored)
+            self.parsed += len(parsed)
+            self.seconds += time.perf_counter() - started
+        return [found[word] for word in words]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.lookups or 1
+            return {
+                "size": len(self._entries),
+                "tokens": self.tokens,
+                "unique_words": self.lookups,
+                "memory_hit_rate": self.memory_hits / lookups,
+                "hit_rate": (self.memory_hits + self.store_hits) / lookups,
+                "parsed": self.parsed,
+                "tokens_per_second": self.tokens / self.seconds if self.seconds else 0.0,
+            }
+
+
+@functools.cache
+@_timed("lemmatizer")
+def load_lemmatizer():
+    return Lemmatizer(
+        load_morph_analyzer(), LEMMA_CACHE_SIZE, load=get_lemmas, save=save_lemmas
+    )
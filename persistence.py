@@ -0,0 +1,196 @@
+# persistence.py
+
+# Хранение user_data бота в MongoDB, чтобы перезапуск не обрывал регистрацию
+# и прохождение опросов. chat_data и bot_data бот не использует и не хранит.
+# Application сам собирает изменённые данные и вызывает update_* раз в
+# update_interval секунд. Здесь изменения лишь копятся в _pending и
+# записываются одним bulk_write на следующей итерации цикла событий, так что
+# на каждое сообщение пользователя синхронной записи в базу нет.
+# Несколько реплик бота: у каждого документа есть version. Перед обработкой
+# обновления refresh_user_data перечитывает документ, если другая реплика
+# записала более новую версию, а запись заменяет документ, только если его
+# версия не изменилась с момента чтения. Если обе реплики изменили данные
+# пользователя за update_interval, остаётся версия, записанная первой, и она
+# же загружается в память при следующем обновлении.
+
+import asyncio
+import datetime
+import logging
+import time
+
+from pymongo import DeleteOne, ReplaceOne
+from pymongo.errors import BulkWriteError
+from telegram.ext import BasePersistence, PersistenceInput
+
+from async_db import run_in_executor
+
+logger = logging.getLogger(__name__)
+
+
+class MongoPersistence(BasePersistence):
+    def __init__(self, collection, update_interval=60):
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, callback_data=False
+            ),
+            update_interval=update_interval,
+        )
+        self.collection = collection
+        # Версии документов, прочитанные или записанные этим процессом;
+        # -1 — версия неизвестна, документ перечитывается при обновлении
+        self._versions = {}
+        self._pending = {}
+        self._flushing = set()
+        self._flush_task = None
+        self.conflicts = 0
+
+    async def _load(self, kind):
+        documents = await run_in_executor(
+            lambda: list(self.collection.find({"kind": kind}))
+        )
+        for doc in documents:
+            self._versions[doc["_id"]] = doc.get("version", 0)
+        return documents
+
+    def _write(self, kind, key, data):
+        # data=None — удаление документа
+        self._pending[f"{kind}:{key}"] = (kind, key, data)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush())
+
+    def _operation(self, _id, kind, key, data, version, now):
+        if data is None:
+            return DeleteOne({"_id": _id})
+        # Документ без version записан до появления версий и считается версией 0.
+        # Если версия уже другая, upsert завершится ошибкой дубликата _id.
+        return ReplaceOne(
+            {"_id": _id, "version": version or None},
+            {
+                "kind": kind,
+                "key": key,
+                "data": data,
+                "version": version + 1,
+                "updated_at": now,
+            },
+            upsert=True,
+        )
+
+    async def _flush(self):
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        now = datetime.datetime.utcnow()
+        ids = list(pending)
+        versions = [max(self._versions.get(_id, 0), 0) for _id in ids]
+        operations = [
+            self._operation(_id, kind, key, data, version, now)
+            for (_id, (kind, key, data)), version in zip(pending.items(), versions)
+        ]
+        self._flushing.update(ids)
+        started = time.monotonic()
+        try:
+            await run_in_executor(self.collection.bulk_write, operations, ordered=False)
+            conflicts = set()
+        except BulkWriteError as e:
+            errors = e.details["writeErrors"]
+            if any(error["code"] != 11000 for error in errors):
+                self._retry_later(pending)
+                return
+            conflicts = {ids[error["index"]] for error in errors}
+        except Exception:
+            self._retry_later(pending)
+            return
+        finally:
+            self._flushing.difference_update(ids)
+        for _id, version in zip(ids, versions):
+            if _id in conflicts:
+                # Документ изменила другая реплика: её версия остаётся в базе
+                # и будет загружена при следующем обновлении пользователя
+                self._versions[_id] = -1
+            elif pending[_id][2] is None:
+                self._versions.pop(_id, None)
+            else:
+                self._versions[_id] = version + 1
+        if conflicts:
+            self.conflicts += len(conflicts)
+            logger.warning(
+                "Состояние изменено другой репликой, запись пропущена: "
+                f"{sorted(conflicts)}"
+            )
+        logger.debug(
+            f"Состояние бота сохранено: {len(operations)} документов "
+            f"за {time.monotonic() - started:.3f} сек."
+        )
+
+    def _retry_later(self, pending):
+        logger.exception("Ошибка при сохранении состояния бота")
+        # Вернём изменения в очередь, если их не перекрыли более новые
+        for _id, value in pending.items():
+            self._pending.setdefault(_id, value)
+
+    async def get_user_data(self):
+        return {doc["key"]: doc["data"] for doc in await self._load("user_data")}
+
+    async def get_chat_data(self):
+        return {doc["key"]: doc["data"] for doc in await self._load("chat_data")}
+
+    async def get_bot_data(self):
+        documents = await self._load("bot_data")
+        return documents[0]["data"] if documents else {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {
+            tuple(doc["key"]): doc["data"]
+            for doc in await self._load(f"conversation:{name}")
+        }
+
+    async def update_conversation(self, name, key, new_state):
+        self._write(f"conversation:{name}", list(key), new_state)
+
+    async def update_user_data(self, user_id, data):
+        self._write("user_data", user_id, data)
+
+    async def update_chat_data(self, chat_id, data):
+        self._write("chat_data", chat_id, data)
+
+    async def update_bot_data(self, data):
+        self._write("bot_data", 0, data)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        self._write("user_data", user_id, None)
+
+    async def drop_chat_data(self, chat_id):
+        self._write("chat_data", chat_id, None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        # Один запрос по _id; документ возвращается, только если его записала
+        # другая реплика. Пока изменения этого процесса не записаны, они новее.
+        _id = f"user_data:{user_id}"
+        if _id in self._pending or _id in self._flushing:
+            return
+        doc = await run_in_executor(
+            self.collection.find_one,
+            {"_id": _id, "version": {"$gt": self._versions.get(_id, 0)}},
+        )
+        if doc is not None:
+            user_data.clear()
+            user_data.update(doc["data"])
+            self._versions[_id] = doc["version"]
+
+    # chat_data и bot_data не хранятся (store_data), перечитывать нечего
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        if self._flush_task is not None:
+            await self._flush_task
+        await self._flush()
@@ -0,0 +1,165 @@
+# recurrence.py
+
+# Вычисление next_run для расписаний опросов.
+# Время в базе хранится в UTC без tzinfo, а повторения считаются по "настенному"
+# времени часового пояса расписания, поэтому переход на летнее время не сдвигает
+# отправку. Каждое повторение отсчитывается от start_date, а не от предыдущего
+# запуска, так что расписание не дрейфует.
+
+import calendar
+import datetime
+from zoneinfo import ZoneInfo
+
+from apscheduler.triggers.cron import CronTrigger
+
+from config import DEFAULT_TIMEZONE
+
+DAILY = "Ежедневно"
+WEEKLY = "Еженедельно"
+MONTHLY = "Ежемесячно"
+CRON = "Cron"
+FREQUENCIES = [DAILY, WEEKLY, MONTHLY, CRON]
+
+# Политика догоняющих запусков после простоя: в обоих случаях пропущенные
+# повторения не отправляются пачкой. "coalesce" отправляет опрос один раз,
+# "skip" не отправляет, если запуск опоздал больше чем на misfire_grace.
+COALESCE = "coalesce"
+SKIP = "skip"
+CATCH_UP_POLICIES = [COALESCE, SKIP]
+
+
+# В crontab воскресенье — 0 или 7, а в APScheduler дни недели нумеруются с
+# понедельника (0 — понедельник), поэтому поле дня недели раскрывается в явный
+# список номеров APScheduler. Шаги APScheduler для названий дней не
+# поддерживает, а диапазон через воскресенье (0-3) в его нумерации разрывается.
+_WEEKDAYS = ["sun", "mon", "tue", "wed", "thu", "fri", "sat"]
+
+
+def _crontab_day(value):
+    day = _WEEKDAYS.index(value) if value in _WEEKDAYS else int(value)
+    if not 0 <= day <= 7:
+        raise ValueError(f"Неверный день недели: {value!r}")
+    return day
+
+
+def _cron_day_of_week(field):
+    if field == "*":
+        return field
+    days = set()
+    for item in field.lower().split(","):
+        item, _, step = item.partition("/")
+        if item == "*":
+            first, last = 0, 6
+        elif "-" in item:
+            first, last = (_crontab_day(value) for value in item.split("-", 1))
+        else:
+            first = _crontab_day(item)
+            last = 7 if step else first
+        if last < first or (step and int(step) < 1):
+            raise ValueError(f"Неверный день недели: {field!r}")
+        days.update(range(first, last + 1, int(step or 1)))
+    return ",".join(str((day - 1) % 7) for day in sorted({day % 7 for day in days}))
+
+
+def _cron_trigger(expression, tz):
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError(f"Cron-выражение должно содержать 5 полей: {expression!r}")
+    minute, hour, day, month, day_of_week = fields
+    day_of_week = _cron_day_of_week(day_of_week)
+    return CronTrigger(
+        minute=minute,
+        hour=hour,
+        day=day,
+        month=month,
+        day_of_week=day_of_week,
+        timezone=tz,
+    )
+
+
+def _timezone(schedule_data):
+    return ZoneInfo(schedule_data.get("timezone") or DEFAULT_TIMEZONE)
+
+
+def _to_utc(local, tz):
+    return (
+        local.replace(tzinfo=tz)
+        .astimezone(datetime.timezone.utc)
+        .replace(tzinfo=None)
+    )
+
+
+def _add_months(value, months):
+    month_index = value.month - 1 + months
+    year = value.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+
+def _occurrence(start, frequency, index):
+    if frequency == DAILY:
+        return start + datetime.timedelta(days=index)
+    if frequency == WEEKLY:
+        return start + datetime.timedelta(weeks=index)
+    if frequency == MONTHLY:
+        return _add_months(start, index)
+    raise ValueError(f"Неизвестная частота: {frequency}")
+
+
+def _estimate_index(start, frequency, after):
+    # Оценка снизу номера повторения, чтобы не перебирать все с начала
+    if frequency == DAILY:
+        return max(0, (after - start).days - 1)
+    if frequency == WEEKLY:
+        return max(0, (after - start).days // 7 - 1)
+    return max(0, (after.year - start.year) * 12 + after.month - start.month - 1)
+
+
+def validate(schedule_data):
+    frequency = schedule_data.get("frequency")
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"Неизвестная частота: {frequency}")
+    if schedule_data.get("catch_up", COALESCE) not in CATCH_UP_POLICIES:
+        raise ValueError(f"Неизвестная политика: {schedule_data['catch_up']}")
+    tz = _timezone(schedule_data)
+    if frequency == CRON:
+        _cron_trigger(schedule_data.get("cron", ""), tz)
+
+
+def next_run_after(schedule_data, after):
+    # Первое повторение строго позже after (оба значения в UTC без tzinfo)
+    tz = _timezone(schedule_data)
+    start = schedule_data["start_date"]
+    frequency = schedule_data.get("frequency", DAILY)
+
+    if frequency == CRON:
+        trigger = _cron_trigger(schedule_data["cron"], tz)
+        earliest = max(
+            after.replace(tzinfo=datetime.timezone.utc)
+            + datetime.timedelta(microseconds=1),
+            start.replace(tzinfo=tz),
+        )
+        fire_time = trigger.get_next_fire_time(None, earliest)
+        return fire_time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    after_local = (
+        after.replace(tzinfo=datetime.timezone.utc).astimezone(tz).replace(tzinfo=None)
+    )
+    index = _estimate_index(start, frequency, after_local)
+    while True:
+        occurrence = _to_utc(_occurrence(start, frequency, index), tz)
+        if occurrence > after:
+            return occurrence
+        index += 1
+
+
+def first_run(schedule_data):
+    start = _to_utc(schedule_data["start_date"], _timezone(schedule_data))
+    return next_run_after(schedule_data, start - datetime.timedelta(microseconds=1))
+
+
+def should_fire(schedule_data, scheduled_run, now, misfire_grace):
+    if schedule_data.get("catch_up", COALESCE) == SKIP:
+        return now - scheduled_run <= misfire_grace
+    return True
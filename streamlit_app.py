@@ -1,44 +1,70 @@
 # streamlit_app.py
 
 import datetime
+import statistics
+import time
 from collections import Counter
 
 import matplotlib.pyplot as plt
-import nltk
 import numpy as np
 import pandas as pd
-import pymorphy2
 import streamlit as st
 from bson import ObjectId
-from nltk.corpus import stopwords
-from nltk.sentiment import SentimentIntensityAnalyzer
-from nltk.tokenize import word_tokenize
-from telegram import Bot
 from wordcloud import WordCloud
 
-from config import TELEGRAM_BOT_TOKEN
-from db import (  # Changed from 'db' to 'database'
+import recurrence
+from config import DEFAULT_TIMEZONE
+from dashboard_data import (
     assign_survey_to_status,
-    assign_survey_to_user,
+    count_scheduled_surveys,
+    count_users,
     create_status,
     create_survey_template,
-    get_all_users,
-    get_scheduled_surveys,
-    get_survey_responses,
+    get_scheduled_surveys_page,
     get_survey_templates,
-    get_survey_title,
     get_surveys_for_status,
-    get_user_full_name,
     get_user_statuses,
-    get_user_surveys,
-    get_users_by_status,
-    schedule_survey,
+    get_users_page,
+    iter_schedule_survey_for_users,
+    query_stats,
+    schedule_survey_for_status,
+    search_users,
     update_user_status,
 )
+from db import (  # Changed from 'db' to 'database'
+    enqueue_messages,
+    get_csi_results,
+    get_csi_stats,
+    get_top_terms,
+    get_user_ids_by_status,
+    get_user_surveys,
+    iter_open_answer_sentiments,
+)
+
+rerun_started = time.perf_counter()
 
-nltk.download("punkt_tab")
 
-bot = Bot(token=TELEGRAM_BOT_TOKEN)
+def select_user(key):
+    # Выбор пользователя через поиск в базе вместо списка всех пользователей
+    query = st.text_input(
+        "Найти пользователя (ID, имя или фамилия)", key=f"{key}_search"
+    )
+    users = search_users(query)
+    if not users:
+        if query:
+            st.write("Пользователи не найдены")
+        return None
+    user_options = {
+        f"{u.get('first_name', '')} {u.get('last_name', '')} (ID: {u['user_id']})": u[
+            "user_id"
+        ]
+        for u in users
+    }
+    selected_user = st.selectbox(
+        "Выберите пользователя", list(user_options.keys()), key=key
+    )
+    return user_options[selected_user]
+
 
 st.title("Панель администратора")
 
@@ -47,34 +73,38 @@ tabs = st.tabs(menu)
 
 with tabs[0]:
     st.header("Управление пользователями")
-    users = get_all_users()
-    user_df = pd.DataFrame(users)
-    required_columns = ["first_name", "last_name", "user_id", "status"]
-
-    # Reindex the DataFrame to include all required columns
-    user_df = user_df.reindex(columns=required_columns)
+    # Таблица читается постранично, из базы берутся только отображаемые поля
+    user_count = count_users()
+    page_size = st.selectbox(
+        "Пользователей на странице", [25, 50, 100], key="page_size"
+    )
+    page_count = max(1, -(-user_count // page_size))
+    page = st.number_input(
+        f"Страница (всего {page_count}, пользователей {user_count})",
+        min_value=1,
+        max_value=page_count,
+        value=1,
+        key="users_page",
+    )
+    user_df = pd.DataFrame(
+        get_users_page(page - 1, page_size),
+        columns=["first_name", "last_name", "user_id", "status"],
+    )
 
     # Fill missing values in 'status' with a default value
-    user_df["status"].fillna("unknown", inplace=True)
+    user_df["status"] = user_df["status"].fillna("unknown")
 
     if not user_df.empty:
-        user_df["Полное имя"] = user_df["first_name"] + " " + user_df["last_name"]
+        user_df["Полное имя"] = (
+            user_df["first_name"].fillna("") + " " + user_df["last_name"].fillna("")
+        )
         st.write(user_df[["Полное имя", "user_id", "status"]])
     else:
         st.write("Нет пользователей")
 
     # Управление статусами пользователей
     st.subheader("Изменить статус пользователя")
-    user_options = {
-        f"{u.get('first_name', '')} {u.get('last_name', '')} (ID: {u['user_id']})": u[
-            "user_id"
-        ]
-        for u in users
-    }
-    selected_user = st.selectbox(
-        "Выберите пользователя", list(user_options.keys()), key="пользователя"
-    )
-    selected_user_id = user_options[selected_user]
+    selected_user_id = select_user("пользователя")
 
     statuses = get_user_statuses()
     status_options = [status["name"] for status in statuses]
@@ -82,15 +112,19 @@ with tabs[0]:
         "Выберите новый статус", status_options, key="статус"
     )
 
-    if st.button("Обновить статус"):
-        update_user_status(selected_user_id, selected_status)
-        st.success(f"Статус пользователя обновлен на {selected_status}")
+    if st.button("Обновить статус", disabled=selected_user_id is None):
+        result = update_user_status(selected_user_id, selected_status)
+        st.success(
+            f"Статус пользователя обновлен на {selected_status}. "
+            f"Назначено опросов: {result['inserted']}, уже были назначены: {result['skipped']}"
+        )
         # Отправить сообщение пользователю
         assigned_surveys = get_user_surveys(selected_user_id)
         survey_titles = [survey["title"] for survey in assigned_surveys]
         message = f"Ваш статус изменен на {selected_status}. Вам назначены следующие опросы: {', '.join(survey_titles)}"
+        # Сообщение отправит бот из очереди рассылки
         try:
-            bot.send_message(chat_id=selected_user_id, text=message)
+            enqueue_messages([selected_user_id], message, "status_change")
         except Exception as e:
             st.error(f"Не удалось отправить сообщение пользователю: {e}")
 
@@ -186,97 +220,108 @@ with tabs[1]:
             "Выберите опрос", list(survey_options.keys()), key="опрос"
         )
         selected_survey_id = survey_options[selected_survey_title]
-        responses = get_survey_responses(selected_survey_id)
-
-        if responses:
-            df_responses = pd.DataFrame(responses)
-            csi_responses = df_responses[df_responses["type"] == "csi"]
-            open_responses = df_responses[df_responses["type"] == "open"]
+        selected_survey = next(
+            survey for survey in surveys if str(survey["_id"]) == selected_survey_id
+        )
+        has_open_questions = any(
+            q["type"] == "open" for q in selected_survey.get("questions", [])
+        )
 
-            if not csi_responses.empty:
+        # CSI-результаты читаются из предрассчитанных агрегатов csi_stats, а если
+        # их нет — считаются конвейером агрегации на стороне MongoDB
+        csi_stats = get_csi_stats(selected_survey_id)
+        if csi_stats:
+            stats_df = pd.DataFrame(csi_stats).set_index("question")
+            stats_df["mean"] = stats_df["sum"] / stats_df["count"]
+            # Выборочное стандартное отклонение, как у pandas std
+            variance = (
+                stats_df["sum_sq"] - stats_df["sum"] ** 2 / stats_df["count"]
+            ) / (stats_df["count"] - 1)
+            stats_df["std"] = np.sqrt(variance.clip(lower=0))
+            histogram = Counter()
+            for stats in csi_stats:
+                histogram.update(
+                    {int(answer): n for answer, n in stats.get("hist", {}).items()}
+                )
+        else:
+            csi_results = get_csi_results(selected_survey_id)
+            stats_df = pd.DataFrame(
+                csi_results["questions"], columns=["question", "mean", "std", "count"]
+            ).set_index("question")
+            histogram = csi_results["histogram"]
+
+        if not stats_df.empty or has_open_questions:
+            if not stats_df.empty:
                 st.write("Результаты CSI вопросов")
                 # Аналитика CSI
-                csi_responses["answer"] = csi_responses["answer"].astype(int)
-                csi_stats = csi_responses.groupby("question")["answer"].agg(
-                    ["mean", "std", "count"]
-                )
-                st.table(csi_stats)
+                st.table(stats_df[["mean", "std", "count"]])
 
                 # Гистограмма распределения
                 st.write("Распределение ответов")
+                buckets = sorted(histogram.items(), key=lambda item: str(item[0]))
                 fig, ax = plt.subplots()
-                csi_responses["answer"].hist(bins=5, ax=ax)
+                ax.bar([str(answer) for answer, _ in buckets], [n for _, n in buckets])
                 st.pyplot(fig)
 
-            if not open_responses.empty:
+            # Результаты открытых вопросов загружаются, только если панель открыта
+            show_open = has_open_questions and st.checkbox(
+                "Показать результаты открытых вопросов"
+            )
+            if show_open:
                 st.write("Результаты открытых вопросов")
-                # Обработка текста
-                nltk.download("punkt")
-                nltk.download("stopwords")
-                stop_words = set(stopwords.words("russian"))
-                morph = pymorphy2.MorphAnalyzer()
-                all_text = " ".join(open_responses["answer"])
-                tokens = word_tokenize(all_text.lower())
-                tokens = [
-                    morph.parse(word)[0].normal_form
-                    for word in tokens
-                    if word.isalpha() and word not in stop_words
-                ]
-                word_counts = Counter(tokens)
-                top_words = word_counts.most_common(10)
-                st.write("Топ 10 слов:")
-                for word, count in top_words:
-                    st.write(f"{word}: {count}")
-
-                # Облако слов
-                st.write("Облако слов:")
-                wordcloud = WordCloud(width=800, height=400).generate_from_frequencies(
-                    word_counts
-                )
-                fig, ax = plt.subplots(figsize=(15, 7.5))
-                ax.imshow(wordcloud, interpolation="bilinear")
-                ax.axis("off")
-                st.pyplot(fig)
-
-                # Сентимент анализ
-                nltk.download("vader_lexicon")
-                sia = SentimentIntensityAnalyzer()
-                open_responses["sentiment"] = open_responses["answer"].apply(
-                    lambda x: sia.polarity_scores(x)["compound"]
-                )
-                st.write("Сентимент анализ:")
-                st.bar_chart(open_responses["sentiment"])
+                # Ответы заранее обработаны text_analytics.py: частоты слов
+                # берутся из term_counts, тональность — из поля nlp ответов
+                top_terms = get_top_terms(selected_survey_id, limit=200)
+                sentiments = list(iter_open_answer_sentiments(selected_survey_id))
+                pending = sum(sentiment is None for sentiment in sentiments)
+                sentiments = [value for value in sentiments if value is not None]
+                if pending:
+                    st.info(f"Ещё не обработано ответов: {pending}")
+
+                if sentiments:
+                    st.write("Топ 10 слов:")
+                    for term in top_terms[:10]:
+                        st.write(f"{term['term']}: {term['count']}")
+
+                    # Облако слов
+                    if top_terms:
+                        st.write("Облако слов:")
+                        wordcloud = WordCloud(
+                            width=800, height=400
+                        ).generate_from_frequencies(
+                            {term["term"]: term["count"] for term in top_terms}
+                        )
+                        fig, ax = plt.subplots(figsize=(15, 7.5))
+                        ax.imshow(wordcloud, interpolation="bilinear")
+                        ax.axis("off")
+                        st.pyplot(fig)
+
+                    # Сентимент анализ
+                    st.write("Сентимент анализ:")
+                    st.bar_chart(pd.Series(sentiments, name="sentiment"))
+                elif not pending:
+                    st.write("Нет ответов на открытые вопросы.")
 
         else:
             st.write("Нет ответов для этого опроса.")
 
 with tabs[2]:
     st.header("Планирование опросов")
-    users = get_all_users()
-    user_options = {
-        f"{u.get('first_name', '')} {u.get('last_name', '')} (ID: {u['user_id']})": u[
-            "user_id"
-        ]
-        for u in users
-    }
     statuses = get_user_statuses()
     status_options = [status["name"] for status in statuses]
     selection_type = st.radio("Выберите тип назначения", ["Пользователь", "Статус"])
 
+    status_level = False
     if selection_type == "Пользователь":
-        selected_user = st.selectbox(
-            "Выберите пользователя",
-            list(user_options.keys()),
-            key="Выберите пользователя",
-        )
-        selected_user_id = user_options[selected_user]
-        target_ids = [selected_user_id]
+        selected_user_id = select_user("Выберите пользователя")
     else:
         selected_status = st.selectbox(
             "Выберите статус", status_options, key="Выберите статус"
         )
-        users_with_status = get_users_by_status(selected_status)
-        target_ids = [user["user_id"] for user in users_with_status]
+        status_level = st.checkbox(
+            "Одно расписание на статус (пользователи определяются в момент отправки)",
+            value=True,
+        )
 
     surveys = get_survey_templates()
     survey_options = {
@@ -289,34 +334,90 @@ with tabs[2]:
 
     frequency = st.selectbox(
         "Частота отправки",
-        ["Ежедневно", "Еженедельно", "Ежемесячно"],
+        recurrence.FREQUENCIES,
         key="Частота отправки1",
     )
+    cron = None
+    if frequency == recurrence.CRON:
+        cron = st.text_input(
+            "Cron-выражение (минута час день месяц день_недели)", "0 9 * * 1"
+        )
     start_date = st.date_input("Дата начала", datetime.date.today())
+    send_time = st.time_input("Время отправки", datetime.time(9, 0))
+    timezone = st.text_input("Часовой пояс", DEFAULT_TIMEZONE)
+    catch_up = st.radio(
+        "Если отправка пропущена (бот был недоступен)",
+        recurrence.CATCH_UP_POLICIES,
+        format_func=lambda policy: {
+            recurrence.COALESCE: "Отправить один раз",
+            recurrence.SKIP: "Пропустить",
+        }[policy],
+    )
 
     if st.button("Запланировать опрос"):
         schedule_data = {
             "frequency": frequency,
-            "start_date": datetime.datetime.combine(
-                start_date, datetime.datetime.min.time()
-            ),
+            "start_date": datetime.datetime.combine(start_date, send_time),
+            "timezone": timezone,
+            "catch_up": catch_up,
         }
-        for user_id in target_ids:
-            schedule_survey(user_id, selected_survey_id, schedule_data)
-        st.success("Опрос успешно запланирован")
+        if cron:
+            schedule_data["cron"] = cron
+        try:
+            recurrence.validate(schedule_data)
+        except (ValueError, KeyError) as e:
+            st.error(f"Некорректное расписание: {e}")
+        else:
+            if status_level:
+                if schedule_survey_for_status(
+                    selected_status, selected_survey_id, schedule_data
+                ):
+                    st.success("Опрос успешно запланирован для статуса")
+                else:
+                    st.info("У статуса уже есть расписание этого опроса")
+            else:
+                if selection_type == "Статус":
+                    target_ids = get_user_ids_by_status(selected_status)
+                elif selected_user_id is not None:
+                    target_ids = [selected_user_id]
+                else:
+                    target_ids = []
+                if not target_ids:
+                    st.warning("Не выбраны пользователи для опроса")
+                else:
+                    # Расписания вставляются пачками, прогресс обновляется после каждой
+                    progress = st.progress(0.0)
+                    result = {"inserted": 0, "skipped": 0}
+                    for result in iter_schedule_survey_for_users(
+                        target_ids, selected_survey_id, schedule_data
+                    ):
+                        done = result["inserted"] + result["skipped"]
+                        progress.progress(
+                            done / len(target_ids),
+                            text=f"Обработано {done} из {len(target_ids)}",
+                        )
+                    st.success(
+                        f"Опрос успешно запланирован. Добавлено расписаний: "
+                        f"{result['inserted']}, пропущено (уже есть): {result['skipped']}"
+                    )
 
     # Визуализация запланированных опросов
     st.subheader("Запланированные опросы")
-    scheduled_surveys = get_scheduled_surveys()
-    if scheduled_surveys:
-        scheduled_df = pd.DataFrame(scheduled_surveys)
-        scheduled_df["survey_title"] = scheduled_df["survey_template_id"].apply(
-            lambda x: get_survey_title(str(x))
+    scheduled_count = count_scheduled_surveys()
+    if scheduled_count:
+        scheduled_page_size = 50
+        scheduled_page_count = -(-scheduled_count // scheduled_page_size)
+        scheduled_page = st.number_input(
+            f"Страница (всего {scheduled_page_count}, расписаний {scheduled_count})",
+            min_value=1,
+            max_value=scheduled_page_count,
+            value=1,
+            key="scheduled_page",
         )
-        scheduled_df["user"] = scheduled_df["user_id"].apply(
-            lambda x: get_user_full_name(x)
+        scheduled_df = pd.DataFrame(
+            get_scheduled_surveys_page(scheduled_page - 1, scheduled_page_size)
         )
-        st.table(scheduled_df[["user", "survey_title", "schedule"]])
+        st.table(scheduled_df[["user", "survey_title", "schedule", "next_run"]])
     else:
         st.write("Нет запланированных опросов")
 
@@ -350,8 +451,14 @@ with tabs[3]:
     selected_survey_id = survey_options[selected_survey]
 
     if st.button("Назначить опрос статусу"):
-        assign_survey_to_status(selected_status, selected_survey_id)
-        st.success("Опрос назначен статусу")
+        result = assign_survey_to_status(selected_status, selected_survey_id)
+        if result is None:
+            st.info("Опрос уже назначен этому статусу")
+        else:
+            st.success(
+                f"Опрос назначен статусу. Назначено пользователям: {result['inserted']}, "
+                f"пропущено (уже назначен): {result['skipped']}"
+            )
 
     st.subheader("Опросы для статуса")
     selected_status = st.selectbox(
@@ -364,3 +471,22 @@ with tabs[3]:
             st.write(f"- {survey.get('title', '')}")
     else:
         st.write("Нет назначенных опросов для этого статуса")
+
+# Время выполнения скрипта: первый запуск сессии против повторных rerun
+rerun_timings = st.session_state.setdefault("rerun_timings", [])
+rerun_timings.append(time.perf_counter() - rerun_started)
+with st.sidebar.expander("Производительность"):
+    st.write(f"Последний запуск: {rerun_timings[-1] * 1000:.0f} мс")
+    st.write(f"Первый запуск сессии: {rerun_timings[0] * 1000:.0f} мс")
+    if len(rerun_timings) > 1:
+        st.write(
+            f"Повторные запуски (медиана): "
+            f"{statistics.median(rerun_timings[1:]) * 1000:.0f} мс"
+        )
+
+# Попадания в кэш и среднее время запросов панели с начала работы процесса
+with st.sidebar.expander("Кэш запросов"):
+    cache_df = pd.DataFrame(
+        query_stats(), columns=["query", "calls", "hit_rate", "avg_ms"]
+    )
+    st.table(cache_df.set_index("query"))
@@ -0,0 +1,68 @@
+# conftest.py
+
+# Общие настройки тестов.
+# Тесты с базой работают с mongod, заданным теми же переменными окружения, что
+# и бот, но всегда в отдельной базе TEST_MONGODB_DB_NAME (по умолчанию
+# tgbot_test), которая очищается перед каждым тестом. Если mongod недоступен,
+# используется mongomock (pip install mongomock), а тесты, которым нужен
+# настоящий сервер (планы запросов, arrayFilters), пропускаются.
+
+import os
+
+import pymongo
+import pytest
+from dotenv import load_dotenv
+
+load_dotenv()
+os.environ["MONGODB_DB_NAME"] = os.getenv("TEST_MONGODB_DB_NAME", "tgbot_test")
+for name, value in {
+    "MONGO_INITDB_ROOT_USERNAME": "root",
+    "MONGO_INITDB_ROOT_PASSWORD": "example",
+    "MONGO_HOST": "localhost",
+    "MONGO_INITDB_ROOT_PORT": "27017",
+    "TELEGRAM_BOT_TOKEN": "123456:test",
+}.items():
+    os.environ.setdefault(name, value)
+
+from config import MONGODB_URI  # noqa: E402
+
+
+def _mongod_available():
+    try:
+        pymongo.MongoClient(MONGODB_URI, serverSelectionTimeoutMS=500).server_info()
+    except Exception:
+        return False
+    return True
+
+
+MONGOD = _mongod_available()
+mongomock = None
+if not MONGOD:
+    try:
+        import mongomock
+    except ImportError:
+        pass
+    else:
+        # db.py подключается при импорте, поэтому клиент подменяется до него
+        pymongo.MongoClient = mongomock.MongoClient
+
+
+@pytest.fixture
+def database():
+    if not MONGOD and mongomock is None:
+        pytest.skip("нужен mongod или mongomock")
+    import db
+    import migrations
+
+    for name in db.db.list_collection_names():
+        db.db.drop_collection(name)
+    db.template_cache.invalidate()
+    migrations.ensure_indexes()
+    return db
+
+
+@pytest.fixture
+def mongod(database):
+    if not MONGOD:
+        pytest.skip("нужен запущенный mongod")
+    return database
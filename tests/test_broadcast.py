@@ -0,0 +1,148 @@
+import asyncio
+import datetime
+import time
+
+from telegram.error import RetryAfter, TimedOut
+
+import broadcast
+
+
+def _elapsed(coroutine):
+    started = time.monotonic()
+    asyncio.run(coroutine)
+    return time.monotonic() - started
+
+
+def test_token_bucket_limits_rate_after_burst():
+    async def send(bucket, count):
+        for _ in range(count):
+            await bucket.acquire()
+
+    # 10 токенов доступны сразу, ещё 20 — со скоростью 100 в секунду
+    bucket = broadcast.TokenBucket(rate=100, capacity=10)
+    elapsed = _elapsed(send(bucket, 30))
+    assert 0.18 <= elapsed < 0.5
+
+
+def test_token_bucket_pause_stops_sending():
+    async def send_after_pause():
+        bucket = broadcast.TokenBucket(rate=1000)
+        await bucket.acquire()
+        bucket.pause(0.2)
+        bucket.pause(0.05)  # более короткая пауза не сокращает текущую
+        await bucket.acquire()
+
+    assert _elapsed(send_after_pause()) >= 0.2
+
+
+def test_chat_limiter_spaces_messages_to_one_chat():
+    async def send():
+        limiter = broadcast.ChatLimiter(0.1)
+        await limiter.acquire(1)
+        await limiter.acquire(2)
+        await limiter.acquire(1)
+        await limiter.acquire(1)
+
+    elapsed = _elapsed(send())
+    assert 0.2 <= elapsed < 0.4
+
+
+def test_expired_claim_cannot_send_or_mark(database):
+    database.enqueue_messages([1], "Привет", "test")
+    now = datetime.datetime.utcnow()
+    # Аренда первого процесса истекла, сообщение захватил второй
+    (first,) = database.claim_outbox_messages(now, 10, lease_seconds=0)
+    (second,) = database.claim_outbox_messages(now, 10, lease_seconds=60)
+    assert first["claim_id"] != second["claim_id"]
+
+    lease = now + datetime.timedelta(seconds=60)
+    assert database.extend_outbox_lease([first["_id"]], [first["claim_id"]], lease) == 0
+    assert not database.mark_message_sent(first["_id"], first["claim_id"])
+    assert database.mark_message_sent(second["_id"], second["claim_id"])
+    assert database.outbox_collection.find_one()["status"] == "sent"
+
+
+def test_sender_lock_has_one_owner(database):
+    assert database.acquire_lock("sender", "a", 60)
+    assert not database.acquire_lock("sender", "b", 60)
+    assert database.acquire_lock("sender", "a", 60)
+    database.release_lock("sender", "a")
+    assert database.acquire_lock("sender", "b", 60)
+
+
+class FakeBot:
+    def __init__(self, retry_after_chats=(), timed_out_chats=()):
+        self.sent = []
+        self.retry_after_chats = set(retry_after_chats)
+        self.timed_out_chats = set(timed_out_chats)
+
+    async def send_message(self, chat_id, text):
+        if chat_id in self.retry_after_chats:
+            self.retry_after_chats.discard(chat_id)
+            raise RetryAfter(0.1)
+        self.sent.append(chat_id)
+        # Сообщение доставлено, но ответ Telegram не дошёл до бота
+        if chat_id in self.timed_out_chats:
+            raise TimedOut()
+
+
+def _statuses(database):
+    return {
+        message["chat_id"]: message["status"]
+        for message in database.outbox_collection.find()
+    }
+
+
+def test_only_one_replica_sends_and_each_message_once(database):
+    chat_ids = list(range(30))
+    database.enqueue_messages(chat_ids, "Новый опрос", "test")
+    bots = [FakeBot(retry_after_chats=[5]), FakeBot()]
+
+    async def run():
+        broadcasters = [
+            broadcast.Broadcaster(
+                bot, rate=1000, per_chat_interval=0, concurrency=2, poll_seconds=0.05
+            )
+            for bot in bots
+        ]
+        for broadcaster in broadcasters:
+            await broadcaster.start()
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            if set(_statuses(database).values()) == {"sent"}:
+                break
+            await asyncio.sleep(0.05)
+        for broadcaster in broadcasters:
+            await broadcaster.stop()
+
+    asyncio.run(run())
+    assert set(_statuses(database).values()) == {"sent"}
+    assert sorted(bots[0].sent + bots[1].sent) == chat_ids
+    # Вторая реплика не отправляла: роль отправителя у первой
+    assert bots[1].sent == []
+
+
+def test_timed_out_message_is_not_sent_again(database):
+    database.enqueue_messages([1, 2], "Новый опрос", "test")
+    bot = FakeBot(timed_out_chats=[1])
+
+    async def run():
+        broadcaster = broadcast.Broadcaster(
+            bot, rate=1000, per_chat_interval=0, poll_seconds=0.05
+        )
+        await broadcaster.start()
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            if "pending" not in _statuses(database).values():
+                break
+            await asyncio.sleep(0.05)
+        # Ещё несколько циклов опроса очереди: повторной отправки быть не должно
+        await asyncio.sleep(0.3)
+        await broadcaster.stop()
+
+    asyncio.run(run())
+    assert _statuses(database) == {1: "failed", 2: "sent"}
+    assert sorted(bot.sent) == [1, 2]
+    message = database.outbox_collection.find_one({"chat_id": 1})
+    assert message["attempts"] == 1
+    assert "next_attempt_at" not in message
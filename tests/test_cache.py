@@ -0,0 +1,118 @@
+from bson import ObjectId
+
+from cache import TemplateCache
+
+
+class Templates:
+    # Шаблоны «в базе» и счётчики запросов к ней
+    def __init__(self, count):
+        self.templates = {
+            ObjectId(): {"title": f"Опрос {i}", "version": 1} for i in range(count)
+        }
+        self.loads = []
+        self.version_loads = []
+
+    def load(self, keys):
+        self.loads.append(list(keys))
+        return [
+            {"_id": key, **self.templates[key]} for key in keys if key in self.templates
+        ]
+
+    def load_versions(self, keys):
+        self.version_loads.append(list(keys))
+        return {
+            key: self.templates[key]["version"] for key in keys if key in self.templates
+        }
+
+    def get_many(self, cache, keys):
+        return cache.get_many(keys, self.load, self.load_versions)
+
+
+def test_misses_are_loaded_in_one_query_and_then_hit():
+    templates = Templates(3)
+    keys = list(templates.templates)
+    cache = TemplateCache()
+
+    found = templates.get_many(cache, keys + keys[:1])
+    assert set(found) == set(keys)
+    assert templates.loads == [keys]
+
+    assert templates.get_many(cache, keys) == found
+    assert len(templates.loads) == 1
+    assert cache.stats()["hits"] == 3
+    assert cache.stats()["misses"] == 3
+
+
+def test_lru_evicts_least_recently_used():
+    templates = Templates(3)
+    first, second, third = templates.templates
+    cache = TemplateCache(maxsize=2)
+
+    templates.get_many(cache, [first, second])
+    templates.get_many(cache, [first])
+    templates.get_many(cache, [third])
+    assert cache.stats()["evictions"] == 1
+
+    templates.loads.clear()
+    templates.get_many(cache, [first, second, third])
+    assert templates.loads == [[second]]
+
+
+def test_stale_entry_is_reloaded_only_when_version_changed():
+    templates = Templates(2)
+    changed, unchanged = templates.templates
+    cache = TemplateCache(revalidate_seconds=-1)
+    templates.get_many(cache, [changed, unchanged])
+
+    templates.templates[changed] = {"title": "Новое название", "version": 2}
+    templates.loads.clear()
+    found = templates.get_many(cache, [changed, unchanged])
+    # Сверка — один запрос версий, перечитывается только изменённый шаблон
+    assert templates.version_loads[-1] == [changed, unchanged]
+    assert templates.loads == [[changed]]
+    assert found[changed]["title"] == "Новое название"
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_deleted_template_is_dropped_on_revalidation():
+    templates = Templates(1)
+    (key,) = templates.templates
+    cache = TemplateCache(revalidate_seconds=-1)
+    templates.get_many(cache, [key])
+
+    del templates.templates[key]
+    assert templates.get_many(cache, [key]) == {}
+    assert cache.stats()["size"] == 0
+
+
+def test_fresh_entries_are_not_revalidated():
+    templates = Templates(1)
+    cache = TemplateCache(revalidate_seconds=60)
+    templates.get_many(cache, list(templates.templates))
+    templates.get_many(cache, list(templates.templates))
+    assert templates.version_loads == []
+
+
+def test_update_survey_template_invalidates_cached_template(database):
+    database.create_survey_template({"title": "Опрос", "questions": []})
+    template_id = database.survey_templates_collection.find_one()["_id"]
+    assert database.get_survey_template(template_id)["title"] == "Опрос"
+
+    database.update_survey_template(template_id, {"title": "Новый опрос"})
+    template = database.get_survey_template(str(template_id))
+    assert template["title"] == "Новый опрос"
+    assert template["version"] == 2
+
+
+def test_change_by_other_process_is_seen_after_revalidation(database, monkeypatch):
+    database.create_survey_template({"title": "Опрос", "questions": []})
+    template_id = database.survey_templates_collection.find_one()["_id"]
+    database.get_survey_template(template_id)
+
+    # Другой процесс меняет шаблон в обход кэша этого процесса
+    database.survey_templates_collection.update_one(
+        {"_id": template_id}, {"$set": {"title": "Новый опрос"}, "$inc": {"version": 1}}
+    )
+    assert database.get_survey_template(template_id)["title"] == "Опрос"
+    monkeypatch.setattr(database.template_cache, "revalidate_seconds", -1)
+    assert database.get_survey_template(template_id)["title"] == "Новый опрос"
@@ -0,0 +1,147 @@
+import datetime
+
+import pytest
+from bson import ObjectId
+
+
+def _responses(survey_template_id, answers):
+    assigned_survey_id = ObjectId()
+    return [
+        {
+            "user_id": 1,
+            "assigned_survey_id": assigned_survey_id,
+            "survey_template_id": survey_template_id,
+            "question_index": index,
+            "question": f"Вопрос {index}",
+            "answer": answer,
+            "type": "csi",
+        }
+        for index, answer in enumerate(answers)
+    ]
+
+
+def _stats(db, survey_template_id):
+    return {
+        doc["question"]: (doc["count"], doc["sum"], doc["sum_sq"])
+        for doc in db.get_csi_stats(survey_template_id)
+    }
+
+
+@pytest.fixture(params=["per_question", "per_survey"])
+def storage(request, database):
+    # per_survey отмечает ответы через arrayFilters, которых нет в mongomock
+    if request.param == "per_survey":
+        request.getfixturevalue("mongod")
+    return request.param
+
+
+@pytest.fixture
+def expire_claims(monkeypatch, database):
+    # Прерванные пачки считаются брошенными сразу, а не через COUNT_LEASE
+    def expire():
+        monkeypatch.setattr(database, "COUNT_LEASE", datetime.timedelta(seconds=-1))
+
+    return expire
+
+
+def test_repeated_batch_is_counted_once(database, storage):
+    survey_template_id = ObjectId()
+    batch = _responses(survey_template_id, [5, 3])
+
+    assert len(database.save_responses(batch, storage)) == 2
+    assert database.save_responses(batch, storage) == []
+
+    assert _stats(database, survey_template_id) == {
+        "Вопрос 0": (1, 5, 25),
+        "Вопрос 1": (1, 3, 9),
+    }
+    assert database.check_csi_stats(storage) == []
+    assert "_id" not in batch[0] and "csi_counted" not in batch[0]
+
+
+def test_failure_before_counting_is_recovered_by_retry(database, storage, monkeypatch):
+    survey_template_id = ObjectId()
+    batch = _responses(survey_template_id, [4, 2])
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("сбой после записи ответов")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(database, "_claim_answers", fail)
+        with pytest.raises(RuntimeError):
+            database.save_responses(batch, storage)
+    assert _stats(database, survey_template_id) == {}
+
+    # Повтор пачки (как при повторной записи сегмента spool) не записывает
+    # ответы второй раз, но учитывает записанные ранее
+    assert database.save_responses(batch, storage) == []
+    assert _stats(database, survey_template_id) == {
+        "Вопрос 0": (1, 4, 16),
+        "Вопрос 1": (1, 2, 4),
+    }
+    assert database.check_csi_stats(storage) == []
+
+
+def test_failure_before_inc_is_counted_after_lease(
+    database, storage, monkeypatch, expire_claims
+):
+    survey_template_id = ObjectId()
+    batch = _responses(survey_template_id, [1, 5])
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("сбой до $inc")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(database, "_inc_csi_stats", fail)
+        with pytest.raises(RuntimeError):
+            database.save_responses(batch, storage)
+    assert database.count_csi_answers(storage=storage) == 0
+
+    expire_claims()
+    assert database.count_csi_answers(storage=storage) == 2
+    assert _stats(database, survey_template_id) == {
+        "Вопрос 0": (1, 1, 1),
+        "Вопрос 1": (1, 5, 25),
+    }
+    assert database.check_csi_stats(storage) == []
+
+
+def test_failure_after_inc_is_not_counted_twice(
+    database, storage, monkeypatch, expire_claims
+):
+    survey_template_id = ObjectId()
+    inc_csi_stats = database._inc_csi_stats
+
+    def inc_then_fail(responses, claim_id):
+        inc_csi_stats(responses, claim_id)
+        raise RuntimeError("сбой между $inc и снятием отметки")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(database, "_inc_csi_stats", inc_then_fail)
+        with pytest.raises(RuntimeError):
+            database.save_responses(_responses(survey_template_id, [2, 3]), storage)
+
+    expire_claims()
+    # Брошенная пачка досчитывается с тем же идентификатором, и $inc
+    # второй раз не применяется
+    assert database.count_csi_answers(storage=storage) == 2
+    database.save_responses(_responses(survey_template_id, [4]), storage)
+    assert _stats(database, survey_template_id) == {
+        "Вопрос 0": (2, 6, 20),
+        "Вопрос 1": (1, 3, 9),
+    }
+    assert database.check_csi_stats(storage) == []
+
+
+def test_csi_stats_are_sorted_without_claims(database, storage):
+    survey_template_id = ObjectId()
+    batch = _responses(survey_template_id, [4, 2])
+    # Вопросы записываются в обратном алфавитном порядке
+    batch[0]["question"], batch[1]["question"] = "Скорость", "Качество"
+    database.save_responses(batch, storage)
+
+    csi_stats = database.get_csi_stats(survey_template_id)
+    assert [doc["question"] for doc in csi_stats] == ["Качество", "Скорость"]
+    assert all(
+        set(doc) == {"question", "count", "sum", "sum_sq", "hist"} for doc in csi_stats
+    )
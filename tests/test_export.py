@@ -0,0 +1,63 @@
+import csv
+import datetime
+import time
+
+from bson import ObjectId
+
+import export
+
+
+def _answer(assigned_survey_id, survey_template_id, index, answer, type="open"):
+    return {
+        "user_id": 1,
+        "assigned_survey_id": assigned_survey_id,
+        "survey_template_id": survey_template_id,
+        "question_index": index,
+        "question": f"Вопрос {index}",
+        "answer": answer,
+        "type": type,
+    }
+
+
+def test_per_survey_export_skips_answers_exported_earlier(database):
+    survey_template_id = ObjectId()
+    assigned_survey_id = ObjectId()
+    database.save_responses(
+        [_answer(assigned_survey_id, survey_template_id, 0, 5)], "per_survey"
+    )
+    time.sleep(0.01)
+    watermark = datetime.datetime.utcnow()
+    time.sleep(0.01)
+    # Новый ответ того же опроса обновляет updated_at всего документа
+    database.save_responses(
+        [_answer(assigned_survey_id, survey_template_id, 1, 4)], "per_survey"
+    )
+
+    exported = list(
+        database.iter_survey_responses(since=watermark, storage="per_survey")
+    )
+    assert [row["question_index"] for row in exported] == [1]
+    assert exported[0]["recorded_at"] >= watermark
+
+    earlier = list(
+        database.iter_survey_responses(until=watermark, storage="per_survey")
+    )
+    assert [row["question_index"] for row in earlier] == [0]
+
+
+def test_export_writes_csv(database, tmp_path):
+    survey_template_id = ObjectId()
+    assigned_survey_id = ObjectId()
+    database.save_responses(
+        [
+            _answer(assigned_survey_id, survey_template_id, index, answer, "csi")
+            for index, answer in enumerate([1, 2, 3])
+        ]
+    )
+    path = tmp_path / "responses.csv"
+
+    assert export.export_responses(str(path), "csv", batch_size=2) == 3
+    with open(path, encoding="utf-8") as output:
+        rows = list(csv.DictReader(output))
+    assert [row["answer"] for row in rows] == ["1", "2", "3"]
+    assert rows[0]["survey_template_id"] == str(survey_template_id)
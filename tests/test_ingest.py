@@ -0,0 +1,123 @@
+import asyncio
+import os
+
+import pytest
+from bson import ObjectId, json_util
+from pymongo.errors import ConnectionFailure
+
+import ingest
+
+
+def _responses(count, survey_template_id=None):
+    assigned_survey_id = ObjectId()
+    return [
+        {
+            "user_id": 1,
+            "assigned_survey_id": assigned_survey_id,
+            "survey_template_id": survey_template_id or ObjectId(),
+            "question_index": index,
+            "question": f"Вопрос {index}",
+            "answer": f"Ответ {index}",
+            "type": "open",
+        }
+        for index in range(count)
+    ]
+
+
+@pytest.fixture(autouse=True)
+def _quiet(caplog):
+    caplog.set_level("CRITICAL", logger="ingest")
+
+
+def _segments(path):
+    return sorted(name for name in os.listdir(path) if name.endswith(".jsonl"))
+
+
+def test_spool_is_recovered_after_crash(database, tmp_path, monkeypatch):
+    async def unavailable(responses):
+        raise ConnectionFailure("MongoDB недоступна")
+
+    async def crash():
+        ingestor = ingest.ResponseIngestor(str(tmp_path), flush_interval=60)
+        await ingestor.start()
+        for response in _responses(3):
+            await ingestor.submit(response)
+        await ingestor.flush()
+        return ingestor
+
+    with monkeypatch.context() as patch:
+        patch.setattr(ingest, "save_responses", unavailable)
+        # Процесс «падает» без stop: сегмент остаётся на диске
+        crashed = asyncio.run(crash())
+    crashed._writer.shutdown()
+    # Пачка, не записанная в MongoDB, и текущий сегмент
+    segments = _segments(tmp_path)
+    assert len(segments) == 2
+    with open(tmp_path / segments[-1], "a", encoding="utf-8") as output:
+        output.write('{"user_id": 1, "answ')  # недописанная строка
+
+    async def restart():
+        ingestor = ingest.ResponseIngestor(str(tmp_path), flush_interval=60)
+        await ingestor.start()
+        await ingestor.stop()
+
+    asyncio.run(restart())
+    assert database.responses_collection.count_documents({}) == 3
+    assert _segments(tmp_path) == []
+
+
+def test_concurrent_answers_share_one_fsync(database, tmp_path, monkeypatch):
+    fsyncs = []
+    fsync = os.fsync
+
+    def counting_fsync(fd):
+        fsyncs.append(fd)
+        fsync(fd)
+
+    monkeypatch.setattr(ingest.os, "fsync", counting_fsync)
+
+    async def run():
+        ingestor = ingest.ResponseIngestor(str(tmp_path), flush_interval=60)
+        await ingestor.start()
+        await asyncio.gather(*(ingestor.submit(r) for r in _responses(50)))
+        await ingestor.stop()
+        return ingestor
+
+    ingestor = asyncio.run(run())
+    assert len(fsyncs) < 50
+    assert sum(ingestor.group_size.counts) == len(fsyncs)
+    assert database.responses_collection.count_documents({}) == 50
+
+
+def test_failing_batch_is_quarantined(database, tmp_path, monkeypatch):
+    save_responses = ingest.save_responses
+
+    async def reject_bad(responses):
+        if any(response["answer"] == "bad" for response in responses):
+            raise ValueError("неверный ответ")
+        return await save_responses(responses)
+
+    monkeypatch.setattr(ingest, "save_responses", reject_bad)
+    responses = _responses(3)
+    responses[1]["answer"] = "bad"
+
+    async def run():
+        ingestor = ingest.ResponseIngestor(
+            str(tmp_path), flush_interval=60, max_attempts=3
+        )
+        await ingestor.start()
+        for response in responses:
+            await ingestor.submit(response)
+        for _ in range(3):
+            await ingestor.flush()
+        # Следующие пачки не ждут пачку с ошибкой
+        await ingestor.submit(_responses(1)[0])
+        await ingestor.stop()
+        return ingestor
+
+    ingestor = asyncio.run(run())
+    assert ingestor.stats()["unflushed_batches"] == 0
+    assert database.responses_collection.count_documents({}) == 3
+    (quarantined,) = os.listdir(tmp_path / "quarantine")
+    with open(tmp_path / "quarantine" / quarantined, encoding="utf-8") as segment:
+        assert [json_util.loads(line)["answer"] for line in segment] == ["bad"]
@@ -0,0 +1,32 @@
+from pymongo import ASCENDING
+
+import migrations
+
+
+def test_hot_queries_use_indexes(mongod):
+    results = migrations.explain_hot_queries()
+    assert len(results) == len(migrations.HOT_QUERIES)
+    collscans = [
+        (item["collection"], item["query"]) for item in results if item["collscan"]
+    ]
+    assert collscans == []
+
+
+def test_ensure_indexes_is_idempotent(database):
+    report = migrations.ensure_indexes()
+    assert {item["state"] for item in report} == {"exists"}
+    assert len(report) == len(migrations.INDEXES)
+
+
+def test_obsolete_index_is_dropped_after_replacement(database):
+    users = database.db["users"]
+    users.create_index([("status", ASCENDING)], name="status")
+
+    report = migrations.ensure_indexes()
+    assert {
+        "collection": "users",
+        "index": "status",
+        "state": "dropped (заменён status_user_id)",
+        "serves": [],
+    } in report
+    assert "status" not in users.index_information()
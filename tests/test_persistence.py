@@ -0,0 +1,78 @@
+import asyncio
+
+from persistence import MongoPersistence
+
+
+def _replicas(database):
+    # Две реплики бота с общей коллекцией состояния
+    return [MongoPersistence(database.persistence_collection) for _ in range(2)]
+
+
+def test_refresh_loads_data_written_by_other_replica(database):
+    async def run():
+        first, second = _replicas(database)
+        await first.get_user_data()
+        await second.get_user_data()
+        first_data, second_data = {}, {}
+
+        await first.update_user_data(1, {"step": "name"})
+        await first.flush()
+        await second.refresh_user_data(1, second_data)
+        assert second_data == {"step": "name"}
+
+        second_data["step"] = "survey"
+        await second.update_user_data(1, dict(second_data))
+        await second.flush()
+        first_data.update({"step": "name", "stale": True})
+        await first.refresh_user_data(1, first_data)
+        assert first_data == {"step": "survey"}
+
+        # Без новых записей документ не перечитывается
+        first_data["local"] = True
+        await first.refresh_user_data(1, first_data)
+        assert first_data["local"]
+
+    asyncio.run(run())
+
+
+def test_stale_write_does_not_overwrite_newer_version(database):
+    async def run():
+        first, second = _replicas(database)
+        await first.update_user_data(1, {"step": "name"})
+        await first.flush()
+        await second.get_user_data()
+
+        await second.update_user_data(1, {"step": "survey"})
+        await second.flush()
+        # Первая реплика не видела записи второй: её запись отклоняется
+        await first.update_user_data(1, {"step": "stale"})
+        await first.flush()
+        assert first.conflicts == 1
+        assert database.persistence_collection.find_one()["data"] == {"step": "survey"}
+
+        user_data = {"step": "stale"}
+        await first.refresh_user_data(1, user_data)
+        assert user_data == {"step": "survey"}
+        await first.update_user_data(1, {"step": "done"})
+        await first.flush()
+        document = database.persistence_collection.find_one()
+        assert document["data"] == {"step": "done"}
+        assert document["version"] == 3
+
+    asyncio.run(run())
+
+
+def test_documents_without_version_are_replaced(database):
+    database.persistence_collection.insert_one(
+        {"_id": "user_data:1", "kind": "user_data", "key": 1, "data": {"old": 1}}
+    )
+
+    async def run():
+        persistence = MongoPersistence(database.persistence_collection)
+        assert await persistence.get_user_data() == {1: {"old": 1}}
+        await persistence.update_user_data(1, {"new": 1})
+        await persistence.flush()
+        assert persistence.conflicts == 0
+
+    asyncio.run(run())
+    assert database.persistence_collection.find_one()["version"] == 1
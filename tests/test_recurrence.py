@@ -0,0 +1,138 @@
+import datetime
+
+import pytest
+
+import recurrence
+
+dt = datetime.datetime
+BERLIN = "Europe/Berlin"
+
+
+def _schedule(frequency, start, timezone="UTC", **extra):
+    return {"frequency": frequency, "start_date": start, "timezone": timezone, **extra}
+
+
+def _runs(schedule_data, count):
+    runs = [recurrence.first_run(schedule_data)]
+    while len(runs) < count:
+        runs.append(recurrence.next_run_after(schedule_data, runs[-1]))
+    return runs
+
+
+def test_monthly_clamps_to_month_end_without_drift():
+    schedule_data = _schedule(recurrence.MONTHLY, dt(2024, 1, 31, 9))
+    assert _runs(schedule_data, 5) == [
+        dt(2024, 1, 31, 9),
+        dt(2024, 2, 29, 9),
+        dt(2024, 3, 31, 9),
+        dt(2024, 4, 30, 9),
+        dt(2024, 5, 31, 9),
+    ]
+    # Невисокосный год и переход через декабрь
+    schedule_data = _schedule(recurrence.MONTHLY, dt(2022, 12, 31, 9))
+    assert _runs(schedule_data, 3)[1:] == [dt(2023, 1, 31, 9), dt(2023, 2, 28, 9)]
+
+
+def test_daily_keeps_local_time_across_dst():
+    # В Берлине 31.03.2024 часы переводятся вперёд, 27.10.2024 — назад
+    schedule_data = _schedule(recurrence.DAILY, dt(2024, 3, 30, 9), BERLIN)
+    assert _runs(schedule_data, 2) == [dt(2024, 3, 30, 8), dt(2024, 3, 31, 7)]
+    schedule_data = _schedule(recurrence.WEEKLY, dt(2024, 10, 21, 9), BERLIN)
+    assert _runs(schedule_data, 2) == [dt(2024, 10, 21, 7), dt(2024, 10, 28, 8)]
+
+
+def test_cron_keeps_local_time_across_dst():
+    schedule_data = _schedule(
+        recurrence.CRON, dt(2024, 3, 30), BERLIN, cron="0 9 * * *"
+    )
+    assert _runs(schedule_data, 2) == [dt(2024, 3, 30, 8), dt(2024, 3, 31, 7)]
+
+
+@pytest.mark.parametrize("day_of_week", ["0", "7", "sun"])
+def test_cron_sunday_is_zero_or_seven(day_of_week):
+    # 01.06.2024 — суббота
+    schedule_data = _schedule(
+        recurrence.CRON, dt(2024, 6, 1), cron=f"0 9 * * {day_of_week}"
+    )
+    assert recurrence.first_run(schedule_data) == dt(2024, 6, 2, 9)
+
+
+def test_cron_weekday_range_is_monday_to_friday():
+    schedule_data = _schedule(recurrence.CRON, dt(2024, 6, 1), cron="0 9 * * 1-5")
+    runs = _runs(schedule_data, 6)
+    assert [run.strftime("%a") for run in runs] == [
+        "Mon",
+        "Tue",
+        "Wed",
+        "Thu",
+        "Fri",
+        "Mon",
+    ]
+    assert runs[0] == dt(2024, 6, 3, 9)
+
+
+@pytest.mark.parametrize(
+    "day_of_week, days",
+    [
+        ("1-5/2", ["Mon", "Wed", "Fri", "Mon"]),
+        ("*/3", ["Wed", "Sat", "Sun", "Wed"]),
+        ("0-2", ["Mon", "Tue", "Sun", "Mon"]),
+        ("5-7", ["Fri", "Sat", "Sun", "Fri"]),
+        ("mon,thu", ["Mon", "Thu", "Mon", "Thu"]),
+    ],
+)
+def test_cron_day_of_week_steps_and_ranges(day_of_week, days):
+    # Шаг после диапазона — шаг, а не номер дня; */3 — вс, ср, сб
+    schedule_data = _schedule(
+        recurrence.CRON, dt(2024, 6, 3), cron=f"0 9 * * {day_of_week}"
+    )
+    runs = _runs(schedule_data, len(days))
+    assert [run.strftime("%a") for run in runs] == days
+
+
+def test_next_run_after_downtime_is_single_next_occurrence():
+    schedule_data = _schedule(recurrence.DAILY, dt(2024, 1, 1, 9))
+    # После недели простоя следующий запуск — ближайший, а не пропущенные
+    assert recurrence.next_run_after(schedule_data, dt(2024, 1, 8, 12)) == dt(
+        2024, 1, 9, 9
+    )
+    assert recurrence.next_run_after(schedule_data, dt(2024, 1, 9, 9)) == dt(
+        2024, 1, 10, 9
+    )
+
+
+@pytest.mark.parametrize(
+    "catch_up, late, fire",
+    [
+        (recurrence.COALESCE, datetime.timedelta(days=3), True),
+        (recurrence.SKIP, datetime.timedelta(minutes=30), True),
+        (recurrence.SKIP, datetime.timedelta(hours=2), False),
+    ],
+)
+def test_catch_up_policy(catch_up, late, fire):
+    schedule_data = _schedule(recurrence.DAILY, dt(2024, 1, 1, 9), catch_up=catch_up)
+    scheduled_run = dt(2024, 1, 5, 9)
+    grace = datetime.timedelta(hours=1)
+    assert (
+        recurrence.should_fire(
+            schedule_data, scheduled_run, scheduled_run + late, grace
+        )
+        is fire
+    )
+
+
+@pytest.mark.parametrize(
+    "schedule_data",
+    [
+        {"frequency": "Ежечасно"},
+        {"frequency": recurrence.DAILY, "catch_up": "all"},
+        {"frequency": recurrence.CRON, "cron": "0 9 * *"},
+        {"frequency": recurrence.CRON, "cron": "0 25 * * *"},
+        {"frequency": recurrence.CRON, "cron": "0 9 * * 8"},
+        {"frequency": recurrence.CRON, "cron": "0 9 * * 5-1"},
+        {"frequency": recurrence.DAILY, "timezone": "Europe/Nowhere"},
+    ],
+)
+def test_validate_rejects_invalid_schedule(schedule_data):
+    with pytest.raises(Exception):
+        recurrence.validate(schedule_data)
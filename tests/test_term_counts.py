@@ -0,0 +1,76 @@
+import datetime
+
+import pytest
+from bson import ObjectId
+
+
+def _open_answers(database, survey_template_id, texts):
+    assigned_survey_id = ObjectId()
+    database.save_responses(
+        [
+            {
+                "user_id": 1,
+                "assigned_survey_id": assigned_survey_id,
+                "survey_template_id": survey_template_id,
+                "question_index": index,
+                "question": f"Вопрос {index}",
+                "answer": text,
+                "type": "open",
+            }
+            for index, text in enumerate(texts)
+        ]
+    )
+    return database.get_unprocessed_open_answers(100)
+
+
+def _analysis(lemmas):
+    return {
+        "tokens": lemmas,
+        "lemmas": lemmas,
+        "sentiment": 0.0,
+        "processed_at": datetime.datetime.utcnow(),
+    }
+
+
+def _terms(database, survey_template_id):
+    return {
+        doc["term"]: doc["count"]
+        for doc in database.get_top_terms(str(survey_template_id), limit=100)
+    }
+
+
+def test_analyses_are_counted_once(database):
+    survey_template_id = ObjectId()
+    answers = _open_answers(database, survey_template_id, ["быстро", "быстро"])
+    items = [
+        (answers[0], _analysis(["быстрый", "доставка"])),
+        (answers[1], _analysis(["быстрый"])),
+    ]
+
+    assert database.save_answer_analyses(items) == 2
+    assert database.save_answer_analyses(items) == 0
+
+    assert _terms(database, survey_template_id) == {"быстрый": 2, "доставка": 1}
+    assert database.get_unprocessed_open_answers(100) == []
+
+
+def test_failure_after_saving_analyses_is_recovered(database, monkeypatch):
+    survey_template_id = ObjectId()
+    answers = _open_answers(database, survey_template_id, ["долго"])
+    items = [(answers[0], _analysis(["долго", "ждать"]))]
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("сбой до $inc")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(database, "_inc_term_counts", fail)
+        with pytest.raises(RuntimeError):
+            database.save_answer_analyses(items)
+    assert _terms(database, survey_template_id) == {}
+    # Ответ уже обработан и повторно анализироваться не будет
+    assert database.get_unprocessed_open_answers(100) == []
+
+    monkeypatch.setattr(database, "COUNT_LEASE", datetime.timedelta(seconds=-1))
+    assert database.count_term_answers() == 1
+    assert database.count_term_answers() == 0
+    assert _terms(database, survey_template_id) == {"долго": 1, "ждать": 1}
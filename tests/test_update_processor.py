@@ -0,0 +1,122 @@
+import asyncio
+import datetime
+import random
+
+from telegram import Chat, Message, Update, User
+
+from update_processor import PerUserUpdateProcessor
+
+
+def _update(update_id, user_id):
+    return Update(
+        update_id,
+        message=Message(
+            update_id,
+            datetime.datetime.now(datetime.timezone.utc),
+            Chat(user_id, Chat.PRIVATE),
+            from_user=User(user_id, "Тест", False),
+            text="ответ",
+        ),
+    )
+
+
+class Handler:
+    # Запоминает порядок обработки и число одновременно обрабатываемых
+    # обновлений каждого пользователя
+    def __init__(self):
+        self.log = []
+        self.active = {}
+        self.max_active = {}
+
+    async def __call__(self, user_id, number, delay, fail=False):
+        self.active[user_id] = self.active.get(user_id, 0) + 1
+        self.max_active[user_id] = max(
+            self.max_active.get(user_id, 0), self.active[user_id]
+        )
+        try:
+            await asyncio.sleep(delay)
+            if fail:
+                raise RuntimeError("ошибка обработчика")
+            self.log.append((user_id, number))
+        finally:
+            self.active[user_id] -= 1
+
+
+def test_updates_of_one_user_are_processed_in_order():
+    handler = Handler()
+
+    async def run():
+        processor = PerUserUpdateProcessor(8)
+        await asyncio.gather(
+            *(
+                processor.process_update(
+                    _update(number, user_id),
+                    handler(user_id, number, random.uniform(0, 0.01)),
+                )
+                for number in range(20)
+                for user_id in (1, 2, 3)
+            )
+        )
+
+    asyncio.run(run())
+    for user_id in (1, 2, 3):
+        numbers = [number for user, number in handler.log if user == user_id]
+        assert numbers == list(range(20))
+        assert handler.max_active[user_id] == 1
+
+
+def test_different_users_are_processed_concurrently():
+    handler = Handler()
+
+    async def run():
+        processor = PerUserUpdateProcessor(8)
+        started = asyncio.get_running_loop().time()
+        await asyncio.gather(
+            *(
+                processor.process_update(
+                    _update(user_id, user_id), handler(user_id, 0, 0.1)
+                )
+                for user_id in range(8)
+            )
+        )
+        return asyncio.get_running_loop().time() - started
+
+    assert asyncio.run(run()) < 0.3
+    assert len(handler.log) == 8
+
+
+def test_error_does_not_stop_user_queue(caplog):
+    handler = Handler()
+
+    async def run():
+        processor = PerUserUpdateProcessor(4)
+        await asyncio.gather(
+            processor.process_update(_update(1, 1), handler(1, 1, 0.01, fail=True)),
+            processor.process_update(_update(2, 1), handler(1, 2, 0)),
+        )
+        return processor._queues
+
+    assert asyncio.run(run()) == {}
+    assert handler.log == [(1, 2)]
+    assert "Ошибка при обработке обновления" in caplog.text
+
+
+def test_queued_updates_do_not_hold_concurrency_slots():
+    handler = Handler()
+
+    async def run():
+        processor = PerUserUpdateProcessor(2)
+        busy = [
+            processor.process_update(_update(number, 1), handler(1, number, 0.05))
+            for number in range(5)
+        ]
+        other = processor.process_update(_update(10, 2), handler(2, 0, 0))
+        tasks = [asyncio.create_task(coroutine) for coroutine in busy]
+        await asyncio.sleep(0)
+        await other
+        # Второй пользователь обработан, пока очередь первого ещё не разобрана
+        assert handler.log == [(2, 0)]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert [number for user, number in handler.log if user == 1] == list(range(5))
@@ -0,0 +1,93 @@
+# text_analytics.py
+
+# Инкрементальный анализ открытых ответов.
+# Каждый новый открытый ответ обрабатывается один раз: токены, нормальные формы
+# слов без стоп-слов и оценка тональности сохраняются в поле nlp рядом с
+# ответом, а частоты слов по опросу копятся в term_counts через $inc.
+# Панель администратора читает только эти предрассчитанные данные.
+# Запуск: python text_analytics.py [--loop]
+
+import argparse
+import datetime
+import logging
+import time
+
+from nltk.tokenize import word_tokenize
+
+import db
+import nlp
+from config import TEXT_ANALYTICS_BATCH_SIZE, TEXT_ANALYTICS_POLL_SECONDS
+
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+def analyze_answers(answers):
+    # Нормальные формы всех слов пачки получаются одним вызовом лемматизатора
+    stop_words = nlp.load_stop_words()
+    lemmatizer = nlp.load_lemmatizer()
+    sia = nlp.load_sentiment_analyzer()
+    texts = [str(answer["answer"] or "") for answer in answers]
+    tokens = [
+        [word for word in word_tokenize(text.lower()) if word.isalpha()]
+        for text in texts
+    ]
+    words = [[word for word in item if word not in stop_words] for item in tokens]
+    lemmas = iter(lemmatizer.lemmatize_many([word for item in words for word in item]))
+    processed_at = datetime.datetime.utcnow()
+    return [
+        {
+            "tokens": item_tokens,
+            "lemmas": [next(lemmas) for _ in item_words],
+            "sentiment": sia.polarity_scores(text)["compound"],
+            "processed_at": processed_at,
+        }
+        for text, item_tokens, item_words in zip(texts, tokens, words)
+    ]
+
+
+def process_batch(batch_size):
+    answers = db.get_unprocessed_open_answers(batch_size)
+    if not answers:
+        return 0
+    started = time.monotonic()
+    analyses = analyze_answers(answers)
+    saved = db.save_answer_analyses(list(zip(answers, analyses)))
+    lemma_stats = nlp.load_lemmatizer().stats()
+    logger.info(
+        f"Обработано ответов: {saved} из {len(answers)} "
+        f"за {time.monotonic() - started:.2f} сек.; лемматизатор: "
+        f"{lemma_stats['tokens_per_second']:.0f} слов/сек., "
+        f"попадания в кэш {lemma_stats['hit_rate']:.0%}"
+    )
+    return len(answers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Анализ открытых ответов SurveyBot")
+    parser.add_argument(
+        "--loop",
+        action="store_true",
+        help="работать постоянно, проверяя новые ответы",
+    )
+    parser.add_argument("--batch-size", type=int, default=TEXT_ANALYTICS_BATCH_SIZE)
+    args = parser.parse_args()
+
+    while True:
+        try:
+            processed = process_batch(args.batch_size)
+        except Exception:
+            if not args.loop:
+                raise
+            logger.exception("Ошибка при анализе ответов, повтор позже")
+            processed = 0
+        if processed < args.batch_size:
+            if not args.loop:
+                break
+            time.sleep(TEXT_ANALYTICS_POLL_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# update_processor.py
+
+import collections
+import logging
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    # Обновления разных пользователей обрабатываются параллельно, а обновления
+    # одного пользователя — строго по очереди, в порядке поступления.
+    # Пока у пользователя идёт обработка, его новые обновления только добавляются
+    # в очередь и не занимают слоты max_concurrent_updates.
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._queues = {}
+
+    @staticmethod
+    def _key(update):
+        if isinstance(update, Update):
+            if update.effective_user:
+                return ("user", update.effective_user.id)
+            if update.effective_chat:
+                return ("chat", update.effective_chat.id)
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._key(update)
+        if key is None:
+            await coroutine
+            return
+
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append(coroutine)
+            return
+
+        queue = self._queues[key] = collections.deque([coroutine])
+        try:
+            while queue:
+                try:
+                    await queue[0]
+                except Exception:
+                    logger.exception(f"Ошибка при обработке обновления {key}")
+                finally:
+                    queue.popleft()
+        finally:
+            del self._queues[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass